@@ -1,12 +1,16 @@
+from collections import deque
 from typing import Tuple
 import numpy as np
 from mesa import Agent, Model
-from mesa.space import MultiGrid
-import path_planning.Grid as path_env
-from path_planning.Astar import astar
+from occupancy import OccupancyGrid
+from path_planning.FastAstar import get_graph
+from path_planning.Reservation import cooperative_astar
 
 
-def contains_agent(grid: MultiGrid, pos: Tuple[int, int]):
+def contains_agent(grid: OccupancyGrid, pos: Tuple[int, int]):
+    # Static obstacles count as occupied
+    if grid.is_blocked(pos):
+        return True
     objs = grid.iter_cell_list_contents(pos)
     return any(map(lambda obj: issubclass(type(obj), Agent), objs))
 
@@ -20,7 +24,47 @@ class Warehouse:
         self.name = f"Warehouse {pos}"
 
 
+def reserved_move(agent, can_move=None):
+    # Follow the agent's reserved cells, replanning with windowed cooperative A* when they run low.
+    # can_move(t) says whether the agent may leave its cell during tick t.
+    model = agent.model
+    t = model.schedule.steps
+    window = model.reservation_window
+    table = model.reservations
+    if agent.plan is None or agent.plan_target is not agent.target or len(agent.plan) <= window // 2 \
+            or agent in table.bumped:
+        table.release(agent, t)
+        plan = cooperative_astar(
+            get_graph(model.obstacle_matrix),
+            agent.pos,
+            agent.target.pos,
+            model.distance_fields.get(agent.target.pos).distance.ravel(),
+            table,
+            agent,
+            t,
+            window,
+            can_move,
+            stats=model.instrumentation.counters if model.instrumentation is not None else None
+        )
+        table.reserve_path(agent, agent.pos, plan, t, hold=window // 2)
+        agent.plan = deque(plan)
+        agent.plan_target = agent.target
+
+    if agent.plan:
+        cell = agent.plan.popleft()
+        if cell == agent.pos:
+            return
+        # A vehicle that could not keep its own reservation may still be parked there, wait and replan
+        if any(isinstance(obj, (Car, Truck)) for obj in model.grid.iter_cell_list_contents(cell)):
+            agent.plan = None
+            return
+        model.grid.move_agent(agent, cell)
+
+
 class Car(Agent):
+    # Cells moved per tick
+    speed = 1
+
     def __init__(self,
                  unique_id: int,
                  pos: Tuple[int, int],
@@ -32,6 +76,8 @@ class Car(Agent):
         self.max_load = 1
         self.target = None
         self.pathing = None
+        self.plan = None
+        self.plan_target = None
         self.is_resupplying = False
 
     def step(self):
@@ -40,29 +86,34 @@ class Car(Agent):
                 self.target = self.model.find_closest_warehouse(self.pos)
                 self.is_resupplying = True
             else:
-                # Assign target
-                self.target = self.model.allocation[self]
-                self.target.assign(self)
-
-            self.pathing = astar(
-                path_env.Grid(self.model.obstacle_matrix),
-                self.pos,
-                self.target.pos
-            )[1:]
-
-        if self.model.collision:
-            new_pos = self.pathing[0]
-            if contains_agent(self.model.grid, new_pos):
-                neighbor = self.model.grid.get_neighborhood(self.pos, moore=False)
-                neighbor = list(filter(lambda pos: not contains_agent(self.model.grid, pos), neighbor))
-                if self.model.random.randint(0, 1) == 1 or len(neighbor) == 0:
+                # Assign target, waiting in place while there is no open job to take
+                self.target = self.model.allocation.get(self)
+                if self.target is None:
                     return
-                else:
-                    divert = self.model.random.choice(neighbor)
-                    self.pathing = [divert, self.pos] + self.pathing
+                self.target.assign(self)
 
-        self.model.grid.move_agent(self, self.pathing[0])
-        self.pathing = self.pathing[1:]
+            # Reserved moves plan their own cells with cooperative A*
+            if self.model.reservations is None:
+                self.pathing = self.model.plan_path(self.pos, self.target.pos)[1:]
+
+        if self.model.reservations is not None:
+            reserved_move(self)
+        else:
+            # An empty path means the target shares the current cell, so there is nothing to move
+            if self.model.collision and self.pathing:
+                new_pos = self.pathing[0]
+                if contains_agent(self.model.grid, new_pos):
+                    neighbor = self.model.grid.get_neighborhood(self.pos, moore=False)
+                    neighbor = list(filter(lambda pos: not contains_agent(self.model.grid, pos), neighbor))
+                    if self.model.random.randint(0, 1) == 1 or len(neighbor) == 0:
+                        return
+                    else:
+                        divert = self.model.random.choice(neighbor)
+                        self.pathing = [divert, self.pos] + self.pathing
+
+            if self.pathing:
+                self.model.grid.move_agent(self, self.pathing[0])
+                self.pathing = self.pathing[1:]
 
         if self.pos == self.target.pos:
             if type(self.target) is Warehouse:
@@ -79,6 +130,9 @@ class Car(Agent):
 
 
 class Truck(Agent):
+    # Trucks move on every other tick, see is_waiting
+    speed = 0.5
+
     def __init__(self,
                  unique_id: int,
                  pos: np.ndarray,
@@ -90,6 +144,8 @@ class Truck(Agent):
         self.max_load = 3
         self.target = None
         self.pathing = None
+        self.plan = None
+        self.plan_target = None
         self.is_waiting = True
         self.is_resupplying = False
 
@@ -99,34 +155,45 @@ class Truck(Agent):
                 self.target = self.model.find_closest_warehouse(self.pos)
                 self.is_resupplying = True
             else:
-                # Assign target
-                self.target = self.model.allocation[self]
+                # Assign target, waiting in place while there is no open job to take
+                self.target = self.model.allocation.get(self)
+                if self.target is None:
+                    self.is_waiting = not self.is_waiting
+                    return
                 self.target.assign(self)
 
-            self.pathing = astar(
-                path_env.Grid(self.model.obstacle_matrix),
-                self.pos,
-                self.target.pos
-            )[1:]
+            # Reserved moves plan their own cells with cooperative A*
+            if self.model.reservations is None:
+                self.pathing = self.model.plan_path(self.pos, self.target.pos)[1:]
 
         self.is_waiting = not self.is_waiting
 
-        if self.is_waiting:
-            return
-
-        if self.model.collision:
-            new_pos = self.pathing[0]
-            if contains_agent(self.model.grid, new_pos):
-                neighbor = self.model.grid.get_neighborhood(self.pos, moore=False)
-                neighbor = list(filter(lambda pos: not contains_agent(self.model.grid, pos), neighbor))
-                if self.model.random.randint(0, 1) == 1 or len(neighbor) == 0:
-                    return
-                else:
-                    divert = self.model.random.choice(neighbor)
-                    self.pathing = [divert, self.pos] + self.pathing
-
-        self.model.grid.move_agent(self, self.pathing[0])
-        self.pathing = self.pathing[1:]
+        if self.model.reservations is not None:
+            # Reservations cover waiting ticks too, so the plan is followed on every tick
+            t = self.model.schedule.steps
+            moving = not self.is_waiting
+            reserved_move(self, lambda tick: ((tick - t) % 2 == 0) == moving)
+            if self.is_waiting:
+                return
+        else:
+            if self.is_waiting:
+                return
+
+            # An empty path means the target shares the current cell, so there is nothing to move
+            if self.model.collision and self.pathing:
+                new_pos = self.pathing[0]
+                if contains_agent(self.model.grid, new_pos):
+                    neighbor = self.model.grid.get_neighborhood(self.pos, moore=False)
+                    neighbor = list(filter(lambda pos: not contains_agent(self.model.grid, pos), neighbor))
+                    if self.model.random.randint(0, 1) == 1 or len(neighbor) == 0:
+                        return
+                    else:
+                        divert = self.model.random.choice(neighbor)
+                        self.pathing = [divert, self.pos] + self.pathing
+
+            if self.pathing:
+                self.model.grid.move_agent(self, self.pathing[0])
+                self.pathing = self.pathing[1:]
 
         if self.pos == self.target.pos:
             if type(self.target) is Warehouse:
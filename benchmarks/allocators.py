@@ -0,0 +1,75 @@
+"""
+Time AuctionAllocation against HungarianMethod and report its optimality gap.
+
+The gap is measured against the exact dense solution of the same job slots. HungarianMethod's own
+allocation is also reported; when there are fewer jobs than agents its cloned columns are approximate,
+so it can come out worse than the auction.
+
+Run from the repository root with: python -m benchmarks.allocators
+"""
+import argparse
+import random
+import time
+from mesa import Model
+from agents import Car, Truck
+from model import Job
+from scipy.optimize import linear_sum_assignment
+from task_allocation import AuctionAllocation, HungarianMethod
+from task_allocation.auction import allocation_cost
+from task_allocation.hungarian_method import generate_matrix, job_slots
+
+SCENARIOS = [
+    # agents, jobs, map size
+    (50, 50, 32),
+    (200, 300, 64),
+    (1000, 1000, 256),
+    (2000, 1500, 512),
+]
+
+
+def scenario(agents, jobs, size, seed, split=0.4):
+    rnd = random.Random(seed)
+    model = Model()
+    fleet = []
+    for a in range(agents):
+        pos = (rnd.randrange(size), rnd.randrange(size))
+        agent = Truck(a, pos, model) if a < split * agents else Car(a, pos, model)
+        agent.curr_load = rnd.randint(0, agent.max_load)
+        fleet.append(agent)
+    open_jobs = [
+        Job((rnd.randrange(size), rnd.randrange(size)), rnd.randint(1, 9), rnd.randint(1, 3), model)
+        for _ in range(jobs)
+    ]
+    return rnd, fleet, open_jobs
+
+
+def timed(allocator, rnd, agents, jobs, **kwargs):
+    start = time.perf_counter()
+    allocation = allocator(rnd, agents, jobs, **kwargs).get_allocation()
+    return time.perf_counter() - start, allocation_cost(allocation)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--epsilon", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'agents':>6} | {'jobs':>5} | {'k':>3} | {'hungarian':>10} | {'auction':>10} | "
+          f"{'gap':>8} | hungarian gap")
+    for agents, jobs, size in SCENARIOS:
+        rnd, fleet, open_jobs = scenario(agents, jobs, size, args.seed)
+        matrix = generate_matrix(fleet, job_slots(fleet, open_jobs))
+        optimal = matrix[linear_sum_assignment(matrix)].sum()
+        hungarian_time, hungarian_cost = timed(HungarianMethod, rnd, fleet, open_jobs)
+        hungarian_gap = (hungarian_cost - optimal) / optimal
+        for k in args.k:
+            auction_time, cost = timed(AuctionAllocation, rnd, fleet, open_jobs, k=k, epsilon=args.epsilon)
+            gap = (cost - optimal) / optimal
+            print(f"{agents:>6} | {jobs:>5} | {k:>3} | {hungarian_time:>9.3f}s | {auction_time:>9.3f}s | "
+                  f"{gap:>+8.2%} | {hungarian_gap:+.2%}")
+
+
+if __name__ == "__main__":
+    main()
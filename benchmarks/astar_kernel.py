@@ -0,0 +1,63 @@
+"""
+Compare path_planning.Astar against the flat-index heapq kernel in path_planning.FastAstar.
+
+Run from the repository root with: python -m benchmarks.astar_kernel
+"""
+import argparse
+import random
+import time
+import numpy as np
+import path_planning.Astar as reference
+import path_planning.FastAstar as fast
+from path_planning.Grid import Grid
+from model import generate_map
+
+
+def random_map(size, density, seed):
+    rng = np.random.default_rng(seed)
+    return rng.random((size, size)) < density
+
+
+def sample_queries(grid, queries, seed):
+    rnd = random.Random(seed)
+    free = [(int(i), int(j)) for i, j in zip(*np.where(~grid))]
+    return [(rnd.choice(free), rnd.choice(free)) for _ in range(queries)]
+
+
+def time_queries(fn, env, queries):
+    results = []
+    start = time.perf_counter()
+    for s, g in queries:
+        results.append(fn(env, s, g))
+    return time.perf_counter() - start, results
+
+
+def run(name, grid, queries):
+    env = Grid(grid)
+    # The adjacency table is built once per obstacle matrix, keep it out of the per-query timings
+    build_start = time.perf_counter()
+    fast.get_graph(grid)
+    build = time.perf_counter() - build_start
+    ref_time, ref_paths = time_queries(reference.astar, env, queries)
+    fast_time, fast_paths = time_queries(fast.astar, env, queries)
+    assert ref_paths == fast_paths, "kernel returned different paths"
+    print(f"{name:>10} | {len(queries):>7} | {ref_time:>9.3f}s | {fast_time:>9.3f}s | "
+          f"{ref_time / fast_time:>6.1f}x | {build:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--large-queries", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'map':>10} | {'queries':>7} | {'astar':>10} | {'kernel':>10} | {'speed':>7} | build")
+    small = generate_map("maps/random-32-32-20.map")
+    run("32x32", small, sample_queries(small, args.queries, args.seed))
+    large = random_map(512, 0.2, args.seed)
+    run("512x512", large, sample_queries(large, args.large_queries, args.seed))
+
+
+if __name__ == "__main__":
+    main()
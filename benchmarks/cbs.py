@@ -0,0 +1,87 @@
+"""
+Compare the original cbs against icbs on random instances of the 32x32 map.
+
+Every instance gets the same time limit; the table reports how many instances each solver finished
+and how many it solved per second of total time spent. Two 8x8 maps where agents have to swap
+places in a corridor follow, which icbs hands to cbs once its time limit runs out.
+
+Run from the repository root with: python -m benchmarks.cbs
+"""
+import argparse
+import random
+import signal
+import time
+import numpy as np
+from path_planning.CBS import cbs, icbs, find_conflict
+from path_planning.Grid import Grid
+from model import generate_map
+
+
+# 8x8 maps at 20% density, "@" blocked, with one set of five agents that meet in a dead-end corridor
+CORRIDOR_MAPS = [
+    [".......@", ".......@", "@..@....", ".....@..", "........", ".....@.@", ".@..@.@.", "........"],
+    [".......@", "........", "........", "....@@..", "..@...@.", "...@.@.@", "@..@..@.", "...@@..."],
+]
+CORRIDOR_STARTS = [(6, 7), (7, 6), (5, 4), (0, 4), (0, 2)]
+CORRIDOR_GOALS = [(2, 7), (7, 5), (6, 5), (2, 5), (4, 1)]
+
+
+class Timeout(Exception):
+    pass
+
+
+def _alarm(signum, frame):
+    raise Timeout()
+
+
+def solve(solver, env, starts, goals, limit):
+    signal.signal(signal.SIGALRM, _alarm)
+    signal.setitimer(signal.ITIMER_REAL, limit)
+    start = time.perf_counter()
+    try:
+        solution = solver(env, starts, goals)
+    except Timeout:
+        solution = None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    elapsed = time.perf_counter() - start
+    solved = solution is not None and find_conflict(solution) is None
+    return solved, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agents", type=int, nargs="+", default=[2, 4, 6, 8, 10, 12])
+    parser.add_argument("--instances", type=int, default=10)
+    parser.add_argument("--limit", type=float, default=10.0, help="seconds per instance")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    grid = generate_map("maps/random-32-32-20.map")
+    env = Grid(grid)
+    free = [(int(i), int(j)) for i, j in zip(*np.where(~grid))]
+    rnd = random.Random(args.seed)
+    np.random.seed(args.seed)
+
+    print(f"{'agents':>6} | {'cbs solved':>10} | {'cbs /s':>7} | {'icbs solved':>11} | {'icbs /s':>7}")
+    for agents in args.agents:
+        instances = [rnd.sample(free, 2 * agents) for _ in range(args.instances)]
+        row = []
+        for solver in (cbs, icbs):
+            solved, elapsed = 0, 0.0
+            for cells in instances:
+                ok, t = solve(solver, env, cells[:agents], cells[agents:], args.limit)
+                solved += ok
+                elapsed += t
+            row += [solved, solved / elapsed]
+        print(f"{agents:>6} | {row[0]:>10} | {row[1]:>7.2f} | {row[2]:>11} | {row[3]:>7.2f}")
+
+    print(f"\n{'corridor':>8} | {'cbs':>14} | {'icbs':>14}")
+    for k, rows in enumerate(CORRIDOR_MAPS):
+        env = Grid(np.array([[cell == "@" for cell in row] for row in rows]))
+        row = [solve(solver, env, CORRIDOR_STARTS, CORRIDOR_GOALS, args.limit) for solver in (cbs, icbs)]
+        print(f"{k:>8} | " + " | ".join(f"{'solved' if ok else 'failed':>6} {t:>6.2f}s" for ok, t in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compare HPA* against flat A* for single path queries on large maps.
+
+Flat A* is the heapq kernel in path_planning.FastAstar, which returns the same paths as
+path_planning.Astar. For HPA* the first move is timed separately from the whole path, since a
+vehicle only needs the first cluster of its path refined to start moving. Suboptimality is the
+length of the HPA* path over the optimal length, for queries whose goal can be reached.
+
+Run from the repository root with: python -m benchmarks.hpa [--sizes 256 1024] [--density 0.2]
+"""
+import argparse
+import random
+import time
+import numpy as np
+import path_planning.FastAstar as flat
+from path_planning.HPAStar import HPAStar
+
+
+def random_map(size, density, seed):
+    rng = np.random.default_rng(seed)
+    return rng.random((size, size)) < density
+
+
+def sample_queries(grid, queries, seed):
+    rnd = random.Random(seed)
+    free = [(int(i), int(j)) for i, j in zip(*np.where(~grid))]
+    return [(rnd.choice(free), rnd.choice(free)) for _ in range(queries)]
+
+
+def run(name, grid, queries, cluster_size):
+    build_start = time.perf_counter()
+    hpa = HPAStar(grid, cluster_size=cluster_size)
+    build = time.perf_counter() - build_start
+    # The flat kernel's adjacency table is also built once per map
+    flat.get_graph(grid)
+
+    flat_time = first_time = hpa_time = 0
+    ratios = []
+    for start, goal in queries:
+        t = time.perf_counter()
+        optimal = flat.astar(grid, start, goal)
+        flat_time += time.perf_counter() - t
+
+        t = time.perf_counter()
+        path = hpa.path(start, goal)
+        path[min(1, len(path) - 1)]
+        first_time += time.perf_counter() - t
+        cells = list(path)
+        hpa_time += time.perf_counter() - t
+
+        if optimal[-1] == goal and len(optimal) > 1:
+            ratios.append((len(cells) - 1) / (len(optimal) - 1))
+
+    n = len(queries)
+    print(f"{name:>10} | {cluster_size:>7} | {build:>7.2f}s | {flat_time / n * 1e3:>8.1f}ms | "
+          f"{first_time / n * 1e3:>8.1f}ms | {hpa_time / n * 1e3:>8.1f}ms | "
+          f"{np.mean(ratios):>6.3f} | {np.max(ratios):>6.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--density", type=float, default=0.2)
+    parser.add_argument("--cluster-sizes", type=int, nargs="+", default=[16])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'map':>10} | {'cluster':>7} | {'build':>8} | {'astar':>10} | {'hpa first':>10} | "
+          f"{'hpa path':>10} | {'mean':>6} | {'worst':>6}")
+    for size in args.sizes:
+        grid = random_map(size, args.density, args.seed)
+        queries = sample_queries(grid, args.queries, args.seed)
+        for cluster_size in args.cluster_sizes:
+            run(f"{size}x{size}", grid, queries, cluster_size)
+
+
+if __name__ == "__main__":
+    main()
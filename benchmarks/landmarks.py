@@ -0,0 +1,110 @@
+"""
+Compare node expansions of path_planning.Astar with the Manhattan heuristic against the ALT landmark
+heuristic in path_planning.Landmarks, on the bundled 32x32 map and on generated mazes.
+
+Landmark selection and the distance tables are a per-map cost and are reported separately from the
+queries. Both heuristics are admissible, so the path costs must match.
+
+Run from the repository root with: python -m benchmarks.landmarks [--mazes 65 129] [--landmarks 4 8 16]
+"""
+import argparse
+import random
+import time
+import numpy as np
+from path_planning.Astar import astar
+from path_planning.Grid import Grid
+from path_planning.Landmarks import LandmarkGrid
+from model import generate_map
+
+
+class CountingGrid(Grid):
+    def __init__(self, grid):
+        super().__init__(grid)
+        self.expansions = 0
+
+    def next(self, node, t):
+        self.expansions += 1
+        return super().next(node, t)
+
+
+class CountingLandmarkGrid(LandmarkGrid):
+    def __init__(self, grid, landmarks):
+        super().__init__(grid, landmarks=landmarks)
+        self.expansions = 0
+
+    def next(self, node, t):
+        self.expansions += 1
+        return super().next(node, t)
+
+
+def maze(size, seed, loops=0.05):
+    # Depth-first maze on the odd cells of a size x size grid, with a fraction of the remaining
+    # walls knocked out so there is more than one route between most cells
+    rnd = random.Random(seed)
+    grid = np.ones((size, size), dtype=bool)
+    stack = [(1, 1)]
+    grid[1, 1] = False
+    while stack:
+        r, c = stack[-1]
+        options = [(r + dr, c + dc, dr, dc) for dr, dc in [(2, 0), (-2, 0), (0, 2), (0, -2)]
+                   if 0 < r + dr < size - 1 and 0 < c + dc < size - 1 and grid[r + dr, c + dc]]
+        if not options:
+            stack.pop()
+            continue
+        nr, nc, dr, dc = rnd.choice(options)
+        grid[r + dr // 2, c + dc // 2] = False
+        grid[nr, nc] = False
+        stack.append((nr, nc))
+    walls = [(r, c) for r in range(1, size - 1) for c in range(1, size - 1)
+             if grid[r, c] and (r % 2) != (c % 2)]
+    for r, c in rnd.sample(walls, int(loops * len(walls))):
+        grid[r, c] = False
+    return grid
+
+
+def sample_queries(grid, queries, seed):
+    rnd = random.Random(seed)
+    free = [(int(i), int(j)) for i, j in zip(*np.where(~grid))]
+    return [(rnd.choice(free), rnd.choice(free)) for _ in range(queries)]
+
+
+def run_queries(env, queries):
+    start = time.perf_counter()
+    costs = [astar(env, s, g, return_cost=True)[1] for s, g in queries]
+    return time.perf_counter() - start, costs
+
+
+def run(name, grid, queries, landmark_counts):
+    env = CountingGrid(grid)
+    wall_time, optimal = run_queries(env, queries)
+    n = len(queries)
+    print(f"{name:>14} | {'manhattan':>9} | {'':>7} | {'':>9} | {wall_time / n * 1e3:>8.1f}ms | "
+          f"{env.expansions / n:>10.0f}")
+    for k in landmark_counts:
+        build_start = time.perf_counter()
+        env = CountingLandmarkGrid(grid, k)
+        build = time.perf_counter() - build_start
+        wall_time, costs = run_queries(env, queries)
+        assert costs == optimal, "landmark heuristic changed a path cost"
+        print(f"{name:>14} | {f'alt-{k}':>9} | {build:>6.2f}s | {env.nbytes / 2 ** 10:>7.1f}KB | "
+              f"{wall_time / n * 1e3:>8.1f}ms | {env.expansions / n:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--map", default="maps/random-32-32-20.map")
+    parser.add_argument("--mazes", type=int, nargs="+", default=[65, 129])
+    parser.add_argument("--landmarks", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'map':>14} | {'heuristic':>9} | {'build':>7} | {'memory':>9} | {'per query':>10} | {'expansions':>10}")
+    grids = [(args.map.split("/")[-1].replace(".map", ""), generate_map(args.map))]
+    grids += [(f"maze-{size}", maze(size, args.seed)) for size in args.mazes]
+    for name, grid in grids:
+        run(name, grid, sample_queries(grid, args.queries, args.seed), args.landmarks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare replanning after road closures: a D* Lite search repaired in place against rerunning it
+from scratch and against a full A* search, and a distance field patched by
+DistanceFieldCache.update against rebuilding it.
+
+Each query plans a path, moves the vehicle a third of the way along it and closes a few cells
+further ahead on the path, then opens them again. All planners are exact, so the new path lengths
+must match. A closure on the path cuts the goal's shortest path tree, so the field is dropped and
+rebuilt, while reopening the cells is patched in place.
+
+Run from the repository root with: python -m benchmarks.replanning [--sizes 256 1024] [--closures 3]
+"""
+import argparse
+import time
+import numpy as np
+import path_planning.FastAstar as flat
+from path_planning.DStarLite import DStarLite
+from path_planning.DistanceField import DistanceField, DistanceFieldCache
+from benchmarks.hpa import random_map, sample_queries
+
+
+def close_ahead(grid, path, closures):
+    # Vehicle position a third of the way along path and the cells closed in front of it
+    here = len(path) // 3
+    ahead = path[here + 1:-1]
+    picks = np.linspace(0, len(ahead) - 1, closures + 2)[1:-1].astype(int) if len(ahead) > closures else []
+    cells = [ahead[i] for i in picks]
+    closed = grid.copy()
+    for cell in cells:
+        closed[cell] = True
+    return path[here], cells, closed
+
+
+def run(size, density, queries, closures, seed):
+    grid = random_map(size, density, seed)
+    flat.get_graph(grid)
+    totals = dict.fromkeys(["initial", "repair", "astar", "rebuild", "patch", "reopen"], 0.0)
+    expanded = {"initial": 0, "repair": 0}
+    patched = reopened = n = 0
+    for start, goal in sample_queries(grid, queries, seed):
+        t = time.perf_counter()
+        search = DStarLite(grid, goal)
+        search.move(start)
+        search.compute()
+        path = search.path()
+        totals["initial"] += time.perf_counter() - t
+        expanded["initial"] += search.expanded
+        if path is None or len(path) < 3 * (closures + 2):
+            continue
+        here, cells, closed = close_ahead(grid, path, closures)
+        flat.get_graph(closed)
+        n += 1
+
+        before = search.expanded
+        t = time.perf_counter()
+        search.move(here)
+        search.update(closed, cells)
+        search.compute()
+        repaired = search.path()
+        totals["repair"] += time.perf_counter() - t
+        expanded["repair"] += search.expanded - before
+
+        t = time.perf_counter()
+        searched = flat.astar(closed, here, goal)
+        totals["astar"] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        rebuilt = DistanceField(closed, goal).path(here)
+        totals["rebuild"] += time.perf_counter() - t
+
+        fields = DistanceFieldCache(grid)
+        fields.get(goal)
+        t = time.perf_counter()
+        fields.update(closed, cells)
+        patched_path = fields.path(here, goal)
+        totals["patch"] += time.perf_counter() - t
+        patched += fields.invalidated == 0
+
+        lengths = {len(p) if p is not None else None for p in (repaired, searched, rebuilt, patched_path)}
+        assert len(lengths) == 1, f"replanned paths differ in length: {lengths}"
+
+        invalidated = fields.invalidated
+        t = time.perf_counter()
+        fields.update(grid, cells)
+        reopened_path = fields.path(here, goal)
+        totals["reopen"] += time.perf_counter() - t
+        reopened += fields.invalidated == invalidated
+        assert len(reopened_path) == len(DistanceField(grid, goal).path(here)), "reopened field is not exact"
+
+    per = max(n, 1)
+    print(f"{size:>5} | {'d* lite initial':>16} | {totals['initial'] / queries * 1e3:>8.2f}ms | "
+          f"{expanded['initial'] / queries:>10.0f}")
+    print(f"{size:>5} | {'d* lite repair':>16} | {totals['repair'] / per * 1e3:>8.2f}ms | {expanded['repair'] / per:>10.0f}")
+    print(f"{size:>5} | {'a* re-search':>16} | {totals['astar'] / per * 1e3:>8.2f}ms | {'':>10}")
+    print(f"{size:>5} | {'field rebuild':>16} | {totals['rebuild'] / per * 1e3:>8.2f}ms | {'':>10}")
+    print(f"{size:>5} | {'field update':>16} | {totals['patch'] / per * 1e3:>8.2f}ms | "
+          f"{f'{patched}/{n} patched':>10}")
+    print(f"{size:>5} | {'field reopen':>16} | {totals['reopen'] / per * 1e3:>8.2f}ms | "
+          f"{f'{reopened}/{n} patched':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--density", type=float, default=0.2)
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--closures", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'size':>5} | {'planner':>16} | {'per query':>10} | {'expansions':>10}")
+    for size in args.sizes:
+        run(size, args.density, args.queries, args.closures, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Reproducible benchmark suite for the planners, allocators, map loading and full model stepping.
+
+Each case records wall time, peak traced memory and, for the planners, node expansions. Model cases
+record the mean time per DeliveryModel.step and how many distance fields were built. Results are
+written as JSON; passing a previous results file with --baseline prints the change for every case.
+
+Run from the repository root with: python -m benchmarks [--preset quick|full] [--output f] [--baseline f]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from mesa import Model
+from agents import Car, Truck
+from map_io import load_map, read_map, write_map
+from model import DeliveryModel, Job
+from path_planning.Astar import astar, stay, astar_multi
+from path_planning.CBS import cbs, icbs
+from path_planning.Grid import Grid
+from path_planning.HPAStar import HPAStar
+from path_planning.JPS import JumpPointSearch, JPSPlus
+from path_planning.Landmarks import LandmarkGrid
+from task_allocation import HungarianMethod, RandomAllocation
+from task_allocation.hungarian_method import generate_matrix
+
+PRESETS = {
+    "quick": {
+        "map_sizes": [32, 64],
+        "densities": [0.2],
+        "fleets": [5, 50],
+        "queries": 20,
+        "model_steps": 20,
+    },
+    "full": {
+        "map_sizes": [32, 128, 512, 1024],
+        "densities": [0.1, 0.2, 0.3],
+        "fleets": [5, 50, 500, 5000],
+        "queries": 50,
+        "model_steps": 50,
+    },
+}
+
+
+class CountingGrid(Grid):
+    # Every call to next() is one node expansion in the Astar searches
+    def __init__(self, grid):
+        super().__init__(grid)
+        self.expansions = 0
+
+    def next(self, node, t):
+        self.expansions += 1
+        return super().next(node, t)
+
+
+class CountingLandmarkGrid(LandmarkGrid):
+    # CountingGrid with the ALT landmark heuristic
+    def __init__(self, grid):
+        super().__init__(grid)
+        self.expansions = 0
+
+    def next(self, node, t):
+        self.expansions += 1
+        return super().next(node, t)
+
+
+def random_map(size, density, seed):
+    rng = np.random.default_rng(seed)
+    return rng.random((size, size)) < density
+
+
+def free_cells(grid):
+    return [(int(i), int(j)) for i, j in zip(*np.where(~grid))]
+
+
+def load_yaml_instance(path="test.yaml"):
+    import yaml
+    with open(path) as f:
+        instance = yaml.load(f, Loader=yaml.FullLoader)
+    h, w = instance["map"]["dimensions"]
+    grid = np.zeros((h, w), dtype=bool)
+    for i, j in instance["map"]["obstacles"]:
+        grid[i, j] = True
+    starts = [tuple(agent["start"]) for agent in instance["agents"]]
+    goals = [tuple(agent["goal"]) for agent in instance["agents"]]
+    return grid, starts, goals
+
+
+def expanded(env, memory):
+    # measure() runs the case twice when tracing memory
+    return {"expansions": env.expansions // (2 if memory else 1)}
+
+
+def measure(fn, memory=True):
+    # Time an untraced run, then repeat under tracemalloc for the peak allocation
+    start = time.perf_counter()
+    result = fn()
+    wall_time = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return wall_time, peak, result
+
+
+def synthetic_fleet(agents, jobs, size, seed, split=0.4):
+    rnd = random.Random(seed)
+    model = Model()
+    fleet = []
+    for a in range(agents):
+        pos = (rnd.randrange(size), rnd.randrange(size))
+        agent = Truck(a, pos, model) if a < split * agents else Car(a, pos, model)
+        agent.curr_load = rnd.randint(0, agent.max_load)
+        fleet.append(agent)
+    open_jobs = [
+        Job((rnd.randrange(size), rnd.randrange(size)), rnd.randint(1, 9), rnd.randint(1, 3), model)
+        for _ in range(jobs)
+    ]
+    return rnd, fleet, open_jobs
+
+
+def planner_cases(preset, seed, memory):
+    for size in preset["map_sizes"]:
+        for density in preset["densities"]:
+            grid = random_map(size, density, seed)
+            rnd = random.Random(seed)
+            free = free_cells(grid)
+            queries = [(rnd.choice(free), rnd.choice(free)) for _ in range(preset["queries"])]
+            params = {"map": size, "density": density, "queries": len(queries)}
+
+            env = CountingGrid(grid)
+            wall_time, peak, _ = measure(lambda: [astar(env, s, g) for s, g in queries], memory)
+            yield "astar", params, wall_time, peak, expanded(env, memory)
+
+            # Landmark selection is a per-map cost, only the queries are timed
+            env = CountingLandmarkGrid(grid)
+            wall_time, peak, _ = measure(lambda: [astar(env, s, g) for s, g in queries], memory)
+            yield "astar[alt]", params, wall_time, peak, expanded(env, memory)
+
+            # Abstract graph construction is a per-map cost, only the queries are timed
+            hpa = HPAStar(grid)
+            wall_time, peak, _ = measure(lambda: [list(hpa.path(s, g)) for s, g in queries], memory)
+            yield "hpa", params, wall_time, peak, {"expansions": hpa.expanded // (2 if memory else 1)}
+
+            # The JPS+ jump tables are a per-map cost as well
+            for name, jps in [("jps", JumpPointSearch(grid)), ("jps+", JPSPlus(grid))]:
+                wall_time, peak, _ = measure(lambda: [jps.path(s, g) for s, g in queries], memory)
+                yield name, params, wall_time, peak, {"expansions": jps.expanded // (2 if memory else 1)}
+
+            env = CountingGrid(grid)
+            horizon = 2 * size
+            wall_time, peak, _ = measure(lambda: [stay(env, s, g, T=horizon) for s, g in queries], memory)
+            yield "stay", {**params, "T": horizon}, wall_time, peak, expanded(env, memory)
+
+            # Joint search is exponential in the number of agents, keep it to pairs of nearby agents
+            env = CountingGrid(grid)
+            pairs = []
+            for s, g in queries[:5]:
+                near = [c for c in free if abs(c[0] - s[0]) + abs(c[1] - s[1]) <= 4 and c != s]
+                goals = [c for c in free if abs(c[0] - s[0]) + abs(c[1] - s[1]) <= 6 and c != s]
+                if len(near) > 0 and len(goals) > 1:
+                    pairs.append(((s, rnd.choice(near)), tuple(rnd.sample(goals, 2))))
+            wall_time, peak, _ = measure(lambda: [astar_multi(env, s, g) for s, g in pairs], memory)
+            yield "astar_multi", {**params, "queries": len(pairs)}, wall_time, peak, \
+                expanded(env, memory)
+
+            # Warehouse clusters: four agents heading for nearby goals
+            env = CountingGrid(grid)
+            clusters = []
+            for s, g in queries[:5]:
+                near = [c for c in free if abs(c[0] - s[0]) + abs(c[1] - s[1]) <= 6]
+                if len(near) >= 8:
+                    cells = rnd.sample(near, 8)
+                    clusters.append((cells[:4], cells[4:]))
+            wall_time, peak, _ = measure(lambda: [astar_multi(env, s, g) for s, g in clusters], memory)
+            yield "astar_multi[4]", {**params, "queries": len(clusters)}, wall_time, peak, expanded(env, memory)
+
+
+def cbs_cases(preset, seed, memory):
+    grid, starts, goals = load_yaml_instance()
+    env = CountingGrid(grid)
+    np.random.seed(seed)
+    wall_time, peak, _ = measure(lambda: cbs(env, starts, goals), memory)
+    yield "cbs", {"instance": "test.yaml", "agents": len(starts)}, wall_time, peak, \
+        expanded(env, memory)
+
+    grid = random_map(32, 0.2, seed)
+    rnd = random.Random(seed)
+    free = free_cells(grid)
+    for agents in [2, 4, 6]:
+        cells = rnd.sample(free, 2 * agents)
+        env = CountingGrid(grid)
+        np.random.seed(seed)
+        wall_time, peak, _ = measure(lambda: cbs(env, cells[:agents], cells[agents:]), memory)
+        yield "cbs", {"map": 32, "density": 0.2, "agents": agents}, wall_time, peak, \
+            expanded(env, memory)
+        wall_time, peak, _ = measure(lambda: icbs(grid, cells[:agents], cells[agents:]), memory)
+        yield "icbs", {"map": 32, "density": 0.2, "agents": agents}, wall_time, peak, {}
+
+
+def allocation_cases(preset, seed, memory):
+    for agents in preset["fleets"]:
+        size = max(32, int(np.sqrt(agents * 20)))
+        rnd, fleet, open_jobs = synthetic_fleet(agents, agents, size, seed)
+        params = {"agents": agents, "jobs": agents}
+        wall_time, peak, _ = measure(lambda: generate_matrix(fleet, open_jobs), memory)
+        yield "generate_matrix", params, wall_time, peak, {}
+        # A dense 5000x5000 solve takes minutes and is not a meaningful per-tick baseline
+        if agents <= 2000:
+            wall_time, peak, _ = measure(lambda: HungarianMethod(rnd, fleet, open_jobs), memory)
+            yield "HungarianMethod", params, wall_time, peak, {}
+        wall_time, peak, _ = measure(lambda: RandomAllocation(rnd, fleet, open_jobs), memory)
+        yield "RandomAllocation", params, wall_time, peak, {}
+
+
+def model_cases(preset, seed, memory, directory):
+    for size in preset["map_sizes"]:
+        grid = random_map(size, 0.2, seed)
+        path = os.path.join(directory, f"bench-{size}.map")
+        write_map(path, grid)
+        for agents in preset["fleets"]:
+            # Leave room for jobs and warehouses on small maps
+            if agents > len(free_cells(grid)) // 4:
+                continue
+            params = {"map": size, "agents": agents, "steps": preset["model_steps"]}
+
+            for case, fleet_engine, metrics in [
+                ("DeliveryModel.step", False, "datacollector"),
+                ("DeliveryModel.step[recorder]", False, "recorder"),
+                ("FleetEngine.step", True, "datacollector"),
+            ]:
+                def run():
+                    model = DeliveryModel(
+                        space_size=size, jobs=4 * agents, agents=agents, warehouses=3, seed=seed, obstacle_map=path,
+                        fleet_engine=fleet_engine, metrics=metrics
+                    )
+                    start = time.perf_counter()
+                    for _ in range(preset["model_steps"]):
+                        if not model.running:
+                            break
+                        model.step()
+                    return time.perf_counter() - start, model.distance_fields.misses
+
+                _, peak, (step_time, fields) = measure(run, memory)
+                yield case, params, step_time / preset["model_steps"], peak, {"fields_built": fields}
+
+
+def map_cases(preset, seed, memory, directory):
+    for size in preset["map_sizes"]:
+        path = os.path.join(directory, f"load-{size}.map")
+        write_map(path, random_map(size, 0.3, seed))
+        params = {"map": size, "density": 0.3}
+        wall_time, peak, _ = measure(lambda: read_map(path), memory)
+        yield "read_map", params, wall_time, peak, {}
+        load_map(path)
+        wall_time, peak, _ = measure(lambda: load_map(path), memory)
+        yield "load_map[cached]", params, wall_time, peak, {}
+
+
+def run_suite(preset_name="quick", seed=42, memory=True, only=None):
+    preset = PRESETS[preset_name]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        groups = {
+            "planners": planner_cases(preset, seed, memory),
+            "cbs": cbs_cases(preset, seed, memory),
+            "allocation": allocation_cases(preset, seed, memory),
+            "model": model_cases(preset, seed, memory, directory),
+            "maps": map_cases(preset, seed, memory, directory),
+        }
+        for group, cases in groups.items():
+            if only and group not in only:
+                continue
+            for case, params, wall_time, peak, counters in cases:
+                result = {
+                    "case": case,
+                    "params": params,
+                    "wall_time": wall_time,
+                    "peak_memory": peak,
+                    **counters,
+                }
+                print(format_result(result))
+                results.append(result)
+    return results
+
+
+def result_key(result):
+    return result["case"] + " " + json.dumps(result["params"], sort_keys=True)
+
+
+def format_result(result, baseline=None):
+    line = f"{result['case']:>18} {json.dumps(result['params'], sort_keys=True):<60} {result['wall_time']:>10.4f}s"
+    if result["peak_memory"] is not None:
+        line += f" {result['peak_memory'] / 2 ** 20:>9.2f}MiB"
+    for counter in ["expansions", "fields_built"]:
+        if counter in result:
+            line += f" {counter}={result[counter]}"
+    if baseline is not None:
+        line += f"  x{baseline['wall_time'] / result['wall_time']:.2f} vs baseline"
+    return line
+
+
+def compare(results, baseline_results):
+    baseline = {result_key(r): r for r in baseline_results}
+    print("\nComparison against baseline (>1 is faster):")
+    for result in results:
+        print(format_result(result, baseline.get(result_key(result))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--only", nargs="+", choices=["planners", "cbs", "allocation", "model", "maps"])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run used for peak memory")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results from a previous run to compare against")
+    args = parser.parse_args()
+
+    results = run_suite(args.preset, args.seed, not args.no_memory, args.only)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"preset": args.preset, "seed": args.seed, "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f)["results"])
@@ -0,0 +1,32 @@
+from collections import defaultdict
+
+import numpy as np
+from mesa.visualization.modules import CanvasGrid
+
+
+class OccupancyCanvasGrid(CanvasGrid):
+    """
+    CanvasGrid for models on an OccupancyGrid. Only occupied cells are visited, and blocked cells are
+    read from the obstacle bitmap and drawn with the portrayal given for obstacles.
+    """
+
+    def __init__(self, portrayal_method, obstacle_portrayal, grid_width, grid_height,
+                 canvas_width=500, canvas_height=500):
+        super().__init__(portrayal_method, grid_width, grid_height, canvas_width, canvas_height)
+        self.obstacle_portrayal = obstacle_portrayal
+
+    def render(self, model):
+        grid_state = defaultdict(list)
+        for x, y in zip(*np.nonzero(model.grid.obstacles)):
+            portrayal = dict(self.obstacle_portrayal, x=int(x), y=int(y))
+            grid_state[portrayal["Layer"]].append(portrayal)
+
+        for (x, y), cell_objects in model.grid.cells.items():
+            for obj in cell_objects:
+                portrayal = self.portrayal_method(obj)
+                if portrayal:
+                    portrayal["x"] = int(x)
+                    portrayal["y"] = int(y)
+                    grid_state[portrayal["Layer"]].append(portrayal)
+
+        return grid_state
@@ -1,33 +1,90 @@
+import base64
+
+import numpy as np
 from mesa.visualization.ModularVisualization import VisualizationElement
 
 
 class SimpleCanvas(VisualizationElement):
+    """
+    Canvas that ships the static layers once and then only what changed. The first frame for a
+    model carries the obstacle bitmap and the warehouses, which the browser draws once into a
+    cached background, together with every vehicle and open job. Later frames only hold the
+    vehicles and jobs whose portrayal changed and the ids of those that are gone. A full frame is
+    sent again when the static layers change and every keyframe_interval frames, so a client that
+    missed a frame catches up.
+    """
+
     local_includes = ["canvas/simple_continuous_canvas.js"]
     portrayal_method = None
     canvas_height = 500
     canvas_width = 500
 
-    def __init__(self, portrayal_method, canvas_height=500, canvas_width=500):
+    def __init__(self, portrayal_method, grid_width, grid_height, canvas_height=500, canvas_width=500,
+                 obstacle_color="#555555", keyframe_interval=500):
         """
         Instantiate a new SimpleCanvas
         """
         self.portrayal_method = portrayal_method
+        self.grid_width = grid_width
+        self.grid_height = grid_height
         self.canvas_height = canvas_height
         self.canvas_width = canvas_width
-        new_element = "new Simple_Continuous_Module({}, {})".format(
-            self.canvas_width, self.canvas_height
+        self.obstacle_color = obstacle_color
+        self.keyframe_interval = keyframe_interval
+        self.model = None
+        self.static_key = None
+        self.entities = {}
+        self.frames = 0
+        new_element = "new Simple_Continuous_Module({}, {}, {}, {})".format(
+            self.canvas_width, self.canvas_height, self.grid_width, self.grid_height
         )
         self.js_code = "elements.push(" + new_element + ");"
 
+    def __portray__(self, obj):
+        portrayal = self.portrayal_method(obj)
+        x, y = obj.pos
+        portrayal["x"] = int(x)
+        portrayal["y"] = int(y)
+        return portrayal
+
+    def __static__(self, model):
+        obstacles = model.grid.obstacles
+        return {
+            "width": int(obstacles.shape[0]),
+            "height": int(obstacles.shape[1]),
+            # Row-major bits, cell (x, y) is bit x * height + y
+            "obstacles": base64.b64encode(np.packbits(obstacles)).decode("ascii"),
+            "color": self.obstacle_color,
+            "warehouses": [self.__portray__(warehouse) for warehouse in model.warehouses],
+        }
+
+    def __entities__(self, model):
+        entities = {f"v{agent.unique_id}": self.__portray__(agent) for agent in model.agents}
+        for job in model.available_tasks:
+            entities[f"j{id(job)}"] = self.__portray__(job)
+        return entities
+
     def render(self, model):
-        space_state = []
-        for obj in model.obstacles + model.warehouses + model.tasks + model.schedule.agents:
-            portrayal = self.portrayal_method(obj)
-            x, y = obj.pos
-            x = (x - model.space.x_min) / (model.space.x_max - model.space.x_min)
-            y = (y - model.space.y_min) / (model.space.y_max - model.space.y_min)
-            portrayal["x"] = x
-            portrayal["y"] = y
-            space_state.append(portrayal)
-
-        return space_state
\ No newline at end of file
+        entities = self.__entities__(model)
+        static_key = (
+            id(model.grid.obstacles),
+            model.grid.version,
+            tuple(warehouse.pos for warehouse in model.warehouses)
+        )
+        keyframe = model is not self.model or static_key != self.static_key or \
+            self.frames % self.keyframe_interval == 0
+
+        if keyframe:
+            frame = {"full": True, "static": self.__static__(model), "entities": entities}
+            self.model = model
+            self.static_key = static_key
+            self.frames = 0
+        else:
+            frame = {
+                "full": False,
+                "update": {key: p for key, p in entities.items() if self.entities.get(key) != p},
+                "remove": [key for key in self.entities if key not in entities],
+            }
+        self.entities = entities
+        self.frames += 1
+        return frame
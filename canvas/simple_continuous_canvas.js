@@ -1,105 +1,158 @@
-var ContinuousVisualization = function(height, width, context) {
-	var height = height;
-	var width = width;
-	var context = context;
-
-	this.draw = function(objects) {
-		for (var i in objects) {
-			var p = objects[i];
-			if (p.Shape == "rect")
-				this.drawRectangle(p.x, p.y, p.w, p.h, p.obstacle, p.Color);
-			if (p.Shape == "circle")
-				this.drawCircle(p.x, p.y, p.r, p.load, p.max, p.Color);
-			if (p.Shape == "triangle")
-				this.drawTriangle(p.x, p.y, p.r, p.val, p.Color);
-		};
+var ContinuousVisualization = function(width, height, gridWidth, gridHeight, context) {
+	var cellWidth = width / gridWidth;
+	var cellHeight = height / gridHeight;
+
+	// Obstacles and warehouses only change with a full frame, so they are drawn once into an
+	// offscreen canvas that every frame starts from
+	var background = document.createElement("canvas");
+	background.width = width;
+	background.height = height;
+	var backgroundContext = background.getContext("2d");
+
+	// Portrayals of the vehicles and open jobs, by id
+	var entities = {};
+
+	// Centre of cell (x, y) in pixels, with y pointing up like CanvasGrid
+	var centre = function(p) {
+		return [(p.x + 0.5) * cellWidth, (gridHeight - p.y - 0.5) * cellHeight];
+	};
 
+	this.setStatic = function(layers) {
+		backgroundContext.clearRect(0, 0, width, height);
+		var bytes = atob(layers.obstacles);
+		backgroundContext.fillStyle = layers.color;
+		for (var i = 0; i < layers.width * layers.height; i++) {
+			if ((bytes.charCodeAt(i >> 3) >> (7 - (i & 7))) & 1) {
+				var x = Math.floor(i / layers.height);
+				var y = i % layers.height;
+				backgroundContext.fillRect(x * cellWidth, (gridHeight - y - 1) * cellHeight, cellWidth, cellHeight);
+			}
+		}
+		for (var j in layers.warehouses) {
+			this.drawShape(backgroundContext, layers.warehouses[j]);
+		}
 	};
 
-	this.drawCircle = function(x, y, radius, load, max_load, color) {
-		var cx = x * width;
-		var cy = y * height;
-		var r = radius;
+	this.setEntities = function(all) {
+		entities = all;
+	};
 
-		context.beginPath();
-		context.arc(cx, cy, r, 0, Math.PI * 2, false);
-		context.closePath();
+	this.applyDelta = function(update, remove) {
+		for (var key in update) {
+			entities[key] = update[key];
+		}
+		for (var i in remove) {
+			delete entities[remove[i]];
+		}
+	};
+
+	this.draw = function() {
+		context.clearRect(0, 0, width, height);
+		context.drawImage(background, 0, 0);
+		// Jobs first so vehicles working on them stay visible
+		var vehicles = [];
+		for (var key in entities) {
+			if (entities[key].Shape == "circle")
+				vehicles.push(entities[key]);
+			else
+				this.drawShape(context, entities[key]);
+		}
+		for (var i in vehicles) {
+			this.drawShape(context, vehicles[i]);
+		}
+	};
 
-		context.strokeStyle = "#000000";
-		context.lineWidth = 1;
-		context.stroke();
+	this.drawShape = function(ctx, p) {
+		if (p.Shape == "rect")
+			this.drawRectangle(ctx, p, p.w, p.h, p.Color);
+		if (p.Shape == "circle")
+			this.drawCircle(ctx, p, p.r, p.load, p.max, p.Color);
+		if (p.Shape == "triangle")
+			this.drawTriangle(ctx, p, p.r, p.val, p.Color);
+	};
+
+	this.drawCircle = function(ctx, p, radius, load, max_load, color) {
+		var [cx, cy] = centre(p);
+		var r = radius * Math.min(cellWidth, cellHeight);
+
+		ctx.beginPath();
+		ctx.arc(cx, cy, r, 0, Math.PI * 2, false);
+		ctx.closePath();
 
-		context.fillStyle = color;
-		context.fill();
+		ctx.strokeStyle = "#000000";
+		ctx.lineWidth = 1;
+		ctx.stroke();
 
-		context.fillStyle = "#FFFFFF";
-		context.lineWidth = 0.5;
+		ctx.fillStyle = color;
+		ctx.fill();
+
+		ctx.fillStyle = "#FFFFFF";
+		ctx.lineWidth = 0.5;
 		for (let i = 0; i < max_load; i++) {
-			context.strokeRect(cx-r*0.3, cy+r*0.5-(r*i*0.4), r*0.6, r*0.4);
-			context.fillRect(cx-r*0.3, cy+r*0.5-(r*i*0.4), r*0.6, r*0.4);
+			ctx.strokeRect(cx-r*0.3, cy+r*0.5-(r*i*0.4), r*0.6, r*0.4);
+			ctx.fillRect(cx-r*0.3, cy+r*0.5-(r*i*0.4), r*0.6, r*0.4);
 		}
-		context.fillStyle = "#a08f73";
+		ctx.fillStyle = "#a08f73";
 		for (let i = 0; i < load; i++) {
-			context.fillRect(cx - r * 0.3, cy + r * 0.5 - (r * i * 0.4), r * 0.6, r * 0.4);
+			ctx.fillRect(cx - r * 0.3, cy + r * 0.5 - (r * i * 0.4), r * 0.6, r * 0.4);
 		}
 
 	};
 
-	this.drawTriangle = function(x, y, radius, val, color) {
-		var cx = x * width;
-		var cy = y * height;
-		var r = radius;
+	this.drawTriangle = function(ctx, p, radius, val, color) {
+		var [cx, cy] = centre(p);
+		var r = radius * Math.min(cellWidth, cellHeight);
 
-		context.beginPath();
-		context.moveTo(cx, cy - r)
-		context.lineTo(cx - r * Math.cos(7/6 * Math.PI), cy - r * Math.sin(7/6 * Math.PI))
-		context.lineTo(cx - r * Math.cos(11/6 * Math.PI), cy - r * Math.sin(11/6 * Math.PI))
-		context.closePath();
-
-		context.fillStyle = color;
-		context.fill();
-
-		context.strokeStyle = "#6A6A6A";
-		context.lineWidth = 1;
-		context.stroke();
-		context.fillStyle = "#ffffff";
+		ctx.beginPath();
+		ctx.moveTo(cx, cy - r)
+		ctx.lineTo(cx - r * Math.cos(7/6 * Math.PI), cy - r * Math.sin(7/6 * Math.PI))
+		ctx.lineTo(cx - r * Math.cos(11/6 * Math.PI), cy - r * Math.sin(11/6 * Math.PI))
+		ctx.closePath();
+
+		ctx.fillStyle = color;
+		ctx.fill();
+
+		ctx.strokeStyle = "#6A6A6A";
+		ctx.lineWidth = 1;
+		ctx.stroke();
+		ctx.fillStyle = "#ffffff";
 		var font_size = r;
-		context.font = font_size + "px sans-serif";
-		context.textAlign = "center";
-		context.fillText(val, cx, cy + 0.25 * r);
+		ctx.font = font_size + "px sans-serif";
+		ctx.textAlign = "center";
+		ctx.fillText(val, cx, cy + 0.25 * r);
 
 	};
 
-	this.drawRectangle = function(x, y, w, h, obstacle, color) {
-		context.beginPath();
-		var dx = w;
-		var dy = h;
+	this.drawRectangle = function(ctx, p, w, h, color) {
+		var [cx, cy] = centre(p);
+		var dx = w * cellWidth;
+		var dy = h * cellHeight;
 
 		// Keep the drawing centered:
-		var x0 = (x * width) - 0.5 * dx;
-		var y0 = (y * height) - 0.5 * dy;
-		context.fillStyle = color;
-		context.fillRect(x0, y0, dx, dy);
-
-		if (!obstacle) {
-			context.strokeStyle = "#000000";
-			context.lineWidth = 0.1;
-			context.strokeRect(x0, y0, dx, dy);
-			context.fillStyle = "#ffffff";
-			var font_size = w * 0.6;
-			context.font = font_size + "px sans-serif";
-			context.textAlign = "center";
-			context.fillText("W", x * width, y * height + w * 0.22);
-		}
+		var x0 = cx - 0.5 * dx;
+		var y0 = cy - 0.5 * dy;
+		ctx.fillStyle = color;
+		ctx.fillRect(x0, y0, dx, dy);
+
+		ctx.strokeStyle = "#000000";
+		ctx.lineWidth = 0.1;
+		ctx.strokeRect(x0, y0, dx, dy);
+		ctx.fillStyle = "#ffffff";
+		var font_size = dx * 0.6;
+		ctx.font = font_size + "px sans-serif";
+		ctx.textAlign = "center";
+		ctx.fillText("W", cx, cy + dx * 0.22);
 	};
 
 	this.resetCanvas = function() {
-		context.clearRect(0, 0, height, width);
+		entities = {};
+		backgroundContext.clearRect(0, 0, width, height);
+		context.clearRect(0, 0, width, height);
 		context.beginPath();
 	};
 };
 
-var Simple_Continuous_Module = function(canvas_width, canvas_height) {
+var Simple_Continuous_Module = function(canvas_width, canvas_height, grid_width, grid_height) {
 	// Create the element
 	// ------------------
 
@@ -112,15 +165,20 @@ var Simple_Continuous_Module = function(canvas_width, canvas_height) {
 
 	// Create the context and the drawing controller:
 	var context = canvas.getContext("2d");
-	var canvasDraw = new ContinuousVisualization(canvas_width, canvas_height, context);
+	var canvasDraw = new ContinuousVisualization(canvas_width, canvas_height, grid_width, grid_height, context);
 
 	this.render = function(data) {
-		canvasDraw.resetCanvas();
-		canvasDraw.draw(data);
+		if (data.full) {
+			canvasDraw.setStatic(data.static);
+			canvasDraw.setEntities(data.entities);
+		} else {
+			canvasDraw.applyDelta(data.update, data.remove);
+		}
+		canvasDraw.draw();
 	};
 
 	this.reset = function() {
 		canvasDraw.resetCanvas();
 	};
 
-};
\ No newline at end of file
+};
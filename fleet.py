@@ -0,0 +1,175 @@
+import numpy as np
+from mesa.time import RandomActivation
+
+from agents import Warehouse
+
+
+class FleetEngine(RandomActivation):
+    """
+    Scheduler that advances every vehicle at once from struct-of-arrays state instead of calling
+    Car.step and Truck.step one agent at a time. Only vehicles that pick a target or reach one are
+    handled individually, in the same shuffled order RandomActivation would use, so a run follows
+    the same trajectories as the object model for a fixed seed. Vehicles are taken off the grid
+    once the engine starts, their pos, load and target attributes are still kept up to date.
+    Collisions are not modelled.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.vehicles = None
+        self.completed = []
+
+    def __build__(self):
+        self.vehicles = list(self._agents.values())
+        n = len(self.vehicles)
+        self.index = {vehicle.unique_id: i for i, vehicle in enumerate(self.vehicles)}
+        self.pos = np.array([vehicle.pos for vehicle in self.vehicles], dtype=np.int64).reshape(n, 2)
+        self.load = np.array([vehicle.curr_load for vehicle in self.vehicles], dtype=np.int64)
+        self.max_load = np.array([vehicle.max_load for vehicle in self.vehicles], dtype=np.int64)
+        # Vehicles move once every `period` ticks, starting on the first one
+        self.period = np.rint([1 / vehicle.speed for vehicle in self.vehicles]).astype(np.int64)
+        self.targets = [None] * n
+        self.target_pos = np.zeros((n, 2), dtype=np.int64)
+        self.has_target = np.zeros(n, dtype=bool)
+
+        # Remaining path of vehicle i is cells[cursor[i]:end[i]]
+        self.cells = np.zeros((max(1024, 64 * n), 2), dtype=np.int64)
+        self.used = 0
+        self.cursor = np.zeros(n, dtype=np.int64)
+        self.end = np.zeros(n, dtype=np.int64)
+
+        for vehicle in self.vehicles:
+            self.model.grid.remove_agent(vehicle)
+        for i, vehicle in enumerate(self.vehicles):
+            vehicle.pos = tuple(self.pos[i].tolist())
+
+    def __store_paths__(self, indices, paths):
+        total = sum(len(path) for path in paths)
+        if self.used + total > len(self.cells):
+            # Compact the buffer down to the paths still being followed before growing it
+            live = np.flatnonzero(self.cursor < self.end)
+            remaining = [self.cells[self.cursor[i]:self.end[i]] for i in live]
+            size = sum(len(path) for path in remaining) + total
+            cells = np.zeros((max(len(self.cells), 2 * size), 2), dtype=np.int64)
+            offset = 0
+            for i, path in zip(live, remaining):
+                cells[offset:offset + len(path)] = path
+                self.cursor[i], self.end[i] = offset, offset + len(path)
+                offset += len(path)
+            self.cells = cells
+            self.used = offset
+            finished = np.ones(len(self.vehicles), dtype=bool)
+            finished[live] = False
+            self.cursor[finished] = 0
+            self.end[finished] = 0
+        for i, path in zip(indices, paths):
+            self.cursor[i] = self.used
+            self.cells[self.used:self.used + len(path)] = path
+            self.used += len(path)
+            self.end[i] = self.used
+
+    def __release_completed__(self):
+        # Job.step clears the target of every vehicle still assigned to a job once it is completed
+        for job in self.completed:
+            for vehicle in job.assigned:
+                i = self.index[vehicle.unique_id]
+                if self.targets[i] is job:
+                    self.targets[i] = None
+                    self.has_target[i] = False
+        self.completed = []
+
+    def release(self, vehicle):
+        # Drop a vehicle's target so it picks a new one on the next step
+        vehicle.target = None
+        if self.vehicles is not None:
+            i = self.index[vehicle.unique_id]
+            self.targets[i] = None
+            self.has_target[i] = False
+
+    def replan(self, cells=None):
+        # New paths for the vehicles whose remaining path crosses one of cells, or for every vehicle
+        # still following a path when cells is None
+        if self.vehicles is None:
+            return
+        live = np.flatnonzero(self.has_target & (self.cursor < self.end))
+        # Vehicles still assigned to a job completed this tick are released on the next step
+        live = np.array([i for i in live if self.targets[i].pos is not None], dtype=np.int64)
+        if cells is not None and live.size:
+            height = self.model.grid.height
+            closed = np.zeros(self.model.grid.width * height, dtype=bool)
+            closed[[x * height + y for x, y in cells]] = True
+            path_cells = self.cells[:self.used]
+            crossed = np.concatenate(([0], np.cumsum(closed[path_cells[:, 0] * height + path_cells[:, 1]])))
+            live = live[crossed[self.end[live]] > crossed[self.cursor[live]]]
+        paths = [
+            np.array(self.model.plan_path(self.vehicles[i].pos, self.targets[i].pos)[1:], dtype=np.int64).reshape(-1, 2)
+            for i in live
+        ]
+        if paths:
+            self.__store_paths__(live.tolist(), paths)
+
+    def __assign_targets__(self, order):
+        model = self.model
+        indices, paths = [], []
+        for i in order[~self.has_target[order]]:
+            vehicle = self.vehicles[i]
+            if self.load[i] <= self.max_load[i] * 0.5:
+                target = model.find_closest_warehouse(vehicle.pos)
+                vehicle.is_resupplying = True
+            else:
+                target = model.allocation.get(vehicle)
+                if target is None:
+                    continue
+                target.assign(vehicle)
+            vehicle.target = target
+            self.targets[i] = target
+            self.target_pos[i] = target.pos
+            self.has_target[i] = True
+            indices.append(i)
+            paths.append(np.array(model.plan_path(vehicle.pos, target.pos)[1:], dtype=np.int64).reshape(-1, 2))
+        if indices:
+            self.__store_paths__(indices, paths)
+
+    def __arrive__(self, i):
+        vehicle = self.vehicles[i]
+        target = self.targets[i]
+        if type(target) is Warehouse:
+            self.load[i] = self.max_load[i]
+            vehicle.is_resupplying = False
+        else:
+            work = min(int(self.load[i]), target.value)
+            if target.do_work(work, vehicle):
+                self.model.allocation_flag = True
+                self.completed.append(target)
+            self.load[i] -= work
+        vehicle.curr_load = int(self.load[i])
+        vehicle.target = None
+        self.targets[i] = None
+        self.has_target[i] = False
+
+    def step(self):
+        if self.vehicles is None:
+            self.__build__()
+        self.__release_completed__()
+
+        # Same shuffle as RandomActivation, so the model's random stream stays in step with the object model
+        keys = list(self._agents.keys())
+        self.model.random.shuffle(keys)
+        order = np.array([self.index[key] for key in keys], dtype=np.int64).reshape(-1)
+
+        self.__assign_targets__(order)
+
+        due = self.steps % self.period == 0
+        moving = due & self.has_target & (self.cursor < self.end)
+        movers = np.flatnonzero(moving)
+        self.pos[movers] = self.cells[self.cursor[movers]]
+        self.cursor[movers] += 1
+        for i, pos in zip(movers.tolist(), self.pos[movers].tolist()):
+            self.vehicles[i].pos = tuple(pos)
+
+        arrived = due & self.has_target & (self.pos == self.target_pos).all(axis=1)
+        for i in order[arrived[order]].tolist():
+            self.__arrive__(i)
+
+        self.steps += 1
+        self.time += 1
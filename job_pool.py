@@ -0,0 +1,59 @@
+from collections import defaultdict
+from heapq import nsmallest
+
+
+class JobPool:
+    """
+    Open jobs in arrival order with O(1) insertion and removal, bucketed by priority for the
+    (priority, -value) order the allocators work through.
+    """
+
+    def __init__(self, jobs=()):
+        # Dicts keep insertion order, so every view below iterates in arrival order
+        self.jobs = {}
+        self.priorities = defaultdict(dict)
+        self.extend(jobs)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __iter__(self):
+        return iter(self.jobs)
+
+    def __contains__(self, job):
+        return job in self.jobs
+
+    def add(self, job):
+        self.jobs[job] = None
+        self.priorities[job.priority][job] = None
+
+    def extend(self, jobs):
+        for job in jobs:
+            self.add(job)
+
+    def remove(self, job):
+        if job not in self.jobs:
+            raise ValueError(f"{job.name} is not in the pool")
+        del self.jobs[job]
+        bucket = self.priorities[job.priority]
+        del bucket[job]
+        if not bucket:
+            del self.priorities[job.priority]
+
+    def top(self, k=None):
+        # The first k jobs by (priority, -value), ties kept in arrival order like a stable sort.
+        # Values only drop as jobs are worked on, so each priority bucket is ranked when it is read.
+        k = len(self.jobs) if k is None else k
+        selected = []
+        for priority in sorted(self.priorities):
+            if len(selected) >= k:
+                break
+            selected += nsmallest(k - len(selected), self.priorities[priority], key=lambda j: -j.value)
+        return selected
+
+
+def priority_order(jobs, k=None):
+    # Open jobs in (priority, -value) order, the first k of them if k is given
+    if not isinstance(jobs, JobPool):
+        jobs = JobPool(jobs)
+    return jobs.top(k)
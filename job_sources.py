@@ -0,0 +1,167 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+from collections import deque
+
+import numpy as np
+
+
+class JobSource(ABC):
+    """
+    Where a DeliveryModel's jobs come from. The model binds the source once and then asks it for the
+    jobs arriving at every tick, so only jobs that have arrived and are still open need to be in memory.
+    """
+
+    # Whether jobs arriving mid-run trigger a new allocation, rather than waiting for the next completion
+    reallocate_on_arrival = True
+
+    @abstractmethod
+    def bind(self, model, limit=None):
+        # Prepare the source for model and return how many jobs it will release in total
+        pass
+
+    @abstractmethod
+    def release(self, model, t):
+        # Jobs arriving at tick t, created through model.create_job
+        pass
+
+
+class PreloadedJobs(JobSource):
+    """
+    Every job is created up front on the empty cells and revealed a few at a time, topping the open
+    jobs back up to one per vehicle whenever fewer than `visible` remain.
+    """
+
+    reallocate_on_arrival = False
+
+    def __init__(self, visible=10):
+        self.visible = visible
+        self.hidden = deque()
+
+    def bind(self, model, limit=None):
+        samples = model.random.choices(list(model.grid.empties), k=limit)
+        for i, j in samples:
+            self.hidden.append(model.create_job((i, j), model.random.randint(1, 9), model.random.randint(1, 3)))
+        return limit
+
+    def release(self, model, t):
+        open_jobs = len(model.available_tasks)
+        if t == 0:
+            count = min(self.visible, model.tasks_left)
+        elif open_jobs < self.visible and model.tasks_left > open_jobs:
+            count = model.num_agents - open_jobs
+            if count < 0:
+                # A negative count releases all but the last -count hidden jobs, as slicing the list did
+                count = len(self.hidden) + count
+        else:
+            return []
+        return [self.hidden.popleft() for _ in range(max(0, min(count, len(self.hidden))))]
+
+
+class PoissonJobs(JobSource):
+    """
+    Stochastic arrivals: every tick each priority level receives a Poisson distributed number of jobs
+    at its own rate. Jobs land uniformly on free cells other than warehouses or, with the given
+    weights, around hotspots given as ((row, col), spread, weight).
+    """
+
+    def __init__(self, rates=None, hotspots=(), background=1.0, values=(1, 9), seed=None):
+        self.rates = rates if rates is not None else {1: 0.05, 2: 0.1, 3: 0.15}
+        self.hotspots = list(hotspots)
+        self.background = background
+        self.values = values
+        self.seed = seed
+
+    def bind(self, model, limit=None):
+        if limit is None:
+            raise ValueError("PoissonJobs needs a limit on the number of jobs")
+        seed = self.seed if self.seed is not None else model.random.randrange(2 ** 32)
+        self.rng = np.random.default_rng(seed)
+        self.warehouses = {tuple(warehouse.pos) for warehouse in model.warehouses}
+        self.grid = model.obstacle_matrix
+        self.free = self.__free__()
+        weights = np.array([self.background] + [weight for _, _, weight in self.hotspots], dtype=float)
+        self.weights = weights / weights.sum()
+        self.remaining = limit
+        return limit
+
+    def __free__(self):
+        # Flat indices of the open cells jobs can land on
+        free = ~self.grid.ravel()
+        for r, c in self.warehouses:
+            free[r * self.grid.shape[1] + c] = False
+        return np.flatnonzero(free)
+
+    def __position__(self, model):
+        # Roads closed since bind show up as a new obstacle matrix on the model
+        if model.obstacle_matrix is not self.grid:
+            self.grid = model.obstacle_matrix
+            self.free = self.__free__()
+        h, w = self.grid.shape
+        component = self.rng.choice(len(self.weights), p=self.weights)
+        if component > 0:
+            (row, col), spread, _ = self.hotspots[component - 1]
+            # Retry a few times before falling back to a uniform cell if the hotspot is mostly blocked
+            for _ in range(8):
+                r, c = np.rint(self.rng.normal((row, col), spread)).astype(int)
+                if 0 <= r < h and 0 <= c < w and not self.grid[r, c] and (r, c) not in self.warehouses:
+                    return int(r), int(c)
+        return divmod(int(self.rng.choice(self.free)), w)
+
+    def release(self, model, t):
+        jobs = []
+        for priority, rate in sorted(self.rates.items()):
+            for _ in range(min(self.rng.poisson(rate), self.remaining - len(jobs))):
+                value = int(self.rng.integers(self.values[0], self.values[1] + 1))
+                jobs.append(model.create_job(self.__position__(model), value, priority))
+        self.remaining -= len(jobs)
+        return jobs
+
+
+class TraceJobs(JobSource):
+    """
+    Replays a recorded incident trace, read lazily from a JSONL or CSV file sorted by arrival tick.
+    Every record has t, row, col, value and priority; JSONL records may give "pos": [row, col] instead.
+    Records outside the map or on one of its obstacles are rejected when the trace is bound.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __records__(self):
+        with open(self.path, newline="") as f:
+            if self.path.endswith(".csv"):
+                rows = csv.DictReader(f)
+            else:
+                rows = (json.loads(line) for line in f if line.strip())
+            for record in rows:
+                row, col = record["pos"] if "pos" in record else (record["row"], record["col"])
+                yield int(record["t"]), (int(row), int(col)), int(record["value"]), int(record["priority"])
+
+    def bind(self, model, limit=None):
+        # One streaming pass to count and check the records, the trace itself is never held in memory.
+        # Cells closed through set_obstacles are fine, jobs arriving on them wait until they reopen
+        h, w = model.obstacle_matrix.shape
+        total = 0
+        for total, (_, pos, _, _) in enumerate(self.__records__(), 1):
+            if not (0 <= pos[0] < h and 0 <= pos[1] < w):
+                raise ValueError(f"{self.path}: record {total} at {pos} is outside the {h}x{w} map")
+            if model.obstacle_matrix[pos] and pos not in model.closures:
+                raise ValueError(f"{self.path}: record {total} at {pos} is on an obstacle")
+        self.remaining = total if limit is None else min(limit, total)
+        self.records = self.__records__()
+        self.pending = next(self.records, None)
+        self.last_t = None
+        return self.remaining
+
+    def release(self, model, t):
+        jobs = []
+        while self.pending is not None and self.remaining > 0 and self.pending[0] <= t:
+            arrival, pos, value, priority = self.pending
+            if self.last_t is not None and arrival < self.last_t:
+                raise ValueError(f"{self.path} is not sorted by arrival tick")
+            self.last_t = arrival
+            jobs.append(model.create_job(pos, value, priority))
+            self.remaining -= 1
+            self.pending = next(self.records, None)
+        return jobs
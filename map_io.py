@@ -0,0 +1,129 @@
+"""
+Reading and writing MovingAI grid maps (https://movingai.com/benchmarks/formats.html).
+
+A map file has a header giving its type, height and width, followed by "map" and one line of terrain
+characters per row. read_map decodes the rows from a single byte buffer through a lookup table;
+load_map additionally keeps a bit-packed copy of the occupancy next to the map file, so repeated runs
+on large maps skip parsing altogether.
+"""
+import os
+
+import numpy as np
+
+# Terrain codes for the MovingAI alphabet
+TERRAIN = {
+    ".": 0,  # passable terrain
+    "G": 0,  # passable terrain
+    "S": 1,  # swamp, passable from regular terrain
+    "@": 2,  # out of bounds
+    "O": 2,  # out of bounds
+    "T": 3,  # trees, unpassable
+    "W": 4,  # water, traversable but not passable from terrain
+}
+PASSABLE = {0, 1}
+BLOCKED = np.array([code not in PASSABLE for code in range(max(TERRAIN.values()) + 1)])
+
+CACHE_SUFFIX = ".occ.npz"
+
+UNKNOWN = 255
+CODES = np.full(256, UNKNOWN, dtype=np.uint8)
+for char, code in TERRAIN.items():
+    CODES[ord(char)] = code
+
+
+def read_header(data):
+    # Parse the header lines up to "map", returning the header fields and the offset of the first row
+    header = {}
+    offset = 0
+    while True:
+        end = data.find(b"\n", offset)
+        if end == -1:
+            raise ValueError("Map has no 'map' line ending its header")
+        line = data[offset:end].decode("ascii").strip()
+        offset = end + 1
+        if line == "map":
+            break
+        if line:
+            key, _, value = line.partition(" ")
+            header[key] = value.strip()
+    for key in ["height", "width"]:
+        if key not in header:
+            raise ValueError(f"Map header is missing its {key}")
+        header[key] = int(header[key])
+    return header, offset
+
+
+def decode_terrain(data, offset, height, width):
+    # Terrain codes for the rows starting at offset, decoded as one array
+    body = data[offset:]
+    if b"\r" in body:
+        body = body.replace(b"\r", b"")
+    rows = np.frombuffer(body, dtype=np.uint8)
+    if len(rows) < height * (width + 1):
+        # Last row without a trailing newline
+        rows = np.concatenate([rows, np.full(height * (width + 1) - len(rows), ord("\n"), dtype=np.uint8)])
+    rows = rows[:height * (width + 1)].reshape(height, width + 1)
+    if (rows[:, width] != ord("\n")).any():
+        row = int(np.argmax(rows[:, width] != ord("\n")))
+        raise ValueError(f"Row {row} of the map is not {width} cells wide")
+    terrain = CODES[rows[:, :width]]
+    if (terrain == UNKNOWN).any():
+        char = chr(rows[:, :width][terrain == UNKNOWN][0])
+        raise ValueError(f"Unknown terrain {char!r} in map")
+    return terrain
+
+
+def read_terrain(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    header, offset = read_header(data)
+    return decode_terrain(data, offset, header["height"], header["width"])
+
+
+def read_map(path):
+    # Boolean obstacle matrix, True where a cell cannot be entered
+    return BLOCKED[read_terrain(path)]
+
+
+def source_key(path):
+    stat = os.stat(path)
+    return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+
+def load_map(path, cache=True):
+    # Obstacle matrix for path, read from its bit-packed cache while the map file is unchanged
+    cache_path = path + CACHE_SUFFIX
+    if cache and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cached:
+                if (cached["source"] == source_key(path)).all():
+                    shape = tuple(cached["shape"])
+                    bits = np.unpackbits(cached["bits"], count=shape[0] * shape[1])
+                    return bits.reshape(shape).view(bool)
+        except (OSError, KeyError, ValueError):
+            pass
+
+    grid = read_map(path)
+    if cache:
+        save_cache(path, grid)
+    return grid
+
+
+def save_cache(path, grid):
+    cache_path = path + CACHE_SUFFIX
+    temp_path = cache_path + ".tmp.npz"
+    try:
+        np.savez(temp_path, bits=np.packbits(grid), shape=np.array(grid.shape), source=source_key(path))
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # A read-only map directory only costs the parse on every run
+        pass
+
+
+def write_map(path, grid, map_type="octile"):
+    h, w = grid.shape
+    rows = np.where(grid, ord("@"), ord(".")).astype(np.uint8)
+    rows = np.concatenate([rows, np.full((h, 1), ord("\n"), dtype=np.uint8)], axis=1)
+    with open(path, "wb") as f:
+        f.write(f"type {map_type}\nheight {h}\nwidth {w}\nmap\n".encode("ascii"))
+        f.write(rows.tobytes())
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class WaitTimeHistogram:
+    """
+    HDR style histogram of non-negative integer wait times. Values below 2**significant_bits are
+    counted exactly, larger ones in log-linear buckets with a relative error under
+    2**(1 - significant_bits), so memory only grows with the logarithm of the largest wait.
+    Histograms with the same precision merge by adding their counts.
+    """
+
+    def __init__(self, significant_bits=7):
+        self.significant_bits = significant_bits
+        self.sub_buckets = 2 ** significant_bits
+        self.half = self.sub_buckets // 2
+        self.counts = np.zeros(self.sub_buckets, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return self.count
+
+    def __bucket__(self, value):
+        shift = value.bit_length() - self.significant_bits
+        if shift <= 0:
+            return value
+        return shift * self.half + (value >> shift)
+
+    def __bounds__(self, index):
+        # Smallest and largest value counted in bucket index
+        if index < self.sub_buckets:
+            return index, index
+        shift = index // self.half - 1
+        mantissa = index - shift * self.half
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def __grow__(self, size):
+        if size > len(self.counts):
+            counts = np.zeros(size, dtype=np.int64)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+
+    def record(self, value, count=1):
+        value = int(value)
+        if value < 0:
+            raise ValueError(f"Cannot record negative wait time {value}")
+        index = self.__bucket__(value)
+        self.__grow__(index + 1)
+        self.counts[index] += count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        if other.significant_bits != self.significant_bits:
+            raise ValueError("Cannot merge histograms of different precision")
+        self.__grow__(len(other.counts))
+        self.counts[:len(other.counts)] += other.counts
+        self.count += other.count
+        self.total += other.total
+        for bound, pick in [("min", min), ("max", max)]:
+            values = [v for v in (getattr(self, bound), getattr(other, bound)) if v is not None]
+            setattr(self, bound, pick(values) if values else None)
+        return self
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q):
+        # Highest value equivalent to the q-th quantile, capped at the largest recorded value
+        if not self.count:
+            return None
+        rank = max(1, int(np.ceil(q * self.count)))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self.__bounds__(index)[1], self.max)
+
+    def percentiles(self, percentiles=(50, 95, 99)):
+        summary = {f"p{p:g}": self.quantile(p / 100) for p in percentiles}
+        summary["max"] = self.max
+        return summary
+
+    def to_dict(self):
+        # Sparse, JSON friendly form for sending sketches between processes or storing them
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            "significant_bits": self.significant_bits,
+            "buckets": nonzero.tolist(),
+            "counts": self.counts[nonzero].tolist(),
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["significant_bits"])
+        if data["buckets"]:
+            histogram.__grow__(max(data["buckets"]) + 1)
+            histogram.counts[data["buckets"]] = data["counts"]
+        histogram.count = int(sum(data["counts"]))
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
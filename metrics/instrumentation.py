@@ -0,0 +1,160 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+
+class PhaseTimer:
+    # Adds the nanoseconds spent inside the with block to a phase of the current tick
+
+    def __init__(self, instrumentation, phase):
+        self.instrumentation = instrumentation
+        self.phase = phase
+
+    def __enter__(self):
+        self.outer = self.instrumentation.phase
+        self.instrumentation.phase = self.phase
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.instrumentation.times[self.phase] += time.perf_counter_ns() - self.start
+        self.instrumentation.phase = self.outer
+        return False
+
+
+class Instrumentation:
+    """
+    Per-phase timers and counters for DeliveryModel.step. Phases are timed with
+    time.perf_counter_ns, counters are either incremented directly or watched: a watched
+    counter reads a cumulative value, such as a cache's hit count, once per tick and
+    records how much it grew. Each finished tick is kept as last_times / last_counters and
+    added to the running totals.
+    """
+
+    def __init__(self, profile_interval=None):
+        self.times = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.last_times = {}
+        self.last_counters = {}
+        self.total_times = defaultdict(int)
+        self.total_counters = defaultdict(int)
+        self.watched = {}
+        self.ticks = 0
+        self.phase = None
+        self.profiler = None
+        if profile_interval:
+            self.profiler = SamplingProfiler(self, profile_interval)
+            self.profiler.start()
+
+    def time(self, phase):
+        return PhaseTimer(self, phase)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def watch(self, name, read):
+        self.watched[name] = [read, read()]
+
+    def read_watched(self):
+        # Add what each watched value grew by since it was last read to this tick's counters
+        for name, watched in self.watched.items():
+            value = watched[0]()
+            self.counters[name] += value - watched[1]
+            watched[1] = value
+
+    def end_tick(self):
+        self.read_watched()
+        for name, value in self.times.items():
+            self.total_times[name] += value
+        for name, value in self.counters.items():
+            self.total_counters[name] += value
+        self.last_times = dict(self.times)
+        self.last_counters = dict(self.counters)
+        self.times.clear()
+        self.counters.clear()
+        self.ticks += 1
+
+    def close(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def summary(self):
+        ticks = max(self.ticks, 1)
+        summary = {
+            "ticks": self.ticks,
+            "phases": {
+                name: {"total_ns": total, "mean_ns": total / ticks, "last_ns": self.last_times.get(name, 0)}
+                for name, total in self.total_times.items()
+            },
+            "counters": {
+                name: {"total": total, "mean": total / ticks, "last": self.last_counters.get(name, 0)}
+                for name, total in self.total_counters.items()
+            },
+        }
+        if self.profiler is not None:
+            summary["profile"] = self.profiler.collapsed()
+        return summary
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def reporters(phases, counters):
+    # DataCollector / MetricsRecorder reporters for the finished phases and counters of each tick.
+    # Collection runs inside the tick it records, so its own time is read from the previous tick.
+    def phase_reporter(phase):
+        if phase == "collect":
+            return lambda m: m.instrumentation.last_times.get(phase, 0)
+        return lambda m: m.instrumentation.times.get(phase, 0)
+
+    def counter_reporter(name):
+        return lambda m: m.instrumentation.counters.get(name, 0)
+
+    return {
+        **{f"{phase} ns": phase_reporter(phase) for phase in phases},
+        **{name: counter_reporter(name) for name in counters},
+    }
+
+
+class SamplingProfiler:
+    """
+    Samples the instrumented thread's Python stack from a background thread every `interval`
+    seconds and counts the stacks per step phase, in the collapsed format flame graph tools read.
+    """
+
+    def __init__(self, instrumentation, interval=0.005, max_depth=64):
+        self.instrumentation = instrumentation
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.target = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__run__, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def __run__(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            phase = self.instrumentation.phase or "idle"
+            self.samples[(phase,) + tuple(reversed(stack))] += 1
+
+    def collapsed(self):
+        return [";".join(stack) + f" {count}" for stack, count in self.samples.most_common()]
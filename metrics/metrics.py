@@ -1,5 +1,7 @@
 from collections import defaultdict
 
+from metrics.histogram import WaitTimeHistogram
+
 
 class PrioritisedTaskTime:
     def __init__(self, priority_scale=None):
@@ -11,15 +13,77 @@ class PrioritisedTaskTime:
         self.priority_scale = priority_scale
         self.priority_task_completed = defaultdict(int)
         self.priority_task_time = defaultdict(int)
+        # Reporters read the averages every step, they only change when a task is completed
+        self.avg_wait_time = None
+        # Wait time distribution per priority, for tail latency at constant memory
+        self.wait_histograms = defaultdict(WaitTimeHistogram)
 
     def process_completed_task(self, task):
         self.tasks_completed += 1
         self.prioritised_time += task.time_waiting * self.priority_scale[task.priority]
         self.priority_task_completed[task.priority] += 1
         self.priority_task_time[task.priority] += task.time_waiting
+        self.wait_histograms[task.priority].record(task.time_waiting)
+        self.avg_wait_time = None
 
     def get_score(self):
         return self.prioritised_time
 
     def get_avg_wait_time(self):
-        return {p: time/self.priority_task_completed[p] for p, time in self.priority_task_time.items()}
\ No newline at end of file
+        if self.avg_wait_time is None:
+            self.avg_wait_time = {
+                p: time/self.priority_task_completed[p] for p, time in self.priority_task_time.items()
+            }
+        return self.avg_wait_time
+
+    def get_wait_histogram(self, priority=None):
+        # Histogram of one priority's wait times, or of every priority merged
+        if priority is not None:
+            return self.wait_histograms[priority]
+        merged = WaitTimeHistogram()
+        for histogram in self.wait_histograms.values():
+            merged.merge(histogram)
+        return merged
+
+    def get_wait_percentiles(self, percentiles=(50, 95, 99)):
+        return {p: histogram.percentiles(percentiles) for p, histogram in sorted(self.wait_histograms.items())}
+
+    def merge(self, other):
+        # Fold in the results of another run, e.g. a replicate with a different seed
+        self.tasks_completed += other.tasks_completed
+        self.prioritised_time += other.prioritised_time
+        for p in other.priority_task_completed:
+            self.priority_task_completed[p] += other.priority_task_completed[p]
+            self.priority_task_time[p] += other.priority_task_time[p]
+        for p, histogram in other.wait_histograms.items():
+            self.wait_histograms[p].merge(histogram)
+        self.avg_wait_time = None
+        return self
+
+    def to_dict(self):
+        return {
+            "priority_scale": self.priority_scale,
+            "tasks_completed": self.tasks_completed,
+            "prioritised_time": self.prioritised_time,
+            "priorities": {
+                p: {
+                    "completed": self.priority_task_completed[p],
+                    "time": self.priority_task_time[p],
+                    "histogram": self.wait_histograms[p].to_dict(),
+                }
+                for p in self.priority_task_completed
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        # JSON turns the integer priorities into strings, so they are converted back here
+        score = cls({int(p): scale for p, scale in data["priority_scale"].items()})
+        score.tasks_completed = data["tasks_completed"]
+        score.prioritised_time = data["prioritised_time"]
+        for p, priority in data["priorities"].items():
+            p = int(p)
+            score.priority_task_completed[p] = priority["completed"]
+            score.priority_task_time[p] = priority["time"]
+            score.wait_histograms[p] = WaitTimeHistogram.from_dict(priority["histogram"])
+        return score
@@ -0,0 +1,151 @@
+import numpy as np
+
+
+class Column:
+    """
+    Samples of one reporter with the steps they were taken at. Values go into fixed size numpy
+    chunks, or with a capacity into a ring buffer that keeps only the latest samples.
+    """
+
+    def __init__(self, chunk_size=1024, capacity=None, dtype=np.float64):
+        self.size = capacity if capacity is not None else chunk_size
+        self.capacity = capacity
+        self.dtype = dtype
+        self.chunks = []
+        self.step_chunks = []
+        self.count = 0
+
+    def __len__(self):
+        return self.count if self.capacity is None else min(self.count, self.capacity)
+
+    def append(self, step, value):
+        offset = self.count % self.size
+        if not self.chunks or (offset == 0 and self.capacity is None):
+            # The value's shape is only known at the first sample
+            value = np.asarray(value, dtype=self.dtype)
+            self.chunks.append(np.empty((self.size,) + value.shape, dtype=self.dtype))
+            self.step_chunks.append(np.empty(self.size, dtype=np.int64))
+        self.chunks[-1][offset] = value
+        self.step_chunks[-1][offset] = step
+        self.count += 1
+
+    def __ordered__(self, chunks, dtype):
+        if not chunks:
+            return np.empty(0, dtype=dtype)
+        if self.capacity is not None:
+            ring = chunks[0]
+            if self.count <= self.capacity:
+                return ring[:self.count].copy()
+            offset = self.count % self.capacity
+            return np.concatenate([ring[offset:], ring[:offset]])
+        tail = self.count - (len(chunks) - 1) * self.size
+        return np.concatenate(chunks[:-1] + [chunks[-1][:tail]])
+
+    def values(self):
+        return self.__ordered__(self.chunks, self.dtype)
+
+    def steps(self):
+        return self.__ordered__(self.step_chunks, np.int64)
+
+
+def vehicle_positions(model):
+    # (n, 2) array of vehicle positions, read straight from the fleet engine's arrays when it runs one
+    schedule_pos = getattr(model.schedule, "pos", None)
+    if schedule_pos is not None:
+        return schedule_pos
+    return np.array([agent.pos for agent in model.agents], dtype=np.int64).reshape(-1, 2)
+
+
+class MetricsRecorder:
+    """
+    Headless replacement for mesa's DataCollector. Every model reporter is sampled on its own
+    interval into numpy columns, and vehicle positions are captured as one (n, 2) array per
+    sample rather than one Python value per agent and reporter.
+
+    Reporters are given like DataCollector's, as attribute names or functions of the model.
+    intervals maps reporter names, and "positions" for the vehicle positions, to their own
+    sampling interval, reporters not listed use interval. An interval of 0 disables a reporter.
+    """
+
+    def __init__(self, model_reporters, interval=1, intervals=None, capacity=None, chunk_size=1024):
+        self.reporters = {}
+        self.intervals = {}
+        intervals = intervals or {}
+        for name, reporter in model_reporters.items():
+            if isinstance(reporter, str):
+                reporter = (lambda attribute: lambda m: getattr(m, attribute))(reporter)
+            self.reporters[name] = reporter
+        for name in list(self.reporters) + ["positions"]:
+            self.intervals[name] = intervals.get(name, interval)
+        self.columns = {
+            name: Column(chunk_size, capacity) for name in self.reporters if self.intervals[name]
+        }
+        self.positions = Column(chunk_size, capacity, dtype=np.int32) if self.intervals["positions"] else None
+        self.agent_ids = None
+
+    def collect(self, model):
+        step = model.schedule.steps
+        for name, column in self.columns.items():
+            if step % self.intervals[name] == 0:
+                value = self.reporters[name](model)
+                column.append(step, np.nan if value is None else value)
+        if self.positions is not None and step % self.intervals["positions"] == 0:
+            if self.agent_ids is None:
+                self.agent_ids = np.array([agent.unique_id for agent in model.agents], dtype=np.int64)
+            self.positions.append(step, vehicle_positions(model))
+
+    def get_model_vars(self):
+        # name -> (steps, values) for every model reporter
+        return {name: (column.steps(), column.values()) for name, column in self.columns.items()}
+
+    def get_positions(self):
+        # Sampled steps and a (samples, vehicles, 2) array of positions, vehicles ordered as agent_ids
+        return self.positions.steps(), self.positions.values()
+
+    def model_table(self):
+        # One row per sampled step, NaN where a reporter was not sampled at that step
+        series = self.get_model_vars()
+        steps = np.unique(np.concatenate([s for s, _ in series.values()] + [np.empty(0, dtype=np.int64)]))
+        table = {"step": steps}
+        for name, (s, values) in series.items():
+            column = np.full(len(steps), np.nan)
+            column[np.searchsorted(steps, s)] = values
+            table[name] = column
+        return table
+
+    def agent_table(self):
+        # Long format positions, one row per vehicle and sampled step
+        steps, positions = self.get_positions()
+        n = 0 if self.agent_ids is None else len(self.agent_ids)
+        positions = positions.reshape(len(steps), n, 2)
+        return {
+            "step": np.repeat(steps, n),
+            "agent_id": np.tile(self.agent_ids, len(steps)) if n else np.empty(0, dtype=np.int64),
+            "x": positions[..., 0].ravel(),
+            "y": positions[..., 1].ravel(),
+        }
+
+    def get_model_vars_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.model_table()).set_index("step")
+
+    def get_agent_vars_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.agent_table()).set_index(["step", "agent_id"])
+
+    def save_npz(self, path):
+        arrays = {}
+        for name, (steps, values) in self.get_model_vars().items():
+            arrays[name] = values
+            arrays[name + "_steps"] = steps
+        if self.positions is not None:
+            arrays["positions_steps"], arrays["positions"] = self.get_positions()
+            arrays["agent_ids"] = self.agent_ids if self.agent_ids is not None else np.empty(0, dtype=np.int64)
+        np.savez_compressed(path, **arrays)
+
+    def save_parquet(self, path, agent_path=None):
+        # Model reporters go to path, vehicle positions in long format to agent_path if given
+        import pandas as pd
+        pd.DataFrame(self.model_table()).to_parquet(path)
+        if agent_path is not None and self.positions is not None:
+            pd.DataFrame(self.agent_table()).to_parquet(agent_path)
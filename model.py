@@ -1,15 +1,27 @@
+import contextlib
 import sys
 from typing import Tuple
 
 import numpy as np
 from mesa import Model, Agent
 from mesa.datacollection import DataCollector
-from mesa.space import MultiGrid
 from mesa.time import RandomActivation
 from scipy.signal import convolve2d
 import task_allocation
 from agents import Car, Truck, Warehouse
+from fleet import FleetEngine
+from job_pool import JobPool
+from job_sources import PreloadedJobs
+from map_io import load_map
+from occupancy import OccupancyGrid
+from metrics.instrumentation import Instrumentation, reporters
 from metrics.metrics import PrioritisedTaskTime
+from metrics.recorder import MetricsRecorder
+from path_planning.DistanceField import DistanceFieldCache, NearestSourceIndex
+from path_planning.HPAStar import HPAStar
+from path_planning.JPS import JPSPlus
+from path_planning.DStarLite import DStarLiteCache
+from path_planning.Reservation import ReservationTable
 
 
 class Job:
@@ -50,17 +62,30 @@ class Job:
 
 
 class Obstacle(Agent):
+    # Not placed on the grid, renderers portray the obstacle bitmap through it
     def __init__(self, pos):
         self.pos = pos
 
 
-def generate_map(obstacle_map):
-    with open(obstacle_map) as f:
-        lines = [line.rstrip() for line in f]
-        lines = lines[4:]
-        lines = [[0 if c == "." else 1 for c in line] for line in lines]
+MODEL_REPORTERS = {
+    "tasks_left": "tasks_left",
+    "Overall Wait Time": lambda m: m.score.get_score(),
+    "High": lambda m: m.score.get_avg_wait_time().get(1),
+    "Med": lambda m: m.score.get_avg_wait_time().get(2),
+    "Low": lambda m: m.score.get_avg_wait_time().get(3),
+}
+
+# Phases of DeliveryModel.step and the counters recorded when the model is instrumented
+STEP_PHASES = ["arrivals", "allocation", "schedule", "job_step", "collect"]
+STEP_COUNTERS = [
+    "allocations", "allocation_agents", "allocation_jobs", "paths_planned",
+    "astar_calls", "astar_expanded", "astar_fallbacks", "field_hits", "field_builds", "planner_expanded",
+]
+NO_TIMER = contextlib.nullcontext()
 
-    return np.array(lines, dtype=np.bool)
+
+def generate_map(obstacle_map):
+    return load_map(obstacle_map)
 
 
 class DeliveryModel(Model):
@@ -79,7 +104,21 @@ class DeliveryModel(Model):
             seed: int = 42,
             obstacle_map: str = "maps/random-32-32-20.map",
             allocation: str = "HungarianMethod",
-            collision=False
+            collision=False,
+            collision_avoidance: str = "probe",
+            reservation_window: int = 8,
+            field_cache_size: int = 64,
+            path_aware_allocation=False,
+            fleet_engine=False,
+            job_source=None,
+            metrics: str = "datacollector",
+            metrics_interval: int = 1,
+            metrics_intervals: dict = None,
+            metrics_capacity: int = None,
+            instrument=False,
+            profile_interval=None,
+            planner: str = "field",
+            cluster_size: int = 16
     ):
         if use_seed:
             self.random.seed(seed)
@@ -91,6 +130,14 @@ class DeliveryModel(Model):
         self.num_agents = agents
         self.agents = []
         self.collision = collision
+        # "probe" checks the next cell every step and diverts randomly, "reservation" plans
+        # every vehicle against a shared space-time reservation table instead
+        self.reservation_window = reservation_window
+        self.reservations = None
+        if collision and collision_avoidance == "reservation":
+            self.reservations = ReservationTable()
+        elif collision_avoidance not in ["probe", "reservation"]:
+            raise ValueError(f"Unknown collision avoidance {collision_avoidance}")
 
         self.allocation_flag = True
         self.allocator = getattr(
@@ -98,88 +145,253 @@ class DeliveryModel(Model):
             allocation
         )
         self.allocation = None
+        self.allocation_kwargs = {}
 
-        self.schedule = RandomActivation(self)
-        self.grid = MultiGrid(space_size, space_size, torus=False)
+        # The array-based fleet engine does not model collisions
+        if fleet_engine and collision:
+            raise ValueError("The fleet engine only supports collision=False")
+        self.schedule = FleetEngine(self) if fleet_engine else RandomActivation(self)
 
         self.obstacle_matrix = generate_map(obstacle_map)
-        self.obstacles = self.__set_obstacle__()
+        # Obstacles only live in the bitmap, the grid indexes the entities placed on it
+        self.grid = OccupancyGrid(self.obstacle_matrix)
+        # Cells closed at runtime through set_obstacles, and jobs that arrived on one of them
+        self.closures = set()
+        self.deferred_jobs = []
+        self.distance_fields = DistanceFieldCache(self.obstacle_matrix, maxsize=field_cache_size)
+        # Vehicle paths come from exact distance fields by default, "hpa" plans on a cluster
+        # abstraction instead and refines the path as the vehicle moves along it, "jps" searches
+        # the full grid with jump tables built once per map, and "dstar" keeps a D* Lite search per
+        # target that is repaired rather than rerun when set_obstacles changes the map
+        if planner == "field":
+            self.planner = self.distance_fields
+        elif planner == "hpa":
+            self.planner = HPAStar(self.obstacle_matrix, cluster_size=cluster_size)
+        elif planner == "jps":
+            self.planner = JPSPlus(self.obstacle_matrix)
+        elif planner == "dstar":
+            self.planner = DStarLiteCache(self.obstacle_matrix, maxsize=field_cache_size)
+        else:
+            raise ValueError(f"Unknown planner {planner}")
+
+        # Per-phase timers and counters, optionally with a sampling profiler. Disabled, each phase
+        # costs one shared no-op context manager
+        self.instrumentation = None
+        if instrument or profile_interval:
+            self.instrumentation = Instrumentation(profile_interval)
+            fields = self.distance_fields
+            self.instrumentation.watch("field_hits", lambda: fields.hits)
+            self.instrumentation.watch("field_builds", lambda: fields.misses)
+            self.instrumentation.watch("astar_fallbacks", lambda: fields.fallbacks)
+            # astar_calls and astar_expanded count the reservation planner's cooperative A*, the
+            # searching planners keep their own cumulative expansion counts
+            if self.planner is not self.distance_fields:
+                planner = self.planner
+                self.instrumentation.watch("planner_expanded", lambda: planner.expanded)
+        if path_aware_allocation:
+            self.allocation_kwargs["distance_fields"] = self.distance_fields
         self.__set_up__(agents, warehouses, split)
+        if self.reservations is not None:
+            for agent in self.agents:
+                self.reservations.reserve_path(agent, agent.pos, [], 0, hold=reservation_window // 2)
 
-        self.hidden_tasks = self.__preload_jobs__()
-        # self.available_tasks = self.__add_jobs__(min(2*agents, jobs))
-        self.available_tasks = self.__add_jobs__(min(10, jobs))
-
-
+        # Jobs are revealed by the source as they arrive, preloaded up front by default
+        self.job_source = job_source if job_source is not None else PreloadedJobs()
+        self.tasks_left = self.job_source.bind(self, jobs)
+        self.available_tasks = JobPool()
+        self.available_tasks.extend(self.__add_jobs__(self.job_source.release(self, 0)))
 
         self.task_allocator = None
         self.score = PrioritisedTaskTime()
 
-        self.datacollector = DataCollector(
-            {
-                "tasks_left": "tasks_left",
-                "Overall Wait Time": lambda m: m.score.get_score(),
-                "High": lambda m: m.score.get_avg_wait_time().get(1),
-                "Med": lambda m: m.score.get_avg_wait_time().get(2),
-                "Low": lambda m: m.score.get_avg_wait_time().get(3),
-             },
-            {"x": lambda a: a.pos[0], "y": lambda a: a.pos[1]},
-        )
+        # The web UI charts read mesa's DataCollector, headless runs can record into numpy columns
+        # every metrics_interval steps instead (metrics_intervals overrides it per reporter and
+        # metrics_capacity keeps only the latest samples), or collect nothing at all with metrics=None
+        self.datacollector = None
+        self.recorder = None
+        model_reporters = MODEL_REPORTERS
+        if self.instrumentation is not None:
+            model_reporters = {**MODEL_REPORTERS, **reporters(STEP_PHASES, STEP_COUNTERS)}
+        if metrics == "datacollector":
+            self.datacollector = DataCollector(
+                model_reporters,
+                {"x": lambda a: a.pos[0], "y": lambda a: a.pos[1]},
+            )
+        elif metrics == "recorder":
+            self.recorder = MetricsRecorder(
+                model_reporters,
+                interval=metrics_interval,
+                intervals=metrics_intervals,
+                capacity=metrics_capacity
+            )
+        elif metrics is not None:
+            raise ValueError(f"Unknown metrics collection {metrics}")
 
         self.running = True
-        self.datacollector.collect(self)
+        self.__collect__()
 
-    def __preload_jobs__(self):
-        jobs = []
-        samples = self.random.choices(list(self.grid.empties), k=self.tasks_left)
-
-        for sample in samples:
-            i, j = sample
-            job = Job((i, j), self.random.randint(1, 9), self.random.randint(1, 3), self)
-            jobs.append(job)
-        return jobs
+    def create_job(self, pos, value, priority):
+        return Job(pos, value, priority, self)
 
     def find_closest_warehouse(self, pos):
-        min_dist = np.inf
-        closest = None
-        for w in self.warehouses:
-            dist = np.sum(np.abs(np.array(w.pos) - np.array(pos)))
-            if dist < min_dist:
-                min_dist = dist
-                closest = w
+        closest = self.warehouse_index.nearest(pos)
+        if closest is None:
+            # No warehouse can be reached from pos, fall back to the nearest by Manhattan distance
+            closest = min(
+                self.warehouses,
+                key=lambda w: abs(w.pos[0] - pos[0]) + abs(w.pos[1] - pos[1]),
+                default=None
+            )
         return closest
 
-    def step(self):
-        # if len(self.available_tasks) < 2*self.num_agents and self.tasks_left > len(self.available_tasks):
-        if len(self.available_tasks) < 10 and self.tasks_left > len(self.available_tasks):
-            self.available_tasks += self.__add_jobs__(self.num_agents - len(self.available_tasks))
-
-        if self.allocation_flag:
-            self.allocation_flag = False
-            self.allocation = self.allocator(
-                self.random,
-                self.agents,
-                self.available_tasks
-            ).get_allocation()
-
-        self.schedule.step()
-
-        for j in self.available_tasks:
-            j.step()
+    def add_warehouse(self, pos):
+        warehouse = Warehouse(pos)
+        self.grid.place_agent(warehouse, pos)
+        self.warehouses.append(warehouse)
+        self.warehouse_index.add(pos, warehouse)
+        return warehouse
+
+    def remove_warehouse(self, warehouse):
+        self.warehouses.remove(warehouse)
+        self.warehouse_index.remove(warehouse)
+        self.grid.remove_agent(warehouse)
+        # Vehicles heading there pick the nearest remaining warehouse on their next step
+        for agent in self.agents:
+            if agent.target is warehouse:
+                agent.target = None
+                if isinstance(self.schedule, FleetEngine):
+                    self.schedule.release(agent)
+
+    def set_obstacles(self, cells, blocked=True):
+        # Close road cells at runtime, or reopen them with blocked=False. The distance fields, the
+        # warehouse index and the planner are repaired for the cells that actually flipped, and
+        # vehicles whose remaining path crosses a closed cell replan. Returns the flipped cells
+        cells = list(dict.fromkeys((int(x), int(y)) for x, y in cells))
+        outside = [cell for cell in cells if self.grid.out_of_bounds(cell)]
+        if outside:
+            raise ValueError(f"Cells {outside} are outside the map")
+        if blocked:
+            # The fleet engine only has targets once it has started, and a job completed this tick
+            # keeps its vehicles until the next one although it has left the grid
+            if isinstance(self.schedule, FleetEngine):
+                heading = getattr(self.schedule, "targets", None) or []
+            else:
+                heading = [agent.target for agent in self.agents]
+            targets = {tuple(w.pos) for w in self.warehouses} | {tuple(job.pos) for job in self.available_tasks}
+            targets |= {tuple(target.pos) for target in heading if target is not None and target.pos is not None}
+            taken = [cell for cell in cells if cell in targets]
+            if taken:
+                raise ValueError(f"Cells {taken} hold a warehouse, a job or a vehicle's target")
+        changed = [cell for cell in cells if self.obstacle_matrix[cell] != blocked]
+        if not changed:
+            return []
+        if blocked:
+            self.closures.update(changed)
+        else:
+            self.closures.difference_update(changed)
+
+        # Copy on write, so the flat A* graphs cached for the old matrix stay consistent with it
+        obstacles = self.obstacle_matrix.copy()
+        for cell in changed:
+            obstacles[cell] = blocked
+        self.obstacle_matrix = obstacles
+        self.grid.set_obstacles(obstacles)
+        self.distance_fields.update(obstacles, changed)
+        self.warehouse_index.update(obstacles, changed)
+        if self.planner is not self.distance_fields:
+            self.planner.update(obstacles, changed)
+
+        # Paths only have to change where they cross a closure, except after HPA* rebuilt its abstraction
+        if isinstance(self.planner, HPAStar):
+            self.__replan__(None)
+        elif blocked:
+            self.__replan__(set(changed))
+        if not blocked and self.deferred_jobs:
+            released = [job for job in self.deferred_jobs if tuple(job.pos) not in self.closures]
+            if released:
+                self.deferred_jobs = [job for job in self.deferred_jobs if tuple(job.pos) in self.closures]
+                self.available_tasks.extend(self.__add_jobs__(released))
+                self.allocation_flag = True
+        return changed
+
+    def __replan__(self, closed):
+        if isinstance(self.schedule, FleetEngine):
+            self.schedule.replan(closed)
+            return
+        for agent in self.agents:
+            if agent.target is None:
+                continue
+            if self.reservations is not None:
+                # The next reserved move plans again from the agent's cell
+                if agent.plan and (closed is None or any(tuple(cell) in closed for cell in agent.plan)):
+                    agent.plan = None
+            elif agent.pathing and (closed is None or any(tuple(cell) in closed for cell in agent.pathing)):
+                agent.pathing = self.plan_path(agent.pos, agent.target.pos)[1:]
+
+    def plan_path(self, start, goal):
+        if self.instrumentation is not None:
+            self.instrumentation.count("paths_planned")
+        return self.planner.path(start, goal)
+
+    def __phase__(self, name):
+        return NO_TIMER if self.instrumentation is None else self.instrumentation.time(name)
 
-        self.datacollector.collect(self)
+    def step(self):
+        with self.__phase__("arrivals"):
+            new_jobs = self.__add_jobs__(self.job_source.release(self, self.schedule.steps + 1))
+            self.available_tasks.extend(new_jobs)
+            if new_jobs and self.job_source.reallocate_on_arrival:
+                self.allocation_flag = True
+
+        with self.__phase__("allocation"):
+            if self.allocation_flag and len(self.available_tasks) == 0:
+                # Nothing to allocate until more jobs arrive, vehicles without a target wait
+                self.allocation = {}
+            elif self.allocation_flag:
+                self.allocation_flag = False
+                if self.instrumentation is not None:
+                    self.instrumentation.count("allocations")
+                    self.instrumentation.count("allocation_agents", len(self.agents))
+                    self.instrumentation.count("allocation_jobs", len(self.available_tasks))
+                if self.task_allocator is not None and self.task_allocator.incremental:
+                    self.task_allocator.reallocate(self.agents, self.available_tasks)
+                else:
+                    self.task_allocator = self.allocator(
+                        self.random,
+                        self.agents,
+                        self.available_tasks,
+                        **self.allocation_kwargs
+                    )
+                self.allocation = self.task_allocator.get_allocation()
+
+        with self.__phase__("schedule"):
+            self.schedule.step()
+            if self.reservations is not None:
+                self.reservations.purge(self.schedule.steps)
+
+        with self.__phase__("job_step"):
+            # Completed jobs remove themselves from available_tasks, so iterate over a copy
+            for j in list(self.available_tasks):
+                j.step()
+
+        with self.__phase__("collect"):
+            if self.instrumentation is not None:
+                self.instrumentation.read_watched()
+            self.__collect__()
+        if self.instrumentation is not None:
+            self.instrumentation.end_tick()
         if self.tasks_left == 0:
             self.running = False
+            if self.instrumentation is not None:
+                self.instrumentation.close()
             print(self.score.get_score())
             print(self.score.get_avg_wait_time())
 
-    def __set_obstacle__(self):
-        obstacles = []
-        for i, j in zip(*np.where(self.obstacle_matrix == 1)):
-            obs = Obstacle((i, j))
-            obstacles.append(obs)
-            self.grid.place_agent(obs, (i, j))
-        return obstacles
+    def __collect__(self):
+        if self.datacollector is not None:
+            self.datacollector.collect(self)
+        elif self.recorder is not None:
+            self.recorder.collect(self)
 
     def __set_up__(self, agents, warehouses, split):
 
@@ -193,6 +405,11 @@ class DeliveryModel(Model):
             warehouse = Warehouse((i, j))
             self.grid.place_agent(warehouse, (i, j))
             self.warehouses.append(warehouse)
+        self.warehouse_index = NearestSourceIndex(
+            self.obstacle_matrix,
+            [w.pos for w in self.warehouses],
+            self.warehouses
+        )
 
         # Pick empty spots for agents
         samples = self.random.choices(list(self.grid.empties), k=agents)
@@ -209,9 +426,12 @@ class DeliveryModel(Model):
             self.schedule.add(agent)
             self.agents.append(agent)
 
-    def __add_jobs__(self, jobs):
-        new_jobs = self.hidden_tasks[:jobs]
-        self.hidden_tasks = self.hidden_tasks[jobs:]
+    def __add_jobs__(self, new_jobs):
+        # Preloaded and traced jobs keep the cells they were given, one arriving on a closed road
+        # waits until set_obstacles reopens it
+        if self.closures:
+            self.deferred_jobs += [job for job in new_jobs if tuple(job.pos) in self.closures]
+            new_jobs = [job for job in new_jobs if tuple(job.pos) not in self.closures]
         for job in new_jobs:
             job.is_available = True
             self.grid.place_agent(job, job.pos)
@@ -0,0 +1,105 @@
+import itertools
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=4)
+def multigrid_order(width, height):
+    # Flat ids of all cells in the order a fresh MultiGrid's empties set iterates them
+    order = np.fromiter(
+        (x * height + y for x, y in set(itertools.product(range(width), range(height)))),
+        dtype=np.int64,
+        count=width * height
+    )
+    order.flags.writeable = False
+    return order
+
+
+class OccupancyGrid:
+    """
+    Stands in for mesa's MultiGrid. Static obstacles are only a boolean bitmap, and everything
+    placed on the grid is kept in a sparse dict holding just the occupied cells, so memory and setup
+    time follow the number of entities rather than the map size.
+    """
+
+    def __init__(self, obstacles):
+        self.obstacles = np.asarray(obstacles, dtype=bool)
+        self.width, self.height = self.obstacles.shape
+        self.torus = False
+        self.cells = {}
+        self.cell_order = None
+        # Bumped whenever the obstacle bitmap is replaced, so views can tell the map changed
+        self.version = 0
+
+    def set_obstacles(self, obstacles):
+        self.obstacles = np.asarray(obstacles, dtype=bool)
+        self.cell_order = None
+        self.version += 1
+
+    def out_of_bounds(self, pos):
+        x, y = pos
+        return x < 0 or x >= self.width or y < 0 or y >= self.height
+
+    def is_blocked(self, pos):
+        return bool(self.obstacles[pos[0], pos[1]])
+
+    def place_agent(self, agent, pos):
+        pos = tuple(pos)
+        self.cells.setdefault(pos, []).append(agent)
+        agent.pos = pos
+
+    def __remove__(self, agent, pos):
+        contents = self.cells[pos]
+        contents.remove(agent)
+        if not contents:
+            del self.cells[pos]
+
+    def remove_agent(self, agent):
+        self.__remove__(agent, agent.pos)
+        agent.pos = None
+
+    def move_agent(self, agent, pos):
+        self.__remove__(agent, agent.pos)
+        self.place_agent(agent, pos)
+
+    def iter_cell_list_contents(self, cell_list):
+        # Takes one position or a list of them, like MultiGrid
+        if isinstance(cell_list, tuple) and len(cell_list) == 2:
+            cell_list = [cell_list]
+        for pos in cell_list:
+            yield from self.cells.get(tuple(pos), ())
+
+    def get_cell_list_contents(self, cell_list):
+        return list(self.iter_cell_list_contents(cell_list))
+
+    def is_cell_empty(self, pos):
+        return not self.is_blocked(pos) and tuple(pos) not in self.cells
+
+    def get_neighborhood(self, pos, moore, include_center=False, radius=1):
+        # Same cells, in the same sorted order, as MultiGrid.get_neighborhood without a torus
+        x, y = pos
+        neighborhood = []
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                if dx == 0 and dy == 0 and not include_center:
+                    continue
+                if not moore and abs(dx) + abs(dy) > radius:
+                    continue
+                coord = (x + dx, y + dy)
+                if not self.out_of_bounds(coord):
+                    neighborhood.append(coord)
+        return neighborhood
+
+    def iter_neighborhood(self, pos, moore, include_center=False, radius=1):
+        yield from self.get_neighborhood(pos, moore, include_center, radius)
+
+    @property
+    def empties(self):
+        # Free cells with nothing on them. They are listed in the order MultiGrid's empties set
+        # iterates them, so seeded runs sample the same cells as they did on a MultiGrid.
+        if self.cell_order is None:
+            order = multigrid_order(self.width, self.height)
+            self.cell_order = order[~self.obstacles.ravel()[order]]
+        xs, ys = np.divmod(self.cell_order, self.height)
+        return [cell for cell in zip(xs.tolist(), ys.tolist()) if cell not in self.cells]
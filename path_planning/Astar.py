@@ -1,6 +1,6 @@
 from queue import PriorityQueue
 from collections import deque
-import itertools
+from heapq import heappush, heappop
 import numpy as np
 
 
@@ -46,46 +46,102 @@ def astar(env, start, goal, constraint_fn=lambda node, lastnode, t: True, return
         return construct_path(prevmap, best[0])
 
 
-def astar_multi(env, starts, goals, constraint_fn=lambda node, lastnode, t: True):
+def astar_multi(env, starts, goals, constraint_fn=None, independence=True):
+    # Optimal joint plan in which no two agents share a cell, as one path per agent. Agents are
+    # first planned in groups of one, and two groups are merged and planned jointly only when
+    # their paths collide (independence detection). constraint_fn(nodes, lastnodes, t) sees every
+    # agent at once, so passing one plans all agents as a single group
+    starts = [tuple(start) for start in starts]
+    goals = [tuple(goal) for goal in goals]
+    if constraint_fn is not None or not independence:
+        return astar_joint(env, starts, goals, constraint_fn)
+    groups = [[agent] for agent in range(len(starts))]
+    paths = [None] * len(starts)
+    for group in groups:
+        if not plan_group(env, group, starts, goals, paths):
+            return None
+    while True:
+        conflict = first_conflict(paths, groups)
+        if conflict is None:
+            return pad_paths(paths)
+        a, b = conflict
+        merged = sorted(groups[a] + groups[b])
+        groups = [group for k, group in enumerate(groups) if k not in conflict] + [merged]
+        if not plan_group(env, merged, starts, goals, paths):
+            return None
+
+
+def plan_group(env, group, starts, goals, paths):
+    group_paths = astar_joint(env, [starts[a] for a in group], [goals[a] for a in group])
+    if group_paths is None:
+        return False
+    for agent, path in zip(group, group_paths):
+        paths[agent] = path
+    return True
+
+
+def pad_paths(paths):
+    # Agents wait on their last cell until the longest path ends
+    T = max(len(path) for path in paths)
+    return [path + [path[-1]] * (T - len(path)) for path in paths]
+
+
+def first_conflict(paths, groups):
+    # Indices of the first two groups whose agents share a cell at the same time, None if there are none
+    group_of = {agent: k for k, group in enumerate(groups) for agent in group}
+    padded = pad_paths(paths)
+    for t in range(len(padded[0])):
+        occupied = {}
+        for agent, path in enumerate(padded):
+            other = occupied.setdefault(path[t], agent)
+            if other != agent:
+                return group_of[other], group_of[agent]
+    return None
+
+
+def astar_joint(env, starts, goals, constraint_fn=None):
+    # Joint A* with operator decomposition: within a timestep the agents move one at a time, so a
+    # node has at most one child per move of a single agent instead of the product over all agents.
+    # A state is the agents' cells and how many have moved this step; with a constraint_fn it also
+    # keeps the cells the step started from, which the constraints are checked against
     starts = tuple(starts)
     goals = tuple(goals)
-    pq = PriorityQueue()
-    cost = 0.0
-    t = 0.0
-    heur = sum([env.estimate(start, goal, t) for start, goal in zip(starts, goals)])
-    costmap = {starts: cost}
-    prevmap = {starts: None}
-    pq.put((heur + cost, starts, t))
-    while not pq.empty():
-        totcost, curr, t = pq.get()
-        at_goal = all([node == goal for node, goal in zip(curr, goals)])
-        if at_goal:
-            return construct_path_multi(prevmap, curr)
-        transitions = [env.next(node, t) for node in curr]
-        children = [[t[0] for t in node] for node in transitions]
-        step_costs = [[t[1] for t in node] for node in transitions]
-        children_combined = combine_actions(children)
-        step_costs_combined = combine_actions(step_costs)
-        for child, step_cost in zip(children_combined, step_costs_combined):
-            if len(set(child)) < len(child):  # skip if there is a collision
-                continue
-            child_t = t + 1
-            if not constraint_fn(child, curr, child_t):
+    n = len(starts)
+    root = (starts, 0, None)
+    costmap = {root: 0.0}
+    prevmap = {root: None}
+    pq = [joint_estimate(env, starts, 0, goals, 0) + (0.0, root, 0)]
+    while pq:
+        _, _, cost, state, t = heappop(pq)
+        cost = -cost
+        if cost > costmap[state]:
+            continue
+        nodes, moved, base = state
+        if moved == 0 and nodes == goals:
+            return construct_path_joint(prevmap, state)
+        if moved == 0 and constraint_fn is not None:
+            base = nodes
+        for child, step_cost in env.next(nodes[moved], t):
+            if child in nodes[:moved]:  # skip if there is a collision
                 continue
-            child_cost = costmap.get(curr, float('inf')) + sum(step_cost)
-            if child_cost < costmap.get(child, float('inf')):
-                prevmap[child] = curr
-                costmap[child] = child_cost
-                child_totcost = sum(
-                    [env.estimate(child_i, goal_i, child_t) for child_i, goal_i in zip(child, goals)]) + child_cost
-                pq.put((child_totcost, child, child_t))
+            child_nodes = nodes[:moved] + (child,) + nodes[moved + 1:]
+            child_state = (child_nodes, moved + 1, base)
+            child_t = t
+            if moved + 1 == n:
+                child_t = t + 1
+                child_state = (child_nodes, 0, None)
+                if constraint_fn is not None and not constraint_fn(child_nodes, base, child_t):
+                    continue
+            child_cost = cost + step_cost
+            if child_cost < costmap.get(child_state, float('inf')):
+                prevmap[child_state] = state
+                costmap[child_state] = child_cost
+                heur, remaining = joint_estimate(env, child_nodes, child_state[1], goals, child_t)
+                # Among equal f, states whose agents are closer to their goals go first
+                heappush(pq, (heur + child_cost, remaining, -child_cost, child_state, child_t))
     return None
 
 
-def combine_actions(node_list):
-    return itertools.product(*node_list)
-
-
 def construct_path(prevmap, node):
     seq = deque([node])
     while prevmap[node] != None:
@@ -95,13 +151,27 @@ def construct_path(prevmap, node):
     return list(seq)
 
 
-def construct_path_multi(prevmap, nodes):
-    seqs = [deque([node]) for node in nodes]
-    while prevmap[nodes] != None:
-        prevs = prevmap[nodes]
-        for i, prev in enumerate(prevs):
-            seqs[i].appendleft(prev)
-        nodes = prevs
+def joint_estimate(env, nodes, moved, goals, t):
+    # Every agent pays for every timestep, waiting on its goal included, so the joint cost is the
+    # number of agents times the makespan. The makespan is at least the slowest agent's estimate,
+    # and the agents that have already moved are one timestep further along. Also returns the sum
+    # of the agents' estimates, to break ties between equal bounds
+    n = len(nodes)
+    estimates = [env.estimate(node, goal, t) for node, goal in zip(nodes, goals)]
+    ahead = max(estimates[moved:], default=0)
+    if moved:
+        ahead = max([ahead - 1] + estimates[:moved])
+    return n * ahead + (n - moved if moved else 0), sum(estimates)
+
+
+def construct_path_joint(prevmap, state):
+    # Per-agent paths through the states that completed a timestep
+    seqs = [deque() for _ in state[0]]
+    while state is not None:
+        if state[1] == 0:
+            for i, node in enumerate(state[0]):
+                seqs[i].appendleft(node)
+        state = prevmap[state]
     return [list(seq) for seq in seqs]
 
 
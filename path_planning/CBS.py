@@ -1,4 +1,10 @@
 from path_planning.Astar import *
+from path_planning.DistanceField import bfs
+from path_planning.FastAstar import get_graph
+from path_planning.Grid import Grid
+from heapq import heappush, heappop
+import itertools
+import time
 from queue import PriorityQueue
 import numpy as np
 
@@ -12,7 +18,7 @@ def cbs(env, starts, goals):
     pq.put_nowait((root_cost, root.depth, root))
     while not pq.empty():
         cost, _, x = pq.get_nowait()
-        conflict = find_conflict(x.solution)
+        conflict = find_conflict(x.positions)
         if conflict is None:
             return x.solution
         else:
@@ -44,6 +50,7 @@ class Constraint:
         self.transition_constraints = {}
         self.children = []
         self.solution = None
+        self.positions = None
         self.cost = None
         self.depth = 0
         self.T = 0
@@ -104,35 +111,311 @@ class Constraint:
                              constraint_fn=self.get_constraint_fn(agent), start_t=start_t, T=self.T)
             paths[agent] = paths[agent] + hold_path[1:]
         self.solution = paths
+        self.positions = solution_array(paths)
         self.cost = costs
 
 
+def solution_array(paths):
+    # Padded (agents x T x 2) integer array of positions, agents wait on their last cell
+    T = max(len(path) for path in paths)
+    positions = np.empty((len(paths), T, 2), dtype=np.int64)
+    for agent, path in enumerate(paths):
+        positions[agent, :len(path)] = path
+        positions[agent, len(path):] = path[-1]
+    return positions
+
+
 def find_conflict(paths):
-    maxlength = min(map(lambda path: len(path) if path is not None else 0, paths))
-    last_states = {}
-    for t in range(maxlength):
-        # Check collisions
-        states = {}
-        for agent in range(len(paths)):
-            if paths[agent] is None:
+    # Accepts a list of paths or a solution_array. Conflict times are found with NumPy on flat cell ids,
+    # then the earliest timestep is resolved exactly like the original per-timestep scan.
+    if isinstance(paths, np.ndarray):
+        positions = paths
+    else:
+        if len(paths) == 0 or any(path is None for path in paths):
+            return None
+        # Only the common prefix of the paths is checked
+        maxlength = min(len(path) for path in paths)
+        positions = solution_array([path[:maxlength] for path in paths])
+    if positions.shape[0] == 0 or positions.shape[1] == 0:
+        return None
+
+    width = int(positions[..., 1].max()) + 1
+    ids = positions[..., 0] * width + positions[..., 1]
+    times = conflict_times(ids)
+    if times.size == 0:
+        return None
+    return _conflict_at(positions, int(times[0]))
+
+
+def conflict_times(ids):
+    # Timesteps with a vertex or swap conflict in an (agents x T) array of non-negative cell ids
+    cells = int(ids.max()) + 1
+    T = ids.shape[1]
+
+    # Vertex conflicts: a repeated cell id in a timestep column
+    ordered = np.sort(ids, axis=0)
+    vertex = np.any(ordered[1:] == ordered[:-1], axis=0)
+
+    # Swap conflicts: two agents crossing the same edge in one timestep. Crossing it in the same
+    # direction is already a vertex conflict, so a repeated undirected edge key is enough.
+    swap = np.zeros(T, dtype=bool)
+    if T > 1:
+        last, curr = ids[:, :-1], ids[:, 1:]
+        edges = np.minimum(last, curr) * cells + np.maximum(last, curr)
+        # Agents that wait get a distinct negative key so they never match
+        waiting = np.broadcast_to(-1 - np.arange(ids.shape[0], dtype=np.int64)[:, None], edges.shape)
+        edges = np.where(last != curr, edges, waiting)
+        ordered = np.sort(edges, axis=0)
+        swap[1:] = np.any(ordered[1:] == ordered[:-1], axis=0)
+    return np.flatnonzero(vertex | swap)
+
+
+def _conflict_at(positions, t):
+    states = {}
+    for agent in range(positions.shape[0]):
+        node = tuple(positions[agent, t].tolist())
+        if node in states:
+            other_agent = states[node]
+            return {'agent1': agent, 'agent2': other_agent, 't': t, 'node': node, 'transition': False}
+        states[node] = agent
+    last_states = {tuple(positions[agent, t - 1].tolist()): agent for agent in range(positions.shape[0])}
+    for node, agent in states.items():
+        if node in last_states:  # if agent has moved into a spot that was just occupied, get the other agent who just moved out
+            other_agent = last_states[node]
+            if other_agent != agent:
+                last_node = tuple(positions[agent, t - 1].tolist())
+                if tuple(positions[other_agent, t].tolist()) == last_node:  # if the agent's last spot is now occupied by that other agent, it's a swap
+                    return {'agent1': agent, 'agent2': other_agent, 't': t, 'node': node, 'lastnode': last_node,
+                            'transition': True}
+    return None
+
+
+def icbs(env, starts, goals, max_probe=4, max_nodes=10000, max_bypasses=64, time_limit=1.0):
+    # Improved CBS: children copy the parent's paths and only replan the newly constrained agent,
+    # low-level ties are broken with a conflict avoidance table, and conflicts are prioritised
+    # (cardinal, then semi-cardinal) with bypasses taken when a replan removes conflicts at no cost.
+    # Unlike cbs the plan is optimal, which agents swapping places in a corridor can make very
+    # expensive. After max_nodes expansions or time_limit seconds (None for no limit) the search
+    # hands the instance to cbs, whose plan is conflict free but not necessarily optimal. Bypasses,
+    # which only reshuffle equal cost nodes there, stop after max_bypasses of them.
+    # Returns None when a goal cannot be reached, where cbs returns a partial plan.
+    started = time.perf_counter()
+    graph = get_graph(env)
+    starts = [graph.index(s) for s in starts]
+    goals = [graph.index(g) for g in goals]
+    heuristics = {}
+
+    def heuristic(goal):
+        if goal not in heuristics:
+            distance, _, _ = bfs(graph.grid, [graph.node(goal)])
+            heuristics[goal] = np.where(distance < 0, graph.grid.size, distance).tolist()
+        return heuristics[goal]
+
+    def replan(node, agent):
+        cat = ConflictAvoidanceTable(node.paths, exclude=agent)
+        return space_time_astar(graph, starts[agent], goals[agent], heuristic(goals[agent]),
+                                node.constraints[agent], node.transition_constraints[agent], cat)
+
+    root = ICBSNode(len(starts))
+    for agent in range(len(starts)):
+        path = replan(root, agent)
+        if path is None:
+            return None
+        root.set_path(agent, path)
+
+    pq = []
+    counter = itertools.count()
+    heappush(pq, (root.cost, root.count_conflicts(), next(counter), root))
+    expanded = bypasses = 0
+    while pq:
+        _, _, _, node = heappop(pq)
+        conflicts = node.find_conflicts()
+        if not conflicts:
+            return node.solution(graph)
+        expanded += 1
+        if (max_nodes is not None and expanded > max_nodes) or \
+                (time_limit is not None and time.perf_counter() - started > time_limit):
+            env = env if isinstance(env, Grid) else Grid(graph.grid)
+            return cbs(env, [graph.node(s) for s in starts], [graph.node(g) for g in goals])
+
+        # Probe conflicts until a cardinal one is found, remembering the children already built
+        bypass = None
+        best_children, best_increased = None, -1
+        for conflict in conflicts[:max_probe]:
+            children = [node.child(*constraint) for constraint in constraints_for(conflict)]
+            increased = 0
+            for child, agent in zip(children, (conflict['agent1'], conflict['agent2'])):
+                path = replan(child, agent)
+                child.set_path(agent, path)
+                if path is None or len(path) > len(node.paths[agent]):
+                    increased += 1
+                elif bypass is None and child.count_conflicts() < len(conflicts):
+                    bypass = (agent, path)
+            if increased == 0 and bypass is not None and bypasses < max_bypasses:
+                break
+            bypass = None
+            if increased > best_increased:
+                best_children, best_increased = children, increased
+            if increased == 2:
+                break
+
+        if bypass is not None:
+            bypasses += 1
+            # Same cost with fewer conflicts, so adopt the new path instead of splitting
+            agent, path = bypass
+            node = node.copy()
+            node.set_path(agent, path)
+            heappush(pq, (node.cost, node.count_conflicts(), next(counter), node))
+            continue
+        for child in best_children:
+            if child.valid:
+                heappush(pq, (child.cost, child.count_conflicts(), next(counter), child))
+    return None
+
+
+def constraints_for(conflict):
+    # (agent, t, node, lastnode) per child, lastnode is None for vertex constraints
+    t, node = conflict['t'], conflict['node']
+    if not conflict['transition']:
+        return [(conflict['agent1'], t, node, None), (conflict['agent2'], t, node, None)]
+    lastnode = conflict['lastnode']
+    return [(conflict['agent1'], t, node, lastnode), (conflict['agent2'], t, lastnode, node)]
+
+
+class ICBSNode:
+
+    def __init__(self, agents):
+        self.constraints = [{} for _ in range(agents)]
+        self.transition_constraints = [{} for _ in range(agents)]
+        self.paths = [None] * agents
+        self.cost = 0
+        self.valid = True
+        self._conflicts = None
+
+    def copy(self):
+        node = ICBSNode(0)
+        # Constraint sets are shared until the agent owning them is constrained again
+        node.constraints = list(self.constraints)
+        node.transition_constraints = list(self.transition_constraints)
+        node.paths = list(self.paths)
+        node.cost = self.cost
+        return node
+
+    def child(self, agent, t, node, lastnode):
+        child = self.copy()
+        if lastnode is None:
+            constraints = dict(child.constraints[agent])
+            constraints[t] = constraints.get(t, frozenset()) | {node}
+            child.constraints[agent] = constraints
+        else:
+            transitions = dict(child.transition_constraints[agent])
+            transitions[t] = transitions.get(t, frozenset()) | {(lastnode, node)}
+            child.transition_constraints[agent] = transitions
+        return child
+
+    def set_path(self, agent, path):
+        self._conflicts = None
+        if path is None:
+            self.valid = False
+            return
+        if self.paths[agent] is not None:
+            self.cost -= len(self.paths[agent]) - 1
+        self.paths[agent] = path
+        self.cost += len(path) - 1
+
+    def padded(self):
+        T = max(len(path) for path in self.paths)
+        return [path + [path[-1]] * (T - len(path)) for path in self.paths]
+
+    def find_conflicts(self):
+        # All conflicts in time order, using the same per-timestep rules as find_conflict. The
+        # timesteps with a conflict are found with NumPy, only those are scanned agent by agent
+        if self._conflicts is None:
+            self._conflicts = []
+            paths = self.padded()
+            for t in conflict_times(np.array(paths, dtype=np.int64)).tolist():
+                states = {}
+                for agent, path in enumerate(paths):
+                    node = path[t]
+                    if node in states:
+                        self._conflicts.append({'agent1': agent, 'agent2': states[node], 't': t,
+                                                'node': node, 'transition': False})
+                    else:
+                        states[node] = agent
+                if t == 0:
+                    continue
+                for agent, path in enumerate(paths):
+                    for other in range(agent + 1, len(paths)):
+                        if path[t] == paths[other][t - 1] and path[t - 1] == paths[other][t] \
+                                and path[t] != path[t - 1]:
+                            self._conflicts.append({'agent1': agent, 'agent2': other, 't': t, 'node': path[t],
+                                                    'lastnode': path[t - 1], 'transition': True})
+        return self._conflicts
+
+    def count_conflicts(self):
+        return len(self.find_conflicts())
+
+    def solution(self, graph):
+        return [[graph.node(cell) for cell in path] for path in self.padded()]
+
+
+class ConflictAvoidanceTable:
+    # Where the other agents are at each timestep; agents stay on their goal after their path ends
+
+    def __init__(self, paths, exclude):
+        self.occupied = {}
+        self.parked = {}
+        for agent, path in enumerate(paths):
+            if agent == exclude or path is None:
+                continue
+            for t, cell in enumerate(path[:-1]):
+                self.occupied[(cell, t)] = self.occupied.get((cell, t), 0) + 1
+            last_t = len(path) - 1
+            self.parked.setdefault(path[-1], []).append(last_t)
+
+    def count(self, cell, t):
+        conflicts = self.occupied.get((cell, t), 0)
+        for since in self.parked.get(cell, ()):
+            if t >= since:
+                conflicts += 1
+        return conflicts
+
+
+def space_time_astar(graph, start, goal, heuristic, constraints, transition_constraints, cat):
+    # A* over (cell, t) with waiting, honouring vertex and transition constraints.
+    # Among equal f, states with fewer conflicts in the avoidance table are expanded first.
+    goal_constraint = max([t for t, cells in constraints.items() if goal in cells], default=-1)
+    horizon = max(list(constraints) + list(transition_constraints) + [0]) + len(heuristic)
+    indices, indptr = graph.indices, graph.indptr
+    pq = []
+    best = {(start, 0): 0}
+    prev = {(start, 0): None}
+    counter = itertools.count()
+    if heuristic[start] >= graph.grid.size:
+        return None
+    heappush(pq, (heuristic[start], 0, 0, next(counter), start, 0))
+    while pq:
+        _, conflicts, _, _, curr, t = heappop(pq)
+        if best.get((curr, t)) != conflicts:
+            continue
+        if curr == goal and t > goal_constraint:
+            path = []
+            state = (curr, t)
+            while state is not None:
+                path.append(state[0])
+                state = prev[state]
+            return path[::-1]
+        child_t = t + 1
+        if child_t > horizon:
+            continue
+        blocked = constraints.get(child_t, ())
+        blocked_moves = transition_constraints.get(child_t, ())
+        for child in indices[indptr[curr]:indptr[curr + 1]]:
+            if child in blocked or (curr, child) in blocked_moves:
                 continue
-            if t < len(paths[agent]):
-                node = paths[agent][t]
-            else:
-                node = paths[agent][-1]
-            if node in states:
-                other_agent = states[node]
-                return {'agent1': agent, 'agent2': other_agent, 't': t, 'node': node, 'transition': False}
-            states[node] = agent
-        # Check swaps
-        for node, agent in states.items():
-            if node in last_states:  # if agent has moved into a spot that was just occupied, get the other agent who just moved out
-                other_agent = last_states[node]
-                if other_agent != agent:
-                    last_node = paths[agent][t - 1]
-                    if paths[other_agent][
-                        t] == last_node:  # if the agent's last spot is now occupied by that other agent, it's a swap
-                        return {'agent1': agent, 'agent2': other_agent, 't': t, 'node': node, 'lastnode': last_node,
-                                'transition': True}
-        last_states = states
+            child_conflicts = conflicts + cat.count(child, child_t)
+            if child_conflicts < best.get((child, child_t), float('inf')):
+                best[(child, child_t)] = child_conflicts
+                prev[(child, child_t)] = (curr, t)
+                heappush(pq, (child_t + heuristic[child], child_conflicts, -child_t, next(counter), child, child_t))
     return None
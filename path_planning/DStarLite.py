@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from heapq import heappush, heappop
+import numpy as np
+from path_planning.FastAstar import INF, astar
+
+
+class DStarLite:
+    """
+    D* Lite on a 4-connected uniform-cost grid. The search runs backwards from the goal, so its
+    g-values stay valid as the start moves along the path, and when cells are closed or opened only
+    the cells whose distance to the goal changes are expanded again.
+    """
+
+    def __init__(self, grid, goal, blocked=None):
+        self.grid = np.asarray(grid, dtype=bool)
+        self.shape = self.grid.shape
+        # Cells are numbered on the grid padded with one blocked cell on every side, so neighbours
+        # are found without bounds checks. Searches on one map can share the padded bitmap
+        self.width = self.shape[1] + 2
+        self.blocked = padded_bitmap(self.grid) if blocked is None else blocked
+        self.goal = self.__flat__(goal)
+        self.start = self.goal
+        self.last = self.goal
+        self.km = 0
+        self.g = {}
+        self.rhs = {self.goal: 0}
+        self.queue = []
+        self.keys = {}
+        self.expanded = 0
+        self.__push__(self.goal)
+
+    def __flat__(self, pos):
+        return (int(pos[0]) + 1) * self.width + int(pos[1]) + 1
+
+    def __cell__(self, node):
+        r, c = divmod(node, self.width)
+        return r - 1, c - 1
+
+    def __estimate__(self, a, b):
+        ar, ac = divmod(a, self.width)
+        br, bc = divmod(b, self.width)
+        return abs(ar - br) + abs(ac - bc)
+
+    def __key__(self, node):
+        m = min(self.g.get(node, INF), self.rhs.get(node, INF))
+        return m + self.__estimate__(self.start, node) + self.km, m
+
+    def __push__(self, node):
+        key = self.__key__(node)
+        self.keys[node] = key
+        heappush(self.queue, (key, node))
+
+    def __neighbours__(self, node):
+        # Free neighbours of a free cell, a closed cell has no edges
+        blocked = self.blocked
+        if blocked[node]:
+            return []
+        w = self.width
+        return [v for v in (node + w, node + 1, node - w, node - 1) if not blocked[v]]
+
+    def __update__(self, node):
+        if node != self.goal:
+            self.rhs[node] = min([self.g.get(v, INF) + 1 for v in self.__neighbours__(node)], default=INF)
+        if self.g.get(node, INF) != self.rhs.get(node, INF):
+            self.__push__(node)
+        else:
+            self.keys.pop(node, None)
+
+    def move(self, start):
+        # Follow the start as the vehicle moves, keys already queued stay lower bounds
+        start = self.__flat__(start)
+        if start != self.start:
+            self.km += self.__estimate__(self.last, start)
+            self.last = start
+            self.start = start
+
+    def update(self, grid, cells):
+        # Cells flipped between free and blocked, their edges and those of their neighbours changed
+        self.grid = np.asarray(grid, dtype=bool)
+        w = self.width
+        for cell in cells:
+            node = self.__flat__(cell)
+            self.blocked[node] = bool(self.grid[tuple(cell)])
+        for cell in cells:
+            node = self.__flat__(cell)
+            for v in (node, node + w, node + 1, node - w, node - 1):
+                if v in self.g or v in self.rhs or not self.blocked[v]:
+                    self.__update__(v)
+
+    def compute(self):
+        queue, keys = self.queue, self.keys
+        g, rhs = self.g, self.rhs
+        while queue:
+            key, node = queue[0]
+            if keys.get(node) != key:
+                heappop(queue)
+                continue
+            start_g = g.get(self.start, INF)
+            if key >= self.__key__(self.start) and rhs.get(self.start, INF) == start_g:
+                break
+            heappop(queue)
+            new_key = self.__key__(node)
+            if key < new_key:
+                self.__push__(node)
+                continue
+            self.expanded += 1
+            if g.get(node, INF) > rhs.get(node, INF):
+                g[node] = rhs[node]
+                del keys[node]
+                for v in self.__neighbours__(node):
+                    self.__update__(v)
+            else:
+                g[node] = INF
+                self.__update__(node)
+                for v in self.__neighbours__(node):
+                    self.__update__(v)
+
+    def path(self):
+        # Cells from the start to the goal descending g, None if the goal cannot be reached
+        node = self.start
+        if self.g.get(node, INF) == INF:
+            return None
+        path = [self.__cell__(node)]
+        while node != self.goal:
+            node = min(self.__neighbours__(node), key=lambda v: self.g.get(v, INF))
+            path.append(self.__cell__(node))
+        return path
+
+
+def padded_bitmap(grid):
+    # Flat list of the grid padded with blocked cells, row-major with width + 2 cells per row
+    return np.pad(np.asarray(grid, dtype=bool), 1, constant_values=True).ravel().tolist()
+
+
+class DStarLiteCache:
+    """
+    LRU cache of D* Lite searches keyed by goal cell. Vehicles heading for the same target share a
+    search, and map updates are handed to every cached search, which repairs itself on its next query.
+    """
+
+    def __init__(self, grid, maxsize=64):
+        self.grid = np.asarray(grid, dtype=bool)
+        self.blocked = padded_bitmap(self.grid)
+        self.maxsize = maxsize
+        self.searches = OrderedDict()
+        self.fallbacks = 0
+        # Expansions of searches that were evicted or dropped, so expanded never goes down
+        self.retired = 0
+
+    def get(self, goal):
+        goal = tuple(goal)
+        search = self.searches.get(goal)
+        if search is None:
+            search = DStarLite(self.grid, goal, self.blocked)
+            self.searches[goal] = search
+            if len(self.searches) > self.maxsize:
+                self.retired += self.searches.popitem(last=False)[1].expanded
+        else:
+            self.searches.move_to_end(goal)
+        return search
+
+    @property
+    def expanded(self):
+        return self.retired + sum(search.expanded for search in self.searches.values())
+
+    def path(self, start, goal):
+        path = None
+        if not self.grid[tuple(start)] and not self.grid[tuple(goal)]:
+            search = self.get(goal)
+            search.move(start)
+            search.compute()
+            path = search.path()
+        if path is None:
+            # Goal cannot be reached, fall back to the closest partial path astar finds
+            self.fallbacks += 1
+            path = astar(self.grid, start, goal)
+        return path
+
+    def update(self, grid, cells):
+        self.grid = np.asarray(grid, dtype=bool)
+        w = self.grid.shape[1] + 2
+        for r, c in cells:
+            self.blocked[(r + 1) * w + c + 1] = bool(self.grid[r, c])
+        for goal, search in list(self.searches.items()):
+            if self.grid[goal]:
+                self.retired += search.expanded
+                del self.searches[goal]
+            else:
+                search.update(self.grid, cells)
@@ -0,0 +1,328 @@
+from collections import OrderedDict
+from path_planning.FastAstar import astar
+from path_planning.Grid import Grid
+import numpy as np
+
+UNREACHABLE = -1
+
+
+def bfs(grid, sources):
+    # Breadth-first wavefront over a boolean obstacle matrix, expanded one layer at a time.
+    # Returns flat (distance, next_hop) arrays where next_hop points one step closer to the
+    # nearest source, and the index of the source each cell was reached from.
+    h, w = grid.shape
+    free = ~grid.ravel()
+    distance = np.full(h * w, UNREACHABLE, dtype=np.int32)
+    next_hop = np.full(h * w, UNREACHABLE, dtype=np.int32)
+    origin = np.full(h * w, UNREACHABLE, dtype=np.int32)
+    frontier = np.array([s[0] * w + s[1] for s in sources], dtype=np.int64)
+    labels = np.arange(len(sources), dtype=np.int32)
+    keep = free[frontier]
+    frontier, labels = frontier[keep], labels[keep]
+    distance[frontier] = 0
+    next_hop[frontier] = frontier
+    origin[frontier] = labels
+    d = 0
+    while frontier.size:
+        d += 1
+        rows, cols = np.divmod(frontier, w)
+        layer = []
+        for dr, dc in Grid.MOVEMENTS[:4]:
+            r = rows + dr
+            c = cols + dc
+            ok = (r >= 0) & (r < h) & (c >= 0) & (c < w)
+            cells = r[ok] * w + c[ok]
+            parents = frontier[ok]
+            new = free[cells] & (distance[cells] == UNREACHABLE)
+            cells, parents = cells[new], parents[new]
+            distance[cells] = d
+            next_hop[cells] = parents
+            origin[cells] = origin[parents]
+            layer.append(cells)
+        frontier = np.concatenate(layer)
+    return distance, next_hop, origin
+
+
+def neighbours(shape, cells):
+    # (in bounds mask, flat ids) of the cells one move away, per direction
+    h, w = shape
+    rows, cols = np.divmod(cells, w)
+    for dr, dc in Grid.MOVEMENTS[:4]:
+        r = rows + dr
+        c = cols + dc
+        ok = (r >= 0) & (r < h) & (c >= 0) & (c < w)
+        yield ok, r[ok] * w + c[ok]
+
+
+def propagate(free, shape, distance, next_hop, frontier, d, pending=None, origin=None):
+    # Grow the wavefront from cells at distance d, taking over every cell it reaches strictly sooner.
+    # pending maps later distances to cells that join the wavefront once it gets there.
+    while frontier.size or pending:
+        if pending and d in pending:
+            frontier = np.union1d(frontier, pending.pop(d))
+        if not frontier.size:
+            d = min(pending)
+            continue
+        layer = []
+        for ok, cells in neighbours(shape, frontier):
+            parents = frontier[ok]
+            better = free[cells] & ((distance[cells] == UNREACHABLE) | (distance[cells] > d + 1))
+            cells, parents = cells[better], parents[better]
+            cells, first = np.unique(cells, return_index=True)
+            parents = parents[first]
+            distance[cells] = d + 1
+            next_hop[cells] = parents
+            if origin is not None:
+                origin[cells] = origin[parents]
+            layer.append(cells)
+        frontier = np.unique(np.concatenate(layer))
+        d += 1
+
+
+def subtree(next_hop, cells):
+    # Mask of the cells whose next hops lead through any of cells, found by pointer jumping
+    hit = np.zeros(next_hop.size, dtype=bool)
+    hit[cells] = True
+    hop = np.where(next_hop == UNREACHABLE, np.arange(next_hop.size), next_hop)
+    while True:
+        hit |= hit[hop]
+        jumped = hop[hop]
+        if np.array_equal(jumped, hop):
+            return hit
+        hop = jumped
+
+
+def boundary_layers(shape, distance, cells):
+    # Reached neighbours of cells grouped by their distance, as pending layers for propagate
+    boundary = [near for ok, near in neighbours(shape, cells)]
+    boundary = np.unique(np.concatenate(boundary)) if boundary else np.empty(0, dtype=np.int64)
+    boundary = boundary[distance[boundary] != UNREACHABLE]
+    return {int(d): boundary[distance[boundary] == d] for d in np.unique(distance[boundary])}
+
+
+def flip_cells(grid, cells):
+    # Flat ids of the cells that are now blocked and of those that are now free
+    w = grid.shape[1]
+    flat = np.array([r * w + c for r, c in cells], dtype=np.int64).reshape(-1)
+    blocked = grid.ravel()[flat]
+    return flat[blocked], flat[~blocked]
+
+
+class DistanceField:
+    """
+    Exact shortest-path distances and next hops from every free cell towards a single goal.
+    """
+
+    def __init__(self, grid, goal):
+        self.goal = tuple(goal)
+        self.shape = grid.shape
+        distance, next_hop, _ = bfs(grid, [self.goal])
+        self.distance = distance.reshape(self.shape)
+        self.next_hop = next_hop
+
+    def path(self, start):
+        w = self.shape[1]
+        node = start[0] * w + start[1]
+        if self.next_hop[node] == UNREACHABLE:
+            return None
+        path = [tuple(start)]
+        next_hop = self.next_hop
+        while next_hop[node] != node:
+            node = int(next_hop[node])
+            path.append(divmod(node, w))
+        return path
+
+    def update(self, free, closed, opened):
+        # Patch the field for flipped cells. Returns False when a closed cell carried shortest paths
+        # of other cells, the field then has to be rebuilt
+        distance = self.distance.ravel()
+        closed = closed[distance[closed] != UNREACHABLE]
+        if closed.size:
+            if np.isin(self.next_hop, closed).any():
+                return False
+            distance[closed] = UNREACHABLE
+            self.next_hop[closed] = UNREACHABLE
+        # Reached neighbours of opened cells grow into them, taking over every cell they reach sooner
+        pending = boundary_layers(self.shape, distance, opened)
+        if pending:
+            propagate(free, self.shape, distance, self.next_hop, np.empty(0, dtype=np.int64), min(pending), pending)
+        return True
+
+
+class DistanceFieldCache:
+    """
+    LRU cache of distance fields keyed by goal cell, built lazily for one obstacle matrix.
+    """
+
+    def __init__(self, grid, maxsize=64):
+        self.grid = np.asarray(grid, dtype=bool)
+        self.maxsize = maxsize
+        self.fields = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.invalidated = 0
+
+    def get(self, goal):
+        goal = tuple(goal)
+        field = self.fields.get(goal)
+        if field is None:
+            self.misses += 1
+            field = DistanceField(self.grid, goal)
+            self.fields[goal] = field
+            if len(self.fields) > self.maxsize:
+                self.fields.popitem(last=False)
+        else:
+            self.hits += 1
+            self.fields.move_to_end(goal)
+        return field
+
+    def distance(self, start, goal):
+        return int(self.get(goal).distance[tuple(start)])
+
+    def path(self, start, goal):
+        path = self.get(goal).path(start)
+        if path is None:
+            # Goal cannot be reached, fall back to the closest partial path astar finds
+            self.fallbacks += 1
+            path = astar(self.grid, start, goal)
+        return path
+
+    def update(self, grid, cells):
+        # The cells flipped between free and blocked. Fields are patched where that is cheap, a field
+        # with a closed cell inside its shortest path tree is dropped and rebuilt when next needed
+        self.grid = np.asarray(grid, dtype=bool)
+        free = ~self.grid.ravel()
+        closed, opened = flip_cells(self.grid, cells)
+        for goal, field in list(self.fields.items()):
+            if not field.update(free, closed, opened):
+                del self.fields[goal]
+                self.invalidated += 1
+
+    def clear(self):
+        self.fields.clear()
+
+
+class DistanceFieldGrid(Grid):
+    """
+    Grid environment whose estimate is the exact remaining distance read from cached fields.
+    """
+
+    def __init__(self, grid, fields=None):
+        super().__init__(grid)
+        self.fields = fields if fields is not None else DistanceFieldCache(grid)
+
+    def estimate(self, node1, node2, t):
+        d = self.fields.get(node2).distance[node1[0], node1[1]]
+        if d == UNREACHABLE:
+            return super().estimate(node1, node2, t)
+        return int(d)
+
+
+class NearestSourceIndex:
+    """
+    Nearest of several sources for every free cell by true path distance, with the distance and the
+    next hop towards it, built by one multi-source BFS. Sources can be added and removed, which only
+    re-expands the cells whose nearest source changes.
+    """
+
+    def __init__(self, grid, sources=(), items=None):
+        self.grid = np.asarray(grid, dtype=bool)
+        self.shape = self.grid.shape
+        self.free = ~self.grid.ravel()
+        self.sources = []
+        self.items = []
+        if items is None:
+            items = [None] * len(sources)
+        for source, item in zip(sources, items):
+            self.sources.append(tuple(source))
+            self.items.append(item)
+        # Sources sharing a cell resolve to the first one added
+        firsts = {}
+        for i, source in enumerate(self.sources):
+            firsts.setdefault(source, i)
+        ids = sorted(firsts.values())
+        distance, next_hop, origin = bfs(self.grid, [self.sources[i] for i in ids])
+        self.distance = distance
+        self.next_hop = next_hop
+        self.origin = np.where(origin == UNREACHABLE, UNREACHABLE, np.array(ids + [0], dtype=np.int32)[origin])
+
+    def __flat__(self, pos):
+        return pos[0] * self.shape[1] + pos[1]
+
+    def nearest(self, pos):
+        # Item of the nearest source, None if no source can be reached from pos
+        source = self.origin[self.__flat__(pos)]
+        return None if source == UNREACHABLE else self.items[source]
+
+    def nearest_source(self, pos):
+        source = self.origin[self.__flat__(pos)]
+        return None if source == UNREACHABLE else self.sources[source]
+
+    def distance_to_nearest(self, pos):
+        return int(self.distance[self.__flat__(pos)])
+
+    def path(self, start):
+        # Cells from start to its nearest source following the next hops, None if none can be reached
+        w = self.shape[1]
+        node = self.__flat__(start)
+        if self.next_hop[node] == UNREACHABLE:
+            return None
+        path = [tuple(start)]
+        while self.next_hop[node] != node:
+            node = int(self.next_hop[node])
+            path.append(divmod(node, w))
+        return path
+
+    def __propagate__(self, frontier, d, pending=None):
+        propagate(self.free, self.shape, self.distance, self.next_hop, frontier, d, pending, self.origin)
+
+    def add(self, source, item=None):
+        source = tuple(source)
+        self.sources.append(source)
+        self.items.append(item)
+        cell = self.__flat__(source)
+        if not self.free[cell] or self.distance[cell] == 0:
+            return
+        self.distance[cell] = 0
+        self.next_hop[cell] = cell
+        self.origin[cell] = len(self.sources) - 1
+        self.__propagate__(np.array([cell], dtype=np.int64), 0)
+
+    def remove(self, item):
+        index = next(i for i, it in enumerate(self.items) if it is item and self.sources[i] is not None)
+        self.sources[index] = None
+        self.items[index] = None
+        self.__repair__(self.origin == index)
+
+    def update(self, grid, cells):
+        # The cells flipped between free and blocked. Cells whose next hops ran through a closed cell
+        # and the opened cells are cleared and re-seeded from their surroundings
+        self.grid = np.asarray(grid, dtype=bool)
+        self.free = ~self.grid.ravel()
+        closed, opened = flip_cells(self.grid, cells)
+        closed = closed[self.distance[closed] != UNREACHABLE]
+        invalid = subtree(self.next_hop, closed) if closed.size else np.zeros(self.free.size, dtype=bool)
+        invalid[opened] = True
+        self.__repair__(invalid)
+
+    def __repair__(self, invalid):
+        self.distance[invalid] = UNREACHABLE
+        self.next_hop[invalid] = UNREACHABLE
+        self.origin[invalid] = UNREACHABLE
+
+        # Re-seed the freed region from the remaining sources inside it and the cells bordering it
+        pending = boundary_layers(self.shape, self.distance, np.flatnonzero(invalid))
+        sources = []
+        for i, source in enumerate(self.sources):
+            if source is not None and invalid[self.__flat__(source)] and self.distance[self.__flat__(source)] != 0 \
+                    and self.free[self.__flat__(source)]:
+                cell = self.__flat__(source)
+                self.distance[cell] = 0
+                self.next_hop[cell] = cell
+                self.origin[cell] = i
+                sources.append(cell)
+        if sources:
+            pending[0] = np.union1d(pending.get(0, np.empty(0, dtype=np.int64)), sources)
+        if pending:
+            self.__propagate__(np.empty(0, dtype=np.int64), min(pending), pending)
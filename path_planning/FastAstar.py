@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from heapq import heappush, heappop
+import weakref
+import numpy as np
+from path_planning.Environment import Environment
+from path_planning.Grid import Grid
+
+INF = float('inf')
+
+
+class GridGraph(Environment):
+    """
+    Flat-indexed 4-connected grid (plus waiting) with a CSR neighbour table built once per obstacle matrix.
+
+    Cells are encoded as row * width + col, so comparing flat ids orders cells exactly like
+    comparing (row, col) tuples, which keeps tie-breaking identical to the tuple based searches.
+    """
+
+    def __init__(self, grid):
+        super().__init__()
+        self.grid = np.asarray(grid, dtype=bool)
+        h, w = self.grid.shape
+        self.shape = (h, w)
+        self.width = w
+        rows, cols = np.divmod(np.arange(h * w), w)
+        neighbours = np.full((h * w, len(Grid.MOVEMENTS)), -1, dtype=np.int64)
+        for k, (dr, dc) in enumerate(Grid.MOVEMENTS):
+            r = rows + dr
+            c = cols + dc
+            valid = (r >= 0) & (r < h) & (c >= 0) & (c < w)
+            valid[valid] = ~self.grid[r[valid], c[valid]]
+            neighbours[valid, k] = r[valid] * w + c[valid]
+        mask = neighbours >= 0
+        self.indptr = np.concatenate(([0], np.cumsum(mask.sum(axis=1)))).tolist()
+        self.indices = neighbours[mask].tolist()
+        self.rows = rows.tolist()
+        self.cols = cols.tolist()
+
+    def index(self, node):
+        return int(node[0]) * self.width + int(node[1])
+
+    def node(self, index):
+        return self.rows[index], self.cols[index]
+
+    def neighbours(self, index):
+        return self.indices[self.indptr[index]:self.indptr[index + 1]]
+
+    def next(self, node, t):
+        return [(self.node(child), 1.0) for child in self.neighbours(self.index(node))]
+
+    def estimate(self, node1, node2, t):
+        return abs(node1[0] - node2[0]) + abs(node1[1] - node2[1])
+
+
+# id of an obstacle matrix -> (weak reference to it, graph). Matrices are never edited in place once
+# planned on (set_obstacles copies on write), so a live matrix with the same id is the same map
+_graphs = OrderedDict()
+
+
+def get_graph(grid, maxsize=8):
+    # Accepts a GridGraph, a Grid environment or a raw obstacle matrix
+    if isinstance(grid, GridGraph):
+        return grid
+    if isinstance(grid, Grid):
+        grid = grid.grid
+    if not isinstance(grid, np.ndarray):
+        return GridGraph(grid)
+    key = id(grid)
+    cached = _graphs.get(key)
+    if cached is not None and cached[0]() is grid:
+        _graphs.move_to_end(key)
+        return cached[1]
+    graph = GridGraph(grid)
+    _graphs[key] = (weakref.ref(grid), graph)
+    _graphs.move_to_end(key)
+    if len(_graphs) > maxsize:
+        _graphs.popitem(last=False)
+    return graph
+
+
+def astar(env, start, goal, constraint_fn=None, return_cost=False):
+    # Drop-in replacement for path_planning.Astar.astar on grid environments
+    graph = get_graph(env)
+    rows, cols, indices, indptr = graph.rows, graph.cols, graph.indices, graph.indptr
+    start = graph.index(start)
+    goal = graph.index(goal)
+    gr, gc = rows[goal], cols[goal]
+    n = len(rows)
+    g = [INF] * n
+    prev = [-1] * n
+    pq = []
+    cost = 0.0
+    t = 0.0
+    g[start] = cost
+    heappush(pq, (abs(rows[start] - gr) + abs(cols[start] - gc) + cost, start, t))
+    best = (None, INF)
+    while pq:
+        totcost, curr, t = heappop(pq)
+        if totcost < best[1]:
+            best = (curr, totcost)
+        if curr == goal:
+            path = _construct_path(graph, prev, curr)
+            return (path, totcost) if return_cost else path
+        child_t = t + 1
+        curr_cost = g[curr] + 1.0
+        for child in indices[indptr[curr]:indptr[curr + 1]]:
+            if constraint_fn is not None and not constraint_fn(graph.node(child), graph.node(curr), child_t):
+                continue
+            if curr_cost < g[child]:
+                prev[child] = curr
+                g[child] = curr_cost
+                heappush(pq, (abs(rows[child] - gr) + abs(cols[child] - gc) + curr_cost, child, child_t))
+    path = _construct_path(graph, prev, best[0])
+    return (path, INF) if return_cost else path
+
+
+def stay(env, start, goal, constraint_fn=None, start_t=0, T=0):
+    # Drop-in replacement for path_planning.Astar.stay on grid environments
+    graph = get_graph(env)
+    rows, cols, indices, indptr = graph.rows, graph.cols, graph.indices, graph.indptr
+    start = graph.index(start)
+    goal = graph.index(goal)
+    gr, gc = rows[goal], cols[goal]
+    pq = []
+    t = start_t
+    tmap = [0] * len(rows)
+    tmap[start] = t
+    prevmap = {(start, t): (None, t - 1)}
+    best = ((start, t), INF)
+    heappush(pq, (abs(rows[start] - gr) + abs(cols[start] - gc), start, t))
+    while pq:
+        heur, curr, t = heappop(pq)
+        if t == T:
+            if heur < best[1]:
+                best = ((curr, t), heur)
+            if curr == goal:
+                return _construct_path_stay(graph, prevmap, (curr, t))
+        if t >= T:
+            continue
+        child_t = t + 1
+        for child in indices[indptr[curr]:indptr[curr + 1]]:
+            if constraint_fn is not None and not constraint_fn(graph.node(child), graph.node(curr), child_t):
+                continue
+            if child_t > tmap[child]:
+                tmap[child] = child_t
+                prevmap[(child, child_t)] = (curr, t)
+                heappush(pq, (abs(rows[child] - gr) + abs(cols[child] - gc), child, child_t))
+    path = _construct_path_stay(graph, prevmap, best[0])
+    for t in range(len(path), T - start_t + 1):
+        path.append(path[-1])
+    return path
+
+
+def _construct_path(graph, prev, index):
+    path = [graph.node(index)]
+    while prev[index] != -1:
+        index = prev[index]
+        path.append(graph.node(index))
+    return path[::-1]
+
+
+def _construct_path_stay(graph, prevmap, state):
+    path = [graph.node(state[0])]
+    while prevmap[state][0] is not None:
+        state = prevmap[state]
+        path.append(graph.node(state[0]))
+    return path[::-1]
@@ -0,0 +1,301 @@
+from collections import deque
+from heapq import heappush, heappop
+from itertools import chain
+import numpy as np
+from path_planning.DistanceField import UNREACHABLE
+from path_planning.FastAstar import INF, astar
+from path_planning.Grid import Grid
+
+# Border runs at least this long get an entrance at both ends rather than one in the middle
+SPLIT_RUN = 6
+
+
+def cluster_moves(grid, cluster_size):
+    # (flat offset, mask of the cells that can take that step) for each of the four moves, where a
+    # step is allowed if it stays on the map, ends on a free cell and does not leave the cluster
+    h, w = grid.shape
+    rows, cols = np.divmod(np.arange(h * w), w)
+    free = ~grid.ravel()
+    moves = []
+    for dr, dc in Grid.MOVEMENTS[:4]:
+        r = rows + dr
+        c = cols + dc
+        allowed = (r >= 0) & (r < h) & (c >= 0) & (c < w) & (r // cluster_size == rows // cluster_size) \
+            & (c // cluster_size == cols // cluster_size)
+        allowed[allowed] = free[r[allowed] * w + c[allowed]]
+        moves.append((dr * w + dc, allowed))
+    return moves
+
+
+def cluster_bfs(moves, sources, size):
+    # Breadth-first wavefront from flat cell ids along the moves of cluster_moves, so sources in
+    # different clusters are searched together without ever meeting
+    distance = np.full(size, UNREACHABLE, dtype=np.int32)
+    frontier = np.asarray(sources, dtype=np.int64)
+    distance[frontier] = 0
+    d = 0
+    while frontier.size:
+        d += 1
+        layer = []
+        for offset, allowed in moves:
+            cells = frontier[allowed[frontier]] + offset
+            cells = cells[distance[cells] == UNREACHABLE]
+            distance[cells] = d
+            layer.append(cells)
+        frontier = np.concatenate(layer)
+    return distance
+
+
+def border_runs(open_cells):
+    # (first, last) index of every run of True values
+    padded = np.concatenate(([False], open_cells, [False])).astype(np.int8)
+    changes = np.flatnonzero(np.diff(padded))
+    return list(zip(changes[::2].tolist(), (changes[1::2] - 1).tolist()))
+
+
+class LazyPath:
+    """
+    Path through a list of waypoints whose cells are only worked out as the path is used. It
+    supports what vehicles do with the cell lists of the other planners: indexing, slicing off the
+    head, len, truthiness, iteration and prepending a list.
+    """
+
+    def __init__(self, cells, segments, refine, next_segment=0):
+        self.cells = list(cells)
+        # (from, to, length) between consecutive waypoints, shared by every slice of the path
+        self.segments = segments
+        self.refine = refine
+        self.next_segment = next_segment
+
+    def __refine__(self, n=None):
+        # Expand segments until at least n cells are known, or all of them
+        while self.next_segment < len(self.segments) and (n is None or len(self.cells) < n):
+            start, end, _ = self.segments[self.next_segment]
+            self.cells.extend(self.refine(start, end)[1:])
+            self.next_segment += 1
+
+    def __len__(self):
+        return len(self.cells) + sum(length for _, _, length in self.segments[self.next_segment:])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is None and index.stop is None and (index.start or 0) >= 0:
+                start = index.start or 0
+                self.__refine__(start + 1)
+                return LazyPath(self.cells[start:], self.segments, self.refine, self.next_segment)
+            return list(self)[index]
+        if index < 0:
+            self.__refine__()
+        else:
+            self.__refine__(index + 1)
+        return self.cells[index]
+
+    def __iter__(self):
+        i = 0
+        while True:
+            self.__refine__(i + 1)
+            if i >= len(self.cells):
+                return
+            yield self.cells[i]
+            i += 1
+
+    def __radd__(self, other):
+        return LazyPath(list(other) + self.cells, self.segments, self.refine, self.next_segment)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"LazyPath({self.cells!r}, {len(self.segments) - self.next_segment} segments left)"
+
+
+class HPAStar:
+    """
+    Hierarchical path-finding A* (Botea et al., 2004) on a 4-connected obstacle matrix. The map is
+    cut into square clusters, every run of open cells along a cluster border gets one or two
+    entrances, and the distances between the entrances of each cluster are computed once. Queries
+    search this abstract graph and return a LazyPath that fills in the cells within a cluster when
+    the vehicle gets there.
+    """
+
+    def __init__(self, grid, cluster_size=16):
+        self.grid = np.asarray(grid, dtype=bool)
+        self.shape = self.grid.shape
+        self.cluster_size = cluster_size
+        self.clusters_per_row = -(-self.shape[1] // cluster_size)
+        self.expanded = 0
+        pairs = self.__entrances__()
+        # Abstract nodes are the entrance cells, kept in a CSR adjacency with exact edge lengths
+        self.node_cells = np.unique(pairs)
+        self.node_index = {cell: i for i, cell in enumerate(self.node_cells.tolist())}
+        self.node_rows, self.node_cols = (a.tolist() for a in np.divmod(self.node_cells, self.shape[1]))
+        self.cluster_nodes = {}
+        for i, cell in enumerate(self.node_cells.tolist()):
+            self.cluster_nodes.setdefault(self.__cluster__(divmod(cell, self.shape[1])), []).append(i)
+        inter = np.searchsorted(self.node_cells, pairs)
+        sources, targets, lengths = self.__intra_edges__()
+        sources = np.concatenate([inter[:, 0], inter[:, 1], sources])
+        targets = np.concatenate([inter[:, 1], inter[:, 0], targets])
+        lengths = np.concatenate([np.ones(2 * len(inter), dtype=np.int32), lengths])
+        order = np.argsort(sources, kind="stable")
+        self.indices = targets[order].astype(np.int32)
+        self.lengths = lengths[order].astype(np.int32)
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=len(self.node_cells))))).tolist()
+
+    def update(self, grid, cells):
+        # The abstraction is rebuilt for the new map, paths handed out before refer to the old one
+        self.__init__(grid, self.cluster_size)
+
+    def __cluster__(self, pos):
+        return pos[0] // self.cluster_size, pos[1] // self.cluster_size
+
+    def __bounds__(self, cluster):
+        size = self.cluster_size
+        r0, c0 = cluster[0] * size, cluster[1] * size
+        return r0, min(r0 + size, self.shape[0]), c0, min(c0 + size, self.shape[1])
+
+    def __entrances__(self):
+        # (cell, cell across the border) flat id pairs, one or two for every open run along a border
+        free = ~self.grid
+        h, w = self.shape
+        size = self.cluster_size
+        pairs = []
+        for c in range(size - 1, w - 1, size):
+            for r0 in range(0, h, size):
+                open_cells = free[r0:r0 + size, c] & free[r0:r0 + size, c + 1]
+                for first, last in border_runs(open_cells):
+                    for r in ([(first + last) // 2] if last - first + 1 < SPLIT_RUN else [first, last]):
+                        pairs.append(((r0 + r) * w + c, (r0 + r) * w + c + 1))
+        for r in range(size - 1, h - 1, size):
+            for c0 in range(0, w, size):
+                open_cells = free[r, c0:c0 + size] & free[r + 1, c0:c0 + size]
+                for first, last in border_runs(open_cells):
+                    for c in ([(first + last) // 2] if last - first + 1 < SPLIT_RUN else [first, last]):
+                        pairs.append((r * w + c0 + c, (r + 1) * w + c0 + c))
+        return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+    def __intra_edges__(self):
+        # Distances between the entrances of each cluster. Round k searches from the k-th entrance
+        # of every cluster at once, so there are only as many wavefronts as the busiest cluster has entrances
+        h, w = self.shape
+        node_rows, node_cols = np.divmod(self.node_cells, w)
+        node_cluster = (node_rows // self.cluster_size) * self.clusters_per_row + node_cols // self.cluster_size
+        order = np.argsort(node_cluster, kind="stable")
+        first = np.searchsorted(node_cluster[order], node_cluster[order])
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order)) - first
+        moves = cluster_moves(self.grid, self.cluster_size)
+        edges = [], [], []
+        for k in range(int(rank.max()) + 1 if len(rank) else 0):
+            sources = np.flatnonzero(rank == k)
+            distance = cluster_bfs(moves, self.node_cells[sources], h * w)
+            source_of = np.full(node_cluster.max() + 1, -1, dtype=np.int64)
+            source_of[node_cluster[sources]] = sources
+            source = source_of[node_cluster]
+            d = distance[self.node_cells]
+            keep = (source >= 0) & (d > 0)
+            for edge, values in zip(edges, [source[keep], np.flatnonzero(keep), d[keep]]):
+                edge.append(values)
+        return tuple(np.concatenate(e) if e else np.empty(0, dtype=np.int64) for e in edges)
+
+    def __local_bfs__(self, start, cluster=None):
+        # Distances and parents of the cells reachable from start without leaving its cluster
+        r0, r1, c0, c1 = self.__bounds__(self.__cluster__(start) if cluster is None else cluster)
+        blocked = self.grid[r0:r1, c0:c1].tolist()
+        distance = {start: 0}
+        parent = {start: None}
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            r, c = cell
+            for child in ((r + 1, c), (r, c + 1), (r - 1, c), (r, c - 1)):
+                if r0 <= child[0] < r1 and c0 <= child[1] < c1 and child not in distance \
+                        and not blocked[child[0] - r0][child[1] - c0]:
+                    distance[child] = distance[cell] + 1
+                    parent[child] = cell
+                    queue.append(child)
+        return distance, parent
+
+    def refine(self, start, end):
+        # Cells from start to end, either neighbours across a border or within one cluster
+        if abs(start[0] - end[0]) + abs(start[1] - end[1]) == 1:
+            return [start, end]
+        _, parent = self.__local_bfs__(start)
+        path = []
+        cell = end
+        while cell is not None:
+            path.append(cell)
+            cell = parent[cell]
+        return path[::-1]
+
+    def __endpoint_edges__(self, endpoint, other, other_node):
+        # Edges from a query endpoint to the entrances of its cluster, and to the other endpoint if
+        # both lie in the same cluster
+        cluster = self.__cluster__(endpoint)
+        distance, _ = self.__local_bfs__(endpoint)
+        edges = []
+        for i in self.cluster_nodes.get(cluster, []):
+            d = distance.get((self.node_rows[i], self.node_cols[i]))
+            if d:
+                edges.append((i, d))
+        if self.__cluster__(other) == cluster and other in distance:
+            edges.append((other_node, distance[other]))
+        return edges
+
+    def abstract_path(self, start, goal):
+        # Waypoints of the shortest path through the abstract graph with the distance to each of them,
+        # None if goal cannot be reached. Endpoints that are not entrances join the graph as two extra nodes.
+        n = len(self.node_cells)
+        w = self.shape[1]
+        s = self.node_index.get(start[0] * w + start[1], n)
+        g = self.node_index.get(goal[0] * w + goal[1], n + 1)
+        extra = {}
+        for node, endpoint, other, other_node in [(s, start, goal, g), (g, goal, start, s)]:
+            for target, d in self.__endpoint_edges__(endpoint, other, other_node):
+                extra.setdefault(node, []).append((target, d))
+                extra.setdefault(target, []).append((node, d))
+        rows = self.node_rows + [start[0], goal[0]]
+        cols = self.node_cols + [start[1], goal[1]]
+        gr, gc = goal
+        indptr, indices, lengths = self.indptr, self.indices, self.lengths
+        cost = {s: 0}
+        prev = {s: None}
+        pq = [(abs(start[0] - gr) + abs(start[1] - gc), 0, s)]
+        while pq:
+            _, d, node = heappop(pq)
+            if d > cost[node]:
+                continue
+            self.expanded += 1
+            if node == g:
+                waypoints = []
+                while node is not None:
+                    waypoints.append(((rows[node], cols[node]), cost[node]))
+                    node = prev[node]
+                return waypoints[::-1]
+            neighbours = extra.get(node, [])
+            if node < n:
+                a, b = indptr[node], indptr[node + 1]
+                neighbours = chain(neighbours, zip(indices[a:b].tolist(), lengths[a:b].tolist()))
+            for neighbour, step in neighbours:
+                step += d
+                if step < cost.get(neighbour, INF):
+                    cost[neighbour] = step
+                    prev[neighbour] = node
+                    heappush(pq, (step + abs(rows[neighbour] - gr) + abs(cols[neighbour] - gc), step, neighbour))
+        return None
+
+    def path(self, start, goal):
+        start, goal = (int(start[0]), int(start[1])), (int(goal[0]), int(goal[1]))
+        if start == goal:
+            return [start]
+        if self.grid[start] or self.grid[goal]:
+            return astar(self.grid, start, goal)
+        found = self.abstract_path(start, goal)
+        if found is None:
+            # Goal cannot be reached, fall back to the closest partial path astar finds
+            return astar(self.grid, start, goal)
+        segments = tuple((a, b, db - da) for (a, da), (b, db) in zip(found, found[1:]))
+        return LazyPath([start], segments, self.refine)
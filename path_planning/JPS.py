@@ -0,0 +1,208 @@
+from heapq import heappush, heappop
+import numpy as np
+from path_planning.FastAstar import astar
+
+# Unit moves along each axis
+HORIZONTAL = [(0, 1), (0, -1)]
+VERTICAL = [(1, 0), (-1, 0)]
+
+
+class JumpPointSearch:
+    """
+    Jump point search on a 4-connected uniform-cost grid. Among the shortest paths it only follows
+    the canonical ones that move horizontally before vertically: a vertical run may only turn
+    where the horizontal-first alternative is blocked, and a horizontal run only stops at cells
+    from which a vertical run leads somewhere. The search jumps between those cells, so open areas
+    cost one expansion per turn rather than one per cell, and the paths are still optimal.
+    """
+
+    def __init__(self, grid):
+        self.grid = np.asarray(grid, dtype=bool)
+        self.shape = self.grid.shape
+        # One cell of blocked padding, so the scans need no bounds checks
+        self.blocked = np.pad(self.grid, 1, constant_values=True).tolist()
+        self.expanded = 0
+
+    def __free__(self, r, c):
+        return not self.blocked[r + 1][c + 1]
+
+    def update(self, grid, cells):
+        # The cells flipped between free and blocked
+        self.grid = np.asarray(grid, dtype=bool)
+        for r, c in cells:
+            self.blocked[r + 1][c + 1] = bool(self.grid[r, c])
+
+    def __forced__(self, r, c, dr):
+        # Whether a vertical run arriving at (r, c) in direction dr has to turn here
+        blocked = self.blocked
+        return (not blocked[r + 1][c + 2] and blocked[r + 1 - dr][c + 2]) or \
+            (not blocked[r + 1][c] and blocked[r + 1 - dr][c])
+
+    def __jump_vertical__(self, r, c, dr, goal):
+        while True:
+            r += dr
+            if not self.__free__(r, c):
+                return None
+            if (r, c) == goal or self.__forced__(r, c, dr):
+                return r, c
+
+    def __jump_horizontal__(self, r, c, dc, goal):
+        while True:
+            c += dc
+            if not self.__free__(r, c):
+                return None
+            if (r, c) == goal or self.__jump_vertical__(r, c, 1, goal) is not None \
+                    or self.__jump_vertical__(r, c, -1, goal) is not None:
+                return r, c
+
+    def jump(self, cell, direction, goal):
+        # Next jump point from cell in direction, None if the run ends at an obstacle
+        dr, dc = direction
+        if dr:
+            return self.__jump_vertical__(cell[0], cell[1], dr, goal)
+        return self.__jump_horizontal__(cell[0], cell[1], dc, goal)
+
+    def __directions__(self, cell, direction):
+        if direction is None:
+            return HORIZONTAL + VERTICAL
+        dr, dc = direction
+        if dc:
+            return [direction] + VERTICAL
+        r, c = cell
+        return [direction] + [
+            (0, turn) for turn in (1, -1)
+            if self.__free__(r, c + turn) and not self.__free__(r - dr, c + turn)
+        ]
+
+    def jump_points(self, start, goal):
+        # Jump points of an optimal path from start to goal, None if goal cannot be reached
+        gr, gc = goal
+        cost = {(start, None): 0}
+        prev = {(start, None): None}
+        # Ties on f go to the deepest node, most of a 4-connected grid's paths are equally short
+        pq = [(abs(start[0] - gr) + abs(start[1] - gc), 0, start, None)]
+        while pq:
+            _, g, cell, direction = heappop(pq)
+            g = -g
+            state = (cell, direction)
+            if g > cost[state]:
+                continue
+            self.expanded += 1
+            if cell == goal:
+                points = []
+                while state is not None:
+                    points.append(state[0])
+                    state = prev[state]
+                return points[::-1]
+            for step in self.__directions__(cell, direction):
+                point = self.jump(cell, step, goal)
+                if point is None:
+                    continue
+                child = (point, step)
+                child_cost = g + abs(point[0] - cell[0]) + abs(point[1] - cell[1])
+                if child_cost < cost.get(child, float("inf")):
+                    cost[child] = child_cost
+                    prev[child] = state
+                    heappush(pq, (child_cost + abs(point[0] - gr) + abs(point[1] - gc), -child_cost, point, step))
+        return None
+
+    def path(self, start, goal):
+        start, goal = (int(start[0]), int(start[1])), (int(goal[0]), int(goal[1]))
+        if self.grid[start] or self.grid[goal]:
+            return astar(self.grid, start, goal)
+        points = self.jump_points(start, goal)
+        if points is None:
+            # Goal cannot be reached, fall back to the closest partial path astar finds
+            return astar(self.grid, start, goal)
+        path = [start]
+        for (r0, c0), (r1, c1) in zip(points, points[1:]):
+            dr, dc = np.sign(r1 - r0), np.sign(c1 - c0)
+            for k in range(1, abs(r1 - r0) + abs(c1 - c0) + 1):
+                path.append((int(r0 + k * dr), int(c0 + k * dc)))
+        return path
+
+
+class JPSPlus(JumpPointSearch):
+    """
+    Jump point search with the jumps precomputed once per map (JPS+). For every cell and direction
+    a table holds the distance to the next jump point, or minus the number of free cells before the
+    run hits an obstacle, so a jump is a table lookup plus a check for the goal.
+    """
+
+    def __init__(self, grid):
+        super().__init__(grid)
+        h, w = self.shape
+        self.north = np.zeros((h, w), dtype=np.int32)
+        self.south = np.zeros((h, w), dtype=np.int32)
+        self.east = np.zeros((h, w), dtype=np.int32)
+        self.west = np.zeros((h, w), dtype=np.int32)
+        self.__vertical__(slice(None))
+        self.__horizontal__(slice(None))
+        self.tables = {(-1, 0): self.north, (1, 0): self.south, (0, 1): self.east, (0, -1): self.west}
+
+    def __vertical__(self, cols):
+        free = ~self.grid[:, cols]
+        padded = np.pad(self.grid, 1, constant_values=True)
+        # Cells where a vertical run arriving from below (north) or above (south) has to turn
+        forced_north = (~padded[1:-1, 2:] & padded[2:, 2:]) | (~padded[1:-1, :-2] & padded[2:, :-2])
+        forced_south = (~padded[1:-1, 2:] & padded[:-2, 2:]) | (~padded[1:-1, :-2] & padded[:-2, :-2])
+        forced_north, forced_south = forced_north[:, cols], forced_south[:, cols]
+        h = self.shape[0]
+        for r in range(1, h):
+            self.north[r, cols] = self.__run__(free[r - 1], forced_north[r - 1], self.north[r - 1, cols])
+        for r in range(h - 2, -1, -1):
+            self.south[r, cols] = self.__run__(free[r + 1], forced_south[r + 1], self.south[r + 1, cols])
+        # A horizontal run stops where a vertical run leads to a jump point
+        self.turns = (self.north > 0) | (self.south > 0)
+
+    def __horizontal__(self, rows):
+        free, turns = ~self.grid[rows], self.turns[rows]
+        w = self.shape[1]
+        for c in range(w - 2, -1, -1):
+            self.east[rows, c] = self.__run__(free[:, c + 1], turns[:, c + 1], self.east[rows, c + 1])
+        for c in range(1, w):
+            self.west[rows, c] = self.__run__(free[:, c - 1], turns[:, c - 1], self.west[rows, c - 1])
+
+    def update(self, grid, cells):
+        # Only the columns next to a flipped cell have new vertical jumps, and only the rows of the
+        # flipped cells and of changed vertical jump points have new horizontal ones
+        super().update(grid, cells)
+        if not cells:
+            return
+        w = self.shape[1]
+        cols = np.unique([c + dc for _, c in cells for dc in (-1, 0, 1) if 0 <= c + dc < w])
+        before = self.turns[:, cols]
+        self.__vertical__(cols)
+        rows = np.union1d(np.flatnonzero((self.turns[:, cols] != before).any(axis=1)), [r for r, _ in cells])
+        self.__horizontal__(rows)
+
+    @staticmethod
+    def __run__(free, stop, following):
+        # Table entries for cells whose next cell has the given freedom, stop flag and own entry
+        return np.where(~free, 0, np.where(stop, 1, np.where(following > 0, following + 1, following - 1)))
+
+    def __span__(self, r, c, direction):
+        # Jump distance if positive, free cells up to an obstacle if not
+        return int(self.tables[direction][r, c])
+
+    def jump(self, cell, direction, goal):
+        r, c = cell
+        dr, dc = direction
+        gr, gc = goal
+        entry = self.__span__(r, c, direction)
+        reach = abs(entry)
+        if dr:
+            if gc == c and 0 < (gr - r) * dr <= reach:
+                return goal
+        else:
+            ahead = (gc - c) * dc
+            if gr == r and 0 < ahead <= reach:
+                return goal
+            # The goal's column is a jump point if a vertical run from it reaches the goal
+            if 0 < ahead < reach or (0 < ahead == reach and entry < 0):
+                vertical = (1 if gr > r else -1, 0)
+                if abs(gr - r) <= abs(self.__span__(r, gc, vertical)):
+                    return r, gc
+        if entry > 0:
+            return r + entry * dr, c + entry * dc
+        return None
@@ -0,0 +1,86 @@
+from path_planning.DistanceField import bfs, UNREACHABLE
+from path_planning.Grid import Grid
+import numpy as np
+
+
+def select_landmarks(grid, landmarks, seed=0):
+    # Farthest-point selection: each landmark is the free cell farthest from those already chosen,
+    # cells no landmark reaches yet count as infinitely far so every component gets covered.
+    # Returns the landmarks and their flat distance arrays
+    free = ~grid.ravel()
+    cells = np.flatnonzero(free)
+    if landmarks == 0 or cells.size == 0:
+        return [], []
+    w = grid.shape[1]
+    start = divmod(int(np.random.default_rng(seed).choice(cells)), w)
+    nearest, _, _ = bfs(grid, [start])
+    chosen, distances = [], []
+    for _ in range(landmarks):
+        far = np.where(nearest == UNREACHABLE, np.iinfo(np.int32).max, nearest)
+        far[~free] = -1
+        landmark = divmod(int(np.argmax(far)), w)
+        distance, _, _ = bfs(grid, [landmark])
+        chosen.append(landmark)
+        distances.append(distance)
+        if len(chosen) == 1:
+            nearest = distance.copy()
+        else:
+            nearest = np.where(
+                (nearest == UNREACHABLE) | ((distance != UNREACHABLE) & (distance < nearest)), distance, nearest
+            )
+    return chosen, distances
+
+
+class LandmarkGrid(Grid):
+    """
+    Grid environment with an ALT heuristic. Exact distances from a few landmarks bound the remaining
+    distance through the triangle inequality, |d(L, n) - d(L, goal)| <= d(n, goal), which stays
+    admissible but follows walls that Manhattan distance ignores.
+
+    Distances are stored per cell as uint16, so K landmarks cost 2K bytes per cell; maps whose
+    distances do not fit fall back to uint32. max_bytes caps the table by dropping landmarks.
+    """
+
+    def __init__(self, grid, landmarks=8, max_bytes=None, seed=0):
+        super().__init__(grid)
+        grid = np.asarray(grid, dtype=bool)
+        cells = grid.size
+        if max_bytes is not None:
+            landmarks = min(landmarks, max_bytes // (2 * cells))
+        self.landmarks, distances = select_landmarks(grid, landmarks, seed)
+        longest = max([int(d.max()) for d in distances], default=0)
+        dtype = np.uint16 if longest < np.iinfo(np.uint16).max else np.uint32
+        if max_bytes is not None and dtype == np.uint32:
+            keep = max_bytes // (4 * cells)
+            self.landmarks, distances = self.landmarks[:keep], distances[:keep]
+        self.unknown = np.iinfo(dtype).max
+        # One row per cell, so an estimate reads a single contiguous row
+        self.distances = np.empty((cells, len(self.landmarks)), dtype=dtype)
+        for k, distance in enumerate(distances):
+            self.distances[:, k] = np.where(distance == UNREACHABLE, self.unknown, distance)
+        self.width = grid.shape[1]
+        self.goal = None
+        self.goal_distances = None
+        self.goal_known = None
+
+    @property
+    def nbytes(self):
+        return self.distances.nbytes
+
+    def __row__(self, node):
+        return self.distances[int(node[0]) * self.width + int(node[1])]
+
+    def estimate(self, node1, node2, t):
+        manhattan = super().estimate(node1, node2, t)
+        if node2 != self.goal:
+            # Searches ask for one goal many times in a row
+            self.goal = node2
+            row = self.__row__(node2)
+            self.goal_known = row != self.unknown
+            self.goal_distances = row.astype(np.int64)
+        row = self.__row__(node1)
+        # Landmarks that cannot reach both cells say nothing about their distance
+        known = self.goal_known & (row != self.unknown)
+        if not known.any():
+            return manhattan
+        return max(manhattan, int(np.abs(row[known] - self.goal_distances[known]).max()))
@@ -0,0 +1,150 @@
+from collections import defaultdict
+from heapq import heappush, heappop
+import itertools
+
+
+class ReservationTable:
+    """
+    Shared space-time reservations. A cell reserved at tick t is where its agent will be at the end
+    of tick t; edges record the moves made during tick t so head-on swaps can be refused too.
+    Reservations for waiting in place are soft: another agent may plan through them, which bumps the
+    waiting agent so it replans and steps aside.
+    """
+
+    def __init__(self):
+        self.cells = {}
+        self.edges = {}
+        self.waits = set()
+        self.by_time = defaultdict(list)
+        self.owned = defaultdict(list)
+        self.bumped = set()
+
+    def is_free(self, cell, t, agent=None):
+        owner = self.cells.get((cell, t))
+        return owner is None or owner is agent
+
+    def is_waiting(self, cell, t):
+        return (cell, t) in self.waits
+
+    def can_move(self, cell, next_cell, t, agent=None, push=False):
+        if not self.is_free(next_cell, t, agent) and not (push and self.is_waiting(next_cell, t)):
+            return False
+        # Somebody moving the other way along the same edge in this tick would swap with us
+        owner = self.edges.get((next_cell, cell, t))
+        return owner is None or owner is agent
+
+    def reserve(self, agent, cell, t, last_cell=None):
+        owner = self.cells.get((cell, t))
+        if owner is not None and owner is not agent:
+            self.bumped.add(owner)
+        self.cells[(cell, t)] = agent
+        keys = [(cell, t)]
+        if last_cell is not None and last_cell != cell:
+            self.waits.discard((cell, t))
+            self.edges[(last_cell, cell, t)] = agent
+            keys.append((last_cell, cell, t))
+        else:
+            self.waits.add((cell, t))
+        self.by_time[t].extend(keys)
+        self.owned[agent].extend(keys)
+
+    def reserve_path(self, agent, start, path, start_t, hold=0):
+        # path[k] is the agent's cell at the end of tick start_t + k, the last cell is held for `hold` extra ticks
+        last_cell = start
+        for k, cell in enumerate(path):
+            self.reserve(agent, cell, start_t + k, last_cell)
+            last_cell = cell
+        t = start_t + len(path)
+        for t in range(t, t + hold):
+            if not self.is_free(last_cell, t, agent):
+                break
+            self.reserve(agent, last_cell, t)
+
+    def release(self, agent, from_t=None):
+        self.bumped.discard(agent)
+        keep = []
+        for key in self.owned.pop(agent, []):
+            if from_t is not None and key[-1] < from_t:
+                keep.append(key)
+                continue
+            table = self.cells if len(key) == 2 else self.edges
+            if table.get(key) is agent:
+                del table[key]
+                self.waits.discard(key)
+        if keep:
+            self.owned[agent] = keep
+
+    def purge(self, before_t):
+        # Forget every reservation for ticks that have already been simulated
+        for t in [t for t in self.by_time if t < before_t]:
+            for key in self.by_time.pop(t):
+                table = self.cells if len(key) == 2 else self.edges
+                table.pop(key, None)
+                self.waits.discard(key)
+        for agent in list(self.owned):
+            self.owned[agent] = [key for key in self.owned[agent] if key[-1] >= before_t]
+
+
+def cooperative_astar(graph, start, goal, heuristic, table, agent, start_t, window, can_move=None, push_cost=4,
+                      stats=None):
+    # Windowed cooperative A* against a reservation table. Returns the cells the agent should occupy
+    # at the end of ticks start_t, start_t + 1, ... stopping at the goal or after `window` ticks.
+    # can_move(t) says whether the agent may leave its cell during tick t, otherwise it can only wait.
+    # Entering a cell another agent is waiting in costs push_cost extra steps.
+    # If stats is given, the call and its node expansions are added to its "astar_calls" and "astar_expanded".
+    start = graph.index(start)
+    goal = graph.index(goal)
+    indices, indptr = graph.indices, graph.indptr
+    counter = itertools.count()
+    pq = [(heuristic[start], 0, next(counter), start, 0)]
+    cost = {(start, 0): 0}
+    prev = {(start, 0): None}
+    best = None
+    expanded = 0
+    while pq:
+        _, g, _, curr, k = heappop(pq)
+        if g > cost[(curr, k)]:
+            continue
+        expanded += 1
+        # The goal only ends the search if the agent can stay there for the tick after arriving
+        at_goal = curr == goal and k > 0 and table.is_free(graph.node(curr), start_t + k, agent)
+        if at_goal or k == window:
+            if best is None or heuristic[curr] < heuristic[best[0]]:
+                best = (curr, k)
+            if at_goal:
+                break
+            continue
+        t = start_t + k
+        node = graph.node(curr)
+        if can_move is None or can_move(t):
+            children = indices[indptr[curr]:indptr[curr + 1]]
+        else:
+            children = [curr]
+        for child in children:
+            child_node = graph.node(child)
+            if not table.can_move(node, child_node, t, agent, push=True):
+                continue
+            step = 1
+            if not table.is_free(child_node, t, agent):
+                step += push_cost
+            state = (child, k + 1)
+            if g + step >= cost.get(state, float("inf")):
+                continue
+            cost[state] = g + step
+            prev[state] = (curr, k)
+            heappush(pq, (g + step + heuristic[child], g + step, next(counter), child, k + 1))
+    if stats is not None:
+        stats["astar_calls"] += 1
+        stats["astar_expanded"] += expanded
+    if best is None:
+        # Every state was blocked before the window ended, keep the furthest progress that was found
+        states = [state for state in prev if state[1] > 0]
+        if not states:
+            return []
+        best = min(states, key=lambda state: (-state[1], heuristic[state[0]]))
+    path = []
+    state = best
+    while state[1] > 0:
+        path.append(graph.node(state[0]))
+        state = prev[state]
+    return path[::-1]
@@ -1,5 +1,5 @@
 from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules import CanvasGrid, ChartModule, TextElement
+from mesa.visualization.modules import ChartModule, TextElement
 from mesa.visualization.UserParam import UserSettableParameter
 
 from canvas.SimpleContinuousModule import SimpleCanvas
@@ -11,6 +11,16 @@ SPACE_SIZE = 32
 CANVAS_SIZE = 480
 
 
+OBSTACLE_PORTRAYAL = {
+    "Shape": "rect",
+    "w": 1,
+    "h": 1,
+    "Filled": True,
+    "Color": "#555555",
+    "Layer": 0
+}
+
+
 def draw(thing):
     """
     Portrayal Method for canvas
@@ -64,27 +74,47 @@ def draw(thing):
         }
 
     elif type(thing) is Obstacle:
-        portrayal = {
-            "Shape": "rect",
-            "w": 1,
-            "h": 1,
-            "Filled": True,
-            "Color": "#555555",
-            "Layer": 0
-        }
+        portrayal = dict(OBSTACLE_PORTRAYAL)
 
     return portrayal
 
 
+def portray(thing):
+    """
+    Portrayal Method for SimpleCanvas, sizes are in cells
+    """
+    if type(thing) is Job:
+        priority_color_map = {
+            1: "#FF4E11",
+            2: "#FAB733",
+            3: "#69B34C"
+        }
+        return {"Shape": "triangle", "r": 0.5, "val": thing.value, "Color": priority_color_map[thing.priority]}
+
+    elif type(thing) in [Truck, Car]:
+        return {
+            "Shape": "circle",
+            "r": 0.45,
+            "load": thing.curr_load,
+            "max": thing.max_load,
+            "Color": "#95DDE3" if type(thing) is Truck else "#E3ADB5"
+        }
+
+    elif type(thing) is Warehouse:
+        return {"Shape": "rect", "w": 0.9, "h": 0.9, "Color": "#654321"}
+
+
 # happy_element = HappyElement()
-# canvas_element = SimpleCanvas(draw, CANVAS_SIZE, CANVAS_SIZE)
 chart = ChartModule([{"Label": "Overall Wait Time", "Color": "Black"}])
 avg_wait = ChartModule([
     {"Label": "High", "Color": "Red"},
     {"Label": "Med", "Color": "Yellow"},
     {"Label": "Low", "Color": "Green"},
 ])
-canvas_element = CanvasGrid(draw, SPACE_SIZE, SPACE_SIZE, CANVAS_SIZE, CANVAS_SIZE)
+# Sends obstacles and warehouses once, then only the vehicles and jobs that changed
+canvas_element = SimpleCanvas(
+    portray, SPACE_SIZE, SPACE_SIZE, CANVAS_SIZE, CANVAS_SIZE, obstacle_color=OBSTACLE_PORTRAYAL["Color"]
+)
 
 model_params = {
     "space_size": SPACE_SIZE,
@@ -97,7 +127,7 @@ model_params = {
     "allocation": UserSettableParameter("choice",
                                         "Task Allocation Method",
                                         "HungarianMethod",
-                                        choices=["HungarianMethod", "RandomAllocation"]
+                                        choices=["HungarianMethod", "IncrementalHungarian", "AuctionAllocation", "RandomAllocation"]
                                         ),
     "use_seed": UserSettableParameter("checkbox", "Use Random Seed", True),
     "seed": UserSettableParameter("number", "Random Seed", 42)
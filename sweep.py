@@ -0,0 +1,248 @@
+"""
+Headless parameter sweeps for DeliveryModel.
+
+Every combination of the given parameters is run once per seed across a process pool. Results are
+appended to a CSV file as runs finish, so an interrupted sweep picks up where it stopped when it is
+started again with the same output file. The visualization stack is never imported.
+
+Each run's wait time histograms are kept in a .sketches.jsonl file next to the CSV. --percentiles
+merges them across seeds into wait time percentiles per priority for every parameter combination.
+
+Example:
+    python sweep.py --agents 5 10 20 --jobs 50 --allocation HungarianMethod RandomAllocation \
+        --seeds 0 1 2 3 --output results/sweep.csv --export npz --percentiles
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+PARAMETERS = ["agents", "jobs", "warehouses", "split", "allocation", "seed", "obstacle_map", "space_size"]
+RESULTS = ["run_id", "steps", "finished", "tasks_left", "completed", "score", "high", "med", "low", "wall_time"]
+COLUMNS = PARAMETERS + RESULTS
+
+DEFAULTS = {
+    "agents": [5],
+    "jobs": [20],
+    "warehouses": [2],
+    "split": [0.4],
+    "allocation": ["HungarianMethod"],
+    "seed": [42],
+    "obstacle_map": ["maps/random-32-32-20.map"],
+    "space_size": [32],
+}
+
+
+def expand_grid(grid):
+    # Cartesian product of the parameter grid, one dict per run, in a stable order
+    grid = {**DEFAULTS, **{k: v for k, v in grid.items() if v is not None}}
+    keys = PARAMETERS
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def run_id(params):
+    encoded = json.dumps(params, sort_keys=True).encode()
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def run_model(params, max_steps):
+    # Imported here so the parent process only pays for it once the pool is running
+    from model import DeliveryModel
+
+    start = time.perf_counter()
+    # DeliveryModel prints its score when it finishes, keep worker output quiet
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = DeliveryModel(
+            space_size=params["space_size"],
+            jobs=params["jobs"],
+            agents=params["agents"],
+            warehouses=params["warehouses"],
+            split=params["split"],
+            use_seed=True,
+            seed=params["seed"],
+            obstacle_map=params["obstacle_map"],
+            allocation=params["allocation"],
+            # Only the final score is kept, so no metrics are collected along the way
+            metrics=None,
+        )
+        steps = 0
+        while model.running and steps < max_steps:
+            model.step()
+            steps += 1
+
+    wait_times = model.score.get_avg_wait_time()
+    return {
+        **params,
+        "run_id": run_id(params),
+        "steps": steps,
+        "finished": int(not model.running),
+        "tasks_left": model.tasks_left,
+        "completed": model.score.tasks_completed,
+        "score": model.score.get_score(),
+        "high": wait_times.get(1, ""),
+        "med": wait_times.get(2, ""),
+        "low": wait_times.get(3, ""),
+        "wall_time": time.perf_counter() - start,
+        "sketch": model.score.to_dict(),
+    }
+
+
+def sketch_path(output):
+    return os.path.splitext(output)[0] + ".sketches.jsonl"
+
+
+def read_rows(output):
+    # CSV rows of finished runs. A row cut off by an interruption is missing fields, or has extra
+    # ones when the next row was appended to it, and is dropped so that run goes again
+    with open(output, newline="") as f:
+        return [row for row in csv.DictReader(f) if None not in row and None not in row.values()]
+
+
+def fresh_line(path, f):
+    # Start on a fresh line after a line cut off by an interruption
+    if f.tell() > 0:
+        with open(path, "rb") as tail:
+            tail.seek(-1, os.SEEK_END)
+            if tail.read(1) != b"\n":
+                f.write("\n")
+
+
+def completed_runs(output):
+    if not os.path.exists(output):
+        return set()
+    return {row["run_id"] for row in read_rows(output)}
+
+
+def run_sweep(grid, output, processes=None, max_steps=10000):
+    runs = expand_grid(grid)
+    done = completed_runs(output)
+    pending = [params for params in runs if run_id(params) not in done]
+    print(f"{len(runs)} runs, {len(runs) - len(pending)} already in {output}, {len(pending)} to go")
+    if not pending:
+        return
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    write_header = not os.path.exists(output) or os.path.getsize(output) == 0
+    with open(output, "a", newline="") as f, open(sketch_path(output), "a") as sketches, \
+            ProcessPoolExecutor(max_workers=processes) as pool:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if write_header:
+            writer.writeheader()
+        fresh_line(output, f)
+        fresh_line(sketch_path(output), sketches)
+        futures = [pool.submit(run_model, params, max_steps) for params in pending]
+        for n, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            # The sketch goes first, a run only counts as done once its CSV row is written
+            sketches.write(json.dumps({"run_id": row["run_id"], "score": row.pop("sketch")}) + "\n")
+            sketches.flush()
+            writer.writerow(row)
+            # Flush every row so an interrupted sweep keeps everything that finished
+            f.flush()
+            print(f"\r{n}/{len(pending)} runs", end="", flush=True)
+    print()
+
+
+def read_columns(output):
+    rows = read_rows(output)
+    columns = {}
+    for name in COLUMNS:
+        values = [row[name] for row in rows]
+        try:
+            columns[name] = np.array([float(v) if v != "" else np.nan for v in values])
+        except ValueError:
+            columns[name] = np.array(values)
+    return columns
+
+
+def export(output, fmt):
+    # Convert the streamed CSV into a columnar NPZ or Parquet file next to it
+    columns = read_columns(output)
+    base = os.path.splitext(output)[0]
+    if fmt == "npz":
+        np.savez_compressed(base + ".npz", **columns)
+    elif fmt == "parquet":
+        import pandas as pd
+        pd.DataFrame(columns).to_parquet(base + ".parquet")
+    else:
+        raise ValueError(f"Unknown export format {fmt}")
+
+
+def merged_percentiles(output, percentiles=(50, 95, 99)):
+    # Wait time percentiles per priority for every parameter combination, merged over its seeds
+    from metrics.metrics import PrioritisedTaskTime
+
+    params = {row["run_id"]: row for row in read_rows(output)}
+    keys = [key for key in PARAMETERS if key != "seed"]
+    groups = {}
+    if not os.path.exists(sketch_path(output)):
+        return groups
+    # A run interrupted between its sketch and its CSV row is run again on resume, so only the last
+    # sketch of every run counts. A line cut off by the interruption is skipped
+    sketches = {}
+    with open(sketch_path(output)) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["run_id"] in params:
+                sketches[record["run_id"]] = record["score"]
+    for run, sketch in sketches.items():
+        group = tuple(params[run][key] for key in keys)
+        score = PrioritisedTaskTime.from_dict(sketch)
+        if group in groups:
+            groups[group].merge(score)
+        else:
+            groups[group] = score
+    return {
+        group: score.get_wait_percentiles(percentiles)
+        for group, score in groups.items()
+    }
+
+
+def print_percentiles(output):
+    keys = [key for key in PARAMETERS if key != "seed"]
+    for group, priorities in merged_percentiles(output).items():
+        print(", ".join(f"{key}={value}" for key, value in zip(keys, group)))
+        for priority, summary in priorities.items():
+            print(f"  priority {priority}: " + " ".join(f"{name}={value}" for name, value in summary.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, nargs="+")
+    parser.add_argument("--jobs", type=int, nargs="+")
+    parser.add_argument("--warehouses", type=int, nargs="+")
+    parser.add_argument("--split", type=float, nargs="+")
+    parser.add_argument("--allocation", nargs="+")
+    parser.add_argument("--seeds", type=int, nargs="+", dest="seed")
+    parser.add_argument("--obstacle-map", nargs="+", dest="obstacle_map")
+    parser.add_argument("--space-size", type=int, nargs="+", dest="space_size")
+    parser.add_argument("--output", default="results/sweep.csv")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--max-steps", type=int, default=10000)
+    parser.add_argument("--export", choices=["npz", "parquet"])
+    parser.add_argument("--percentiles", action="store_true", help="print wait time percentiles merged over seeds")
+    args = parser.parse_args()
+
+    grid = {name: getattr(args, name) for name in PARAMETERS}
+    run_sweep(grid, args.output, args.processes, args.max_steps)
+    if args.export:
+        export(args.output, args.export)
+    if args.percentiles:
+        print_percentiles(args.output)
+
+
+if __name__ == "__main__":
+    main()
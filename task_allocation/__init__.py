@@ -1,2 +1,4 @@
 from task_allocation.random_allocation import RandomAllocation
 from task_allocation.hungarian_method import HungarianMethod
+from task_allocation.incremental_hungarian import IncrementalHungarian
+from task_allocation.auction import AuctionAllocation
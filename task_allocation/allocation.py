@@ -1,4 +1,7 @@
 class Allocation:
+    # Incremental allocators are kept between allocations and updated through reallocate(agents, jobs)
+    incremental = False
+
     def __init__(self):
         pass
 
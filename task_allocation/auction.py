@@ -0,0 +1,156 @@
+from collections import deque
+
+from agents import Truck
+from task_allocation.allocation import Allocation
+from task_allocation.hungarian_method import PRIORITY_SCALE, generate_matrix, job_slots
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial import cKDTree
+
+
+def candidate_costs(agents, slots, candidates, distance_fields=None):
+    # Same weighting as generate_matrix, evaluated only on the sparse (agent, candidate slot) pairs
+    positions = np.array(
+        [agent.pos if not agent.is_resupplying else agent.target.pos for agent in agents],
+        dtype=np.int64
+    ).reshape(-1, 2)
+    loads = np.array([agent.curr_load for agent in agents]).reshape(-1, 1)
+    trucks = np.array([type(agent) is Truck for agent in agents], dtype=bool).reshape(-1, 1)
+    slot_positions = np.array([job.pos for job in slots], dtype=np.int64).reshape(-1, 2)
+    values = np.array([job.value for job in slots])
+    priority_scale = np.array([PRIORITY_SCALE[job.priority] for job in slots], dtype=float)
+
+    if distance_fields is None:
+        dist = np.abs(positions[:, None, :] - slot_positions[candidates]).sum(axis=2)
+    else:
+        dist = np.empty(candidates.shape, dtype=np.int64)
+        unreachable = distance_fields.grid.size
+        for pos in set(map(tuple, slot_positions)):
+            mask = (slot_positions[candidates] == pos).all(axis=2)
+            rows = np.nonzero(mask)[0]
+            column = distance_fields.get(pos).distance[positions[rows, 0], positions[rows, 1]]
+            dist[mask] = np.where(column < 0, unreachable, column)
+    dist = np.where(trucks, dist * 2, dist)
+    finish_job = np.where(loads >= values[candidates], 0.8, 1.0)
+
+    return dist * finish_job * priority_scale[candidates]
+
+
+def nearest_slots(agents, slots, k):
+    # The k nearest slots of every priority level, since priority scales cost more than distance does
+    positions = np.array(
+        [agent.pos if not agent.is_resupplying else agent.target.pos for agent in agents]
+    ).reshape(-1, 2)
+    slot_positions = np.array([job.pos for job in slots]).reshape(-1, 2)
+    priorities = np.array([job.priority for job in slots])
+    candidates = []
+    for priority in np.unique(priorities):
+        indices = np.nonzero(priorities == priority)[0]
+        kp = min(k, len(indices))
+        _, nearest = cKDTree(slot_positions[indices]).query(positions, k=kp, p=1)
+        candidates.append(indices[np.asarray(nearest).reshape(len(agents), kp)])
+    return np.concatenate(candidates, axis=1)
+
+
+def auction(candidates, costs, n_objects, epsilon, scaling=4.0, max_bids=None):
+    # Forward auction with epsilon scaling on a sparse bipartite graph, minimising total cost.
+    # Returns the object won by each bidder, -1 for bidders left over when max_bids ran out.
+    n_bidders = len(candidates)
+    candidates = candidates.tolist()
+    values = (-costs).tolist()
+    spread = float(costs.max() - costs.min()) + 1.0 if costs.size else 1.0
+    if max_bids is None:
+        max_bids = 20 * n_bidders
+    prices = [0.0] * n_objects
+    assigned = [-1] * n_bidders
+
+    eps = max(spread / scaling, epsilon)
+    while True:
+        owner = [-1] * n_objects
+        assigned = [-1] * n_bidders
+        queue = deque(range(n_bidders))
+        bids = 0
+        while queue and bids < max_bids:
+            i = queue.popleft()
+            best_j, best, second = -1, -np.inf, -np.inf
+            for j, a in zip(candidates[i], values[i]):
+                value = a - prices[j]
+                if value > best:
+                    best_j, best, second = j, value, best
+                elif value > second:
+                    second = value
+            if second == -np.inf:
+                second = best - spread
+            prices[best_j] += best - second + eps
+            previous = owner[best_j]
+            owner[best_j] = i
+            assigned[i] = best_j
+            if previous != -1:
+                assigned[previous] = -1
+                queue.append(previous)
+            bids += 1
+        if eps <= epsilon or queue:
+            return assigned
+        eps = max(eps / scaling, epsilon)
+
+
+class AuctionAllocation(Allocation):
+    """
+    Approximate allocation for large fleets: every agent only bids on its k nearest job slots of each
+    priority, found through KD-trees, and an epsilon-scaling auction settles the sparse assignment.
+    Smaller epsilon and larger k trade speed for a smaller optimality gap.
+    """
+
+    def __init__(self, randomizer, agents, jobs, k=10, epsilon=0.01, distance_fields=None):
+        super().__init__()
+        self.agents = agents
+        self.job_list = job_slots(agents, jobs)
+        self.allocation = {}
+        if len(self.job_list) == 0:
+            return
+
+        candidates = nearest_slots(agents, self.job_list, k)
+        costs = candidate_costs(agents, self.job_list, candidates, distance_fields)
+
+        assigned = auction(candidates, costs, len(self.job_list), epsilon)
+        self.allocation = self.__complete__(assigned, distance_fields)
+
+    def __complete__(self, assigned, distance_fields):
+        # Agents the sparse auction could not place are matched densely against the slots left over
+        assignment = {self.agents[i]: self.job_list[j] for i, j in enumerate(assigned) if j != -1}
+        left = [i for i, j in enumerate(assigned) if j == -1]
+        if left:
+            taken = set(assigned)
+            free = [j for j in range(len(self.job_list)) if j not in taken]
+            matrix = generate_matrix(
+                [self.agents[i] for i in left],
+                [self.job_list[j] for j in free],
+                distance_fields
+            )
+            for r, c in zip(*linear_sum_assignment(matrix)):
+                assignment[self.agents[left[r]]] = self.job_list[free[c]]
+        return assignment
+
+    def get_allocation(self):
+        return self.allocation
+
+
+def allocation_cost(allocation, distance_fields=None):
+    # Total cost of an allocation under the generate_matrix weighting
+    agents = list(allocation)
+    if not agents:
+        return 0.0
+    matrix = generate_matrix(agents, [allocation[agent] for agent in agents], distance_fields)
+    return float(np.trace(matrix))
+
+
+def optimality_gap(randomizer, agents, jobs, **kwargs):
+    # Relative extra cost of AuctionAllocation over the exact dense solution of the same job slots.
+    # This is the problem HungarianMethod solves, without its approximate clone columns when jobs < agents.
+    distance_fields = kwargs.get("distance_fields")
+    approximate = allocation_cost(
+        AuctionAllocation(randomizer, agents, jobs, **kwargs).get_allocation(), distance_fields
+    )
+    matrix = generate_matrix(agents, job_slots(agents, jobs), distance_fields)
+    optimal = matrix[linear_sum_assignment(matrix)].sum()
+    return (approximate - optimal) / optimal if optimal > 0 else 0.0
@@ -1,52 +1,63 @@
-from copy import copy
-
 from agents import Truck
+from job_pool import priority_order
 from task_allocation.allocation import Allocation
 import numpy as np
 from scipy.optimize import linear_sum_assignment
 
 
-def generate_matrix(agents, jobs):
-    cost_matrix = np.zeros((len(agents), len(jobs)))
+PRIORITY_SCALE = {
+    1: 0.4,
+    2: 1,
+    3: 3
+}
+
+
+def path_distances(distance_fields, positions, job_positions):
+    # True obstacle-aware distances, read column by column from each job's cached distance field
+    dist = np.empty((len(positions), len(job_positions)), dtype=np.int64)
+    unreachable = distance_fields.grid.size
+    for j, pos in enumerate(map(tuple, job_positions)):
+        column = distance_fields.get(pos).distance[positions[:, 0], positions[:, 1]]
+        dist[:, j] = np.where(column < 0, unreachable, column)
+    return dist
 
-    priority_scale = {
-        1: 0.4,
-        2: 1,
-        3: 3
-    }
 
-    for i, agent in enumerate(agents):
-        for j, job in enumerate(jobs):
-            current_pos = agent.pos if not agent.is_resupplying else agent.target.pos
-            dist = np.sum(np.abs(np.array(current_pos) - np.array(job.pos)))
-            if type(agent) is Truck:
-                dist *= 2
-            finish_job = 0.8 if agent.curr_load >= job.value else 1
-            cost_matrix[i, j] = dist * finish_job * priority_scale[job.priority]
+def generate_matrix(agents, jobs, distance_fields=None):
+    # Agents heading to a warehouse are costed from the warehouse they will restock at
+    positions = np.array(
+        [agent.pos if not agent.is_resupplying else agent.target.pos for agent in agents],
+        dtype=np.int64
+    ).reshape(-1, 2)
+    loads = np.array([agent.curr_load for agent in agents]).reshape(-1, 1)
+    trucks = np.array([type(agent) is Truck for agent in agents], dtype=bool).reshape(-1, 1)
+    job_positions = np.array([job.pos for job in jobs], dtype=np.int64).reshape(-1, 2)
+    values = np.array([job.value for job in jobs]).reshape(1, -1)
+    priority_scale = np.array([PRIORITY_SCALE[job.priority] for job in jobs], dtype=float).reshape(1, -1)
 
-    return cost_matrix
+    if distance_fields is None:
+        dist = np.abs(positions[:, None, :] - job_positions[None, :, :]).sum(axis=2)
+    else:
+        dist = path_distances(distance_fields, positions, job_positions)
+    dist = np.where(trucks, dist * 2, dist)
+    finish_job = np.where(loads >= values, 0.8, 1.0)
+
+    return dist * finish_job * priority_scale
 
 
 class HungarianMethod(Allocation):
-    def __init__(self, randomizer, agents, jobs):
+    def __init__(self, randomizer, agents, jobs, distance_fields=None):
         super().__init__()
-        # self.job_list = copy(jobs)
-        self.job_list = sorted(
-            jobs,
-            key=lambda j: (j.priority, -j.value)
-        )[:len(agents)]
+        self.job_list = priority_order(jobs, len(agents))
         self.agents = agents
-        cost_matrix = generate_matrix(self.agents, self.job_list)
+        cost_matrix = generate_matrix(self.agents, self.job_list, distance_fields)
 
         if len(agents) != len(self.job_list):
             # Assume jobs <= agents
             # Clone highest priority job to fill matrix
             # If multiple jobs of same priority choose highest value
             num_clones = len(agents) - len(jobs)
-            job_order = sorted(
-                enumerate(jobs),
-                key=lambda j: (j[1].priority, -j[1].value)
-            )
+            position = {job: i for i, job in enumerate(jobs)}
+            job_order = [(position[job], job) for job in priority_order(jobs)]
             indices = [i[0] for i in job_order[:num_clones]]
             new_cols = cost_matrix[:, indices]
             while num_clones > 0:
@@ -63,3 +74,11 @@ class HungarianMethod(Allocation):
 
     def get_allocation(self):
         return self.allocation
+
+
+def job_slots(agents, jobs):
+    # One job per agent in (priority, -value) order, cycling through the open jobs when there are fewer jobs than agents
+    order = priority_order(jobs, len(agents))
+    if len(order) == 0:
+        return []
+    return [order[i % len(order)] for i in range(len(agents))]
@@ -0,0 +1,205 @@
+from collections import Counter
+
+from task_allocation.allocation import Allocation
+from task_allocation.hungarian_method import generate_matrix, job_slots
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# Above this fraction of changed rows and columns a full solve beats repairing them one by one
+REPAIR_FRACTION = 0.05
+
+
+class IncrementalAssignment:
+    """
+    Square min-cost assignment that keeps its dual variables so single rows or columns can be
+    replaced and re-solved with one shortest augmenting path (O(n^2)) instead of a full O(n^3) solve.
+    """
+
+    def __init__(self, cost_matrix):
+        self.reset(cost_matrix)
+
+    def reset(self, cost_matrix):
+        # Full solve, with the dual variables recovered from the optimal assignment
+        self.cost = np.array(cost_matrix, dtype=float)
+        n = self.cost.shape[0]
+        rows, cols = linear_sum_assignment(self.cost)
+        self.row_to_col = np.empty(n, dtype=np.int64)
+        self.col_to_row = np.empty(n, dtype=np.int64)
+        self.row_to_col[rows] = cols
+        self.col_to_row[cols] = rows
+        # Only repairs need the dual variables, and a moving fleet may be solved in full again first
+        self.u = self.v = None
+
+    def __duals__(self):
+        if self.v is not None:
+            return
+        self.v = self.__potentials__()
+        self.u = self.cost[np.arange(len(self.v)), self.row_to_col] - self.v[self.row_to_col]
+
+    def __potentials__(self):
+        # Column potentials as shortest paths over the alternating edges, going from column k
+        # through its row to column j costs cost[row, j] - cost[row, k]. An optimal assignment has
+        # no negative cycle, so Bellman-Ford settles within n rounds, usually a handful
+        n = self.cost.shape[0]
+        matched = self.cost[np.arange(n), self.row_to_col]
+        weights = self.cost[self.col_to_row] - matched[self.col_to_row][:, None]
+        v = np.zeros(n)
+        for _ in range(n):
+            relaxed = np.minimum(v, (v[:, None] + weights).min(axis=0))
+            if np.array_equal(relaxed, v):
+                break
+            v = relaxed
+        return v
+
+    def update_row(self, row, costs):
+        self.__duals__()
+        col = self.row_to_col[row]
+        self.row_to_col[row] = -1
+        self.col_to_row[col] = -1
+        self.cost[row] = costs
+        # Lower the row potential just enough to keep every reduced cost non-negative
+        self.u[row] = np.min(self.cost[row] - self.v)
+        self.__augment__(row)
+
+    def update_col(self, col, costs):
+        self.__duals__()
+        row = self.col_to_row[col]
+        self.row_to_col[row] = -1
+        self.col_to_row[col] = -1
+        self.cost[:, col] = costs
+        self.v[col] = np.min(self.cost[:, col] - self.u)
+        self.__augment__(row)
+
+    def total_cost(self):
+        return self.cost[np.arange(len(self.row_to_col)), self.row_to_col].sum()
+
+    def __augment__(self, start):
+        # Dijkstra over reduced costs from a free row to the nearest free column. Each round scans
+        # one row with array operations, open_cols holds the tentative distances of unvisited columns
+        n = self.cost.shape[0]
+        cost, u, v, col_to_row = self.cost, self.u, self.v, self.col_to_row
+        shortest = np.full(n, np.inf)
+        open_cols = np.full(n, np.inf)
+        path = np.full(n, -1, dtype=np.int64)
+        visited_cols = np.zeros(n, dtype=bool)
+        visited_rows = [start]
+        min_val = 0.0
+        row = start
+        while True:
+            reduced = cost[row] - v
+            reduced += min_val - u[row]
+            better = reduced < open_cols
+            better &= ~visited_cols
+            path[better] = row
+            open_cols[better] = reduced[better]
+            col = int(open_cols.argmin())
+            min_val = open_cols[col]
+            shortest[col] = min_val
+            open_cols[col] = np.inf
+            visited_cols[col] = True
+            if col_to_row[col] == -1:
+                sink = col
+                break
+            row = int(col_to_row[col])
+            visited_rows.append(row)
+
+        self.u[start] += min_val
+        others = np.array(visited_rows[1:], dtype=np.int64)
+        self.u[others] += min_val - shortest[self.row_to_col[others]]
+        self.v[visited_cols] -= min_val - shortest[visited_cols]
+
+        col = sink
+        while True:
+            row = path[col]
+            self.col_to_row[col] = row
+            col, self.row_to_col[row] = self.row_to_col[row], col
+            if row == start:
+                break
+
+
+class IncrementalHungarian(Allocation):
+    incremental = True
+
+    def __init__(self, randomizer, agents, jobs, distance_fields=None):
+        super().__init__()
+        self.distance_fields = distance_fields
+        self.__solve__(agents, jobs)
+
+    def __solve__(self, agents, jobs):
+        self.agents = list(agents)
+        self.slots = job_slots(self.agents, jobs)
+        self.row_keys = [self.__row_key__(agent) for agent in self.agents]
+        self.slot_values = [job.value for job in self.slots]
+        self.grid = None if self.distance_fields is None else self.distance_fields.grid
+        self.solver = None
+        if len(self.slots) > 0:
+            self.solver = IncrementalAssignment(generate_matrix(self.agents, self.slots, self.distance_fields))
+        self.allocation = self.__calculate_allocation__()
+
+    def reallocate(self, agents, jobs):
+        # Path distances all change with the map, so a new obstacle matrix needs a full solve
+        map_changed = self.distance_fields is not None and self.distance_fields.grid is not self.grid
+        if self.solver is None or map_changed or list(agents) != self.agents:
+            self.__solve__(agents, jobs)
+            return self.allocation
+
+        slots = job_slots(self.agents, jobs)
+        if len(slots) == 0:
+            self.__solve__(agents, jobs)
+            return self.allocation
+
+        # Keep every column whose job is still wanted, refill the rest with the newly wanted jobs
+        wanted = Counter(slots)
+        changed_cols = []
+        freed = []
+        for col, job in enumerate(self.slots):
+            if wanted[job] > 0:
+                wanted[job] -= 1
+                if job.value != self.slot_values[col]:
+                    changed_cols.append(col)
+            else:
+                freed.append(col)
+        fill = []
+        for job in slots:
+            if wanted[job] > 0:
+                wanted[job] -= 1
+                fill.append(job)
+        for col, job in zip(freed, fill):
+            self.slots[col] = job
+        changed_cols += freed
+
+        # Every agent whose costing inputs changed is re-costed, a busy agent's row still constrains
+        # which jobs the free agents get
+        changed_rows = [i for i, agent in enumerate(self.agents) if self.__row_key__(agent) != self.row_keys[i]]
+
+        # Moving fleets change most rows every tick, one full solve is then cheaper than the repairs
+        if len(changed_rows) + len(changed_cols) > max(2, REPAIR_FRACTION * len(self.agents)):
+            self.__solve__(agents, jobs)
+            return self.allocation
+
+        if changed_cols:
+            cols = generate_matrix(self.agents, [self.slots[col] for col in changed_cols], self.distance_fields)
+            for k, col in enumerate(changed_cols):
+                self.slot_values[col] = self.slots[col].value
+                self.solver.update_col(col, cols[:, k])
+        if changed_rows:
+            rows = generate_matrix([self.agents[i] for i in changed_rows], self.slots, self.distance_fields)
+            for k, row in enumerate(changed_rows):
+                self.row_keys[row] = self.__row_key__(self.agents[row])
+                self.solver.update_row(row, rows[k])
+
+        self.allocation = self.__calculate_allocation__()
+        return self.allocation
+
+    @staticmethod
+    def __row_key__(agent):
+        current_pos = agent.pos if not agent.is_resupplying else agent.target.pos
+        return tuple(current_pos), agent.curr_load, agent.is_resupplying
+
+    def __calculate_allocation__(self):
+        if self.solver is None:
+            return {}
+        return {agent: self.slots[j] for agent, j in zip(self.agents, self.solver.row_to_col)}
+
+    def get_allocation(self):
+        return self.allocation
@@ -2,8 +2,10 @@ from task_allocation.allocation import Allocation
 
 
 class RandomAllocation(Allocation):
-    def __init__(self, randomizer, agents, jobs):
+    def __init__(self, randomizer, agents, jobs, **kwargs):
         super().__init__()
+        # Sampling needs a sequence, the model passes its job pool
+        jobs = list(jobs)
         if len(agents) == len(jobs):
             matching = randomizer.sample(jobs, k=len(agents))
         else:
@@ -0,0 +1,131 @@
+import random
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from agents import Car, Truck
+from model import DeliveryModel, Job, Warehouse
+from task_allocation.hungarian_method import generate_matrix
+from task_allocation.incremental_hungarian import IncrementalAssignment, IncrementalHungarian
+
+
+def optimal_cost(cost):
+    rows, cols = linear_sum_assignment(cost)
+    return cost[rows, cols].sum()
+
+
+def assigned_cost(allocator):
+    # Cost of the incremental assignment on a freshly built matrix, so stale rows or columns show up
+    cost = generate_matrix(allocator.agents, allocator.slots, allocator.distance_fields)
+    return cost[np.arange(len(allocator.agents)), allocator.solver.row_to_col].sum(), optimal_cost(cost)
+
+
+def test_assignment_matches_full_solve_after_updates():
+    rng = np.random.default_rng(0)
+    for n in [1, 2, 5, 12]:
+        cost = rng.integers(0, 50, size=(n, n)).astype(float)
+        solver = IncrementalAssignment(cost)
+        assert np.isclose(solver.total_cost(), optimal_cost(cost))
+        for _ in range(200):
+            index = int(rng.integers(n))
+            if rng.random() < 0.5:
+                cost[index] = rng.integers(0, 50, size=n)
+                solver.update_row(index, cost[index])
+            else:
+                cost[:, index] = rng.integers(0, 50, size=n)
+                solver.update_col(index, cost[:, index])
+            assert sorted(solver.row_to_col.tolist()) == list(range(n))
+            assert np.isclose(solver.total_cost(), optimal_cost(cost))
+
+
+class StubModel:
+    def __init__(self):
+        self.next_id = 0
+
+    def new_agent(self, kind, pos):
+        self.next_id += 1
+        return kind(self.next_id, pos, self)
+
+
+def test_allocator_matches_full_solve_over_events():
+    rnd = random.Random(1)
+    model = StubModel()
+    warehouse = Warehouse((0, 0))
+    agents = [model.new_agent(rnd.choice([Car, Truck]), (rnd.randrange(32), rnd.randrange(32))) for _ in range(6)]
+    for agent in agents:
+        agent.curr_load = rnd.randint(0, agent.max_load)
+
+    def new_job():
+        return Job((rnd.randrange(32), rnd.randrange(32)), rnd.randint(1, 9), rnd.randint(1, 3), model)
+
+    jobs = [new_job() for _ in range(4)]
+    allocator = IncrementalHungarian(rnd, agents, jobs)
+    for _ in range(300):
+        event = rnd.choice(["add", "assign", "complete", "resupply", "restocked", "move", "work"])
+        agent = rnd.choice(agents)
+        if event == "add" or len(jobs) < 2:
+            jobs.append(new_job())
+        elif event == "assign" and agent.target is None:
+            agent.target = allocator.get_allocation()[agent]
+        elif event == "complete":
+            job = rnd.choice(jobs)
+            jobs.remove(job)
+            for other in agents:
+                if other.target is job:
+                    other.target = None
+        elif event == "resupply" and agent.target is None:
+            agent.target, agent.is_resupplying = warehouse, True
+        elif event == "restocked" and agent.is_resupplying:
+            agent.pos, agent.curr_load = warehouse.pos, agent.max_load
+            agent.target, agent.is_resupplying = None, False
+        elif event == "move" and not agent.is_resupplying:
+            # Busy agents move as well, their rows still shape the assignment of the free ones
+            agent.pos = (agent.pos[0] + rnd.choice([-1, 1])) % 32, agent.pos[1]
+        elif event == "work":
+            job = rnd.choice(jobs)
+            job.value = max(1, job.value - 1)
+            agent.curr_load = max(0, agent.curr_load - 1)
+        allocator.reallocate(agents, jobs)
+        incremental, optimal = assigned_cost(allocator)
+        assert np.isclose(incremental, optimal)
+
+
+def test_model_reallocations_match_full_solve(monkeypatch):
+    costs = []
+    reallocate = IncrementalHungarian.reallocate
+
+    def checked(self, agents, jobs):
+        allocation = reallocate(self, agents, jobs)
+        if self.solver is not None:
+            costs.append(assigned_cost(self))
+        return allocation
+
+    monkeypatch.setattr(IncrementalHungarian, "reallocate", checked)
+    for seed in range(3):
+        model = DeliveryModel(agents=8, jobs=60, allocation="IncrementalHungarian", seed=seed)
+        for _ in range(150):
+            model.step()
+    assert costs
+    for incremental, optimal in costs:
+        assert np.isclose(incremental, optimal)
+
+
+def test_allocator_matches_full_solve_under_movement():
+    # Anywhere from one agent to the whole fleet moves between reallocations, covering both the
+    # row repairs and the full solve taken when most rows changed
+    rnd = random.Random(2)
+    model = StubModel()
+    agents = [model.new_agent(rnd.choice([Car, Truck]), (rnd.randrange(64), rnd.randrange(64))) for _ in range(40)]
+    for agent in agents:
+        agent.curr_load = agent.max_load
+    jobs = [Job((rnd.randrange(64), rnd.randrange(64)), rnd.randint(1, 9), rnd.randint(1, 3), model)
+            for _ in range(25)]
+    allocator = IncrementalHungarian(rnd, agents, jobs)
+    for _ in range(100):
+        for agent in rnd.sample(agents, rnd.choice([1, 2, 5, 40])):
+            r, c = agent.pos
+            agent.pos = min(63, max(0, r + rnd.choice([-1, 0, 1]))), min(63, max(0, c + rnd.choice([-1, 0, 1])))
+        allocator.reallocate(agents, jobs)
+        incremental, optimal = assigned_cost(allocator)
+        assert np.isclose(incremental, optimal)
+
@@ -0,0 +1,36 @@
+import random
+
+import numpy as np
+import pytest
+
+from model import DeliveryModel
+
+
+def free_cells(model, k, rnd):
+    taken = {tuple(w.pos) for w in model.warehouses} | {tuple(job.pos) for job in model.available_tasks}
+    cells = [(int(r), int(c)) for r, c in zip(*np.where(~model.obstacle_matrix))]
+    return rnd.sample([cell for cell in cells if cell not in taken], k)
+
+
+def close(model, cells):
+    try:
+        return model.set_obstacles(cells)
+    except ValueError:
+        # A warehouse, job or target cell among them
+        return []
+
+
+@pytest.mark.parametrize("planner", ["field", "jps", "dstar"])
+def test_fleet_engine_closures_before_start_and_after_deliveries(planner):
+    rnd = random.Random(1)
+    model = DeliveryModel(agents=8, jobs=60, seed=1, fleet_engine=True, collision=False, planner=planner)
+    assert close(model, free_cells(model, 5, rnd))
+    deliveries = 0
+    for _ in range(300):
+        left = model.tasks_left
+        model.step()
+        if model.tasks_left < left:
+            # Vehicles assigned to the completed job still hold it until the next step
+            deliveries += 1
+            close(model, free_cells(model, 5, rnd))
+    assert deliveries > 0